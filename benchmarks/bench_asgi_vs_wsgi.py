@@ -0,0 +1,202 @@
+"""
+Throughput of GET /api/customers/ served by gunicorn sync workers (WSGI) and by uvicorn (ASGI, async list views)
+with the same number of worker processes.
+
+Every scenario runs `--concurrency` clients issuing requests back to back for `--duration` seconds,
+optionally next to `--slow-clients` connections that trickle their headers (slow mobile clients, slowloris).
+Sync workers are held by each slow connection until it finishes, async workers keep serving other requests.
+
+    python -m benchmarks.bench_asgi_vs_wsgi --workers 2 --concurrency 32 --slow-clients 16 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import setup_django, benchmark_database, get_access_token, summarize, print_table
+
+
+HOST = "127.0.0.1"
+DOMAIN = "tenant1.localhost"
+PATH = "/api/customers/"
+
+SERVER_COMMANDS = {
+    "wsgi": lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "main.wsgi:application",
+        "--bind", f"{HOST}:{port}", "--workers", str(workers),
+    ],
+    "asgi": lambda port, workers: [
+        sys.executable, "-m", "uvicorn", "main.asgi:application",
+        "--host", HOST, "--port", str(port), "--workers", str(workers), "--no-access-log",
+    ],
+}
+
+
+def build_request(access_token):
+    return (
+        f"GET {PATH} HTTP/1.1\r\n"
+        f"Host: {DOMAIN}\r\n"
+        f"Authorization: Bearer {access_token}\r\n"
+        # gunicorn sync workers don't keep connections alive, both servers get a new connection per request
+        f"Connection: close\r\n\r\n"
+    ).encode()
+
+
+async def send_request(port, raw_request):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        writer.write(raw_request)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def fast_client(port, raw_request, deadline, request_timeout, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(send_request(port, raw_request), request_timeout)
+        except (OSError, IndexError, ValueError, asyncio.TimeoutError):
+            status = None
+
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+
+
+async def slow_client(port, stop, interval):
+    try:
+        reader, writer = await asyncio.open_connection(HOST, port)
+    except OSError:
+        return
+
+    try:
+        writer.write(f"GET {PATH} HTTP/1.1\r\nHost: {DOMAIN}\r\n".encode())
+        while not stop.is_set():
+            writer.write(b"X-Slow-Client: 1\r\n")
+            await writer.drain()
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run_load(port, access_token, concurrency, slow_clients, duration, slow_interval, request_timeout):
+    raw_request = build_request(access_token)
+    latencies, errors = [], []
+    stop = asyncio.Event()
+
+    slow_tasks = [asyncio.create_task(slow_client(port, stop, slow_interval)) for _ in range(slow_clients)]
+    # slow connections are accepted first, as they would be in production
+    await asyncio.sleep(0.5)
+
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(fast_client(port, raw_request, deadline, request_timeout, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await asyncio.gather(*slow_tasks)
+    return latencies, errors, elapsed
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            asyncio.run(send_request(port, f"GET /api/ HTTP/1.1\r\nHost: {DOMAIN}\r\nConnection: close\r\n\r\n".encode()))
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def start_server(mode, port, workers, database_name):
+    from django.conf import settings
+
+    database = settings.DATABASES["default"]
+    env = dict(os.environ)
+    env["SERVER_MODE"] = mode
+    # servers run against the throwaway benchmark database
+    env["DATABASE_URL"] = (
+        f"postgres://{database['USER']}:{database['PASSWORD']}@{database['HOST'] or 'localhost'}:{database['PORT'] or 5432}/{database_name}"
+    )
+
+    server = subprocess.Popen(SERVER_COMMANDS[mode](port, workers), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(port)
+    except RuntimeError:
+        server.kill()
+        raise
+    return server
+
+
+def run(args):
+    from io import StringIO
+    from django.core.management import call_command
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    call_command("setup_tenant_structure", stdout=StringIO())
+    access_token = get_access_token(APIClient(), DOMAIN, args.username)
+    database_name = connection.settings_dict["NAME"]
+    # servers open their own connections, the test database must not be held by this process
+    connection.close()
+
+    rows = []
+    for mode in args.modes:
+        server = start_server(mode, args.port, args.workers, database_name)
+        try:
+            for slow_clients in sorted({0, args.slow_clients}):
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(
+                        args.port, access_token, args.concurrency, slow_clients, args.duration, args.slow_interval, args.request_timeout
+                    )
+                )
+                row = {
+                    "server": mode,
+                    "workers": args.workers,
+                    "clients": args.concurrency,
+                    "slow_clients": slow_clients,
+                    "requests_per_s": round(len(latencies) / elapsed, 1),
+                    "errors": len(errors),
+                }
+                if latencies:
+                    row.update(summarize(latencies))
+                rows.append(row)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print_table(rows, ["server", "workers", "clients", "slow_clients", "requests_per_s", "errors", "p50_ms", "p95_ms", "p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=list(SERVER_COMMANDS), default=list(SERVER_COMMANDS))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--slow-clients", type=int, default=16)
+    parser.add_argument("--slow-interval", type=float, default=1.0, help="seconds between header lines of slow clients")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--request-timeout", type=float, default=5.0, help="requests slower than this are counted as errors")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--username", default="tenant_user_1")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
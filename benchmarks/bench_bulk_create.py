@@ -0,0 +1,84 @@
+"""
+Time and query count of creating customers of a tenant one by one (POST /api/customers/ per customer)
+compared to POST /api/customers/bulk/ (one local_id allocation and one parent lookup per batch, bulk inserts)
+
+    python -m benchmarks.bench_bulk_create --customers 5000 --batch 1000
+"""
+import argparse
+import time
+
+from benchmarks.common import setup_django, benchmark_database, get_access_token, print_table
+
+
+def run(customers, batch, username):
+    from io import StringIO
+    from django.core.management import call_command
+    from django.db import connection
+    from rest_framework.test import APIClient
+    from tenants.models import Department
+    from user_management.models import BaseUser
+
+    call_command("setup_tenant_structure", stdout=StringIO())
+
+    client = APIClient()
+    access_token = get_access_token(client, "tenant1.localhost", username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    user = BaseUser.objects.get(username=username)
+    departments = list(Department.objects.filter(tenant=user.tenant_scope_id).values_list("local_id", flat=True))
+
+    def payload(prefix, start, count):
+        return [
+            {"name": f"{prefix} {index}", "department": departments[index % len(departments)]}
+            for index in range(start, start + count)
+        ]
+
+    def one_by_one():
+        for item in payload("Single", 0, customers):
+            response = client.post("/api/customers/", item, format="json")
+            assert response.status_code == 201, response.content
+
+    def in_batches():
+        for start in range(0, customers, batch):
+            response = client.post("/api/customers/bulk/", payload("Bulk", start, min(batch, customers - start)), format="json")
+            assert response.status_code == 201, response.content
+
+    rows = []
+    for name, create in {"one by one": one_by_one, f"bulk ({batch} per request)": in_batches}.items():
+        # counted with a wrapper, query log keeps only the last 9000 queries
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            create()
+            elapsed = time.perf_counter() - start
+
+        rows.append({
+            "variant": name,
+            "customers": customers,
+            "queries": len(queries),
+            "seconds": round(elapsed, 3),
+            "customers_per_s": round(customers / elapsed),
+        })
+
+    print_table(rows, ["variant", "customers", "queries", "seconds", "customers_per_s"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--username", default="tenant_user_1")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.customers, args.batch, args.username)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Latency and query count of GET /api/customers/ when the JWT is authenticated once per request
+(RequestScopedJWTAuthentication shared by TenantMiddleware and DRF) compared to authenticating it
+again inside the view (plain JWTAuthentication, previous behaviour)
+
+    python -m benchmarks.bench_customer_list --iterations 300
+"""
+import argparse
+
+from benchmarks.common import setup_django, benchmark_database, get_access_token, summarize, timed, print_table
+
+
+def run(iterations, username):
+    from io import StringIO
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.authentication import SessionAuthentication
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from tenants.views import CustomerViewSet
+    from user_management.authentication import RequestScopedJWTAuthentication
+
+    call_command("setup_tenant_structure", stdout=StringIO())
+
+    client = APIClient()
+    access_token = get_access_token(client, "tenant1.localhost", username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    def request():
+        response = client.get("/api/customers/", format="json")
+        assert response.status_code == 200, response.content
+
+    variants = {
+        "authenticated twice": [JWTAuthentication, SessionAuthentication],
+        "authenticated once": [RequestScopedJWTAuthentication, SessionAuthentication],
+    }
+
+    original_classes = CustomerViewSet.authentication_classes
+    rows = []
+    try:
+        for name, authentication_classes in variants.items():
+            CustomerViewSet.authentication_classes = authentication_classes
+
+            with CaptureQueriesContext(connection) as queries:
+                request()
+
+            row = {"variant": name, "queries": len(queries)}
+            row.update(summarize(timed(request, iterations)))
+            rows.append(row)
+    finally:
+        CustomerViewSet.authentication_classes = original_classes
+
+    print_table(rows, ["variant", "queries", "iterations", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--username", default="tenant_user_1")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.iterations, args.username)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Throughput of BaseUser.has_perm for every role and permission, with role permissions compiled once into bitmasks
+(shared ROLE_PERMISSIONS_MANAGER) compared to permission sets accumulated on every call
+(previous behaviour, kept as reference in tenants/tests/test_role_permissions.py).
+Users aren't saved, no query is executed.
+
+    python -m benchmarks.bench_has_perm --iterations 2000
+"""
+import argparse
+
+from benchmarks.common import setup_django, summarize, timed, print_table
+
+
+def run(iterations):
+    from tenants.tests.test_role_permissions import ALL_PERMISSIONS, legacy_has_perm
+    from user_management.models import BaseUser
+    from user_management.utils import Role
+
+    users = [BaseUser(username=f"user {role}", role=role) for role in Role]
+    checks = len(users) * len(ALL_PERMISSIONS)
+
+    variants = {
+        "sets per call": legacy_has_perm,
+        "compiled bitmasks": lambda user, perm: user.has_perm(perm),
+    }
+
+    rows = []
+    for name, has_perm in variants.items():
+        def check_all():
+            for user in users:
+                for perm in ALL_PERMISSIONS:
+                    has_perm(user, perm)
+
+        row = {"variant": name, "checks": checks}
+        row.update(summarize(timed(check_all, iterations)))
+        row["checks_per_s"] = round(checks / (row["mean_ms"] / 1000))
+        rows.append(row)
+
+    print_table(rows, ["variant", "checks", "iterations", "checks_per_s", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    run(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
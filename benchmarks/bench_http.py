@@ -0,0 +1,337 @@
+"""
+End-to-end latency, throughput, SQL queries per request and peak RSS of the routes of main/urls.py:
+token obtain/refresh, list, retrieve, create, update and destroy of every viewset, jobs, protected/ and tenant-cache stats,
+for every role of user_management.utils.Role on several tenant domains, against a dataset built by setup_tenant_structure.
+
+Requests go through the whole middleware, URL routing and view stack (Django test client, no network, one client),
+throughput is requests per second of that client. Objects deleted by destroy and tokens used by refresh are prepared
+outside of the measured time. Denied requests (403, 401) are measured too, statuses of every scenario are in the results.
+
+Results are saved as JSON, --baseline prints the change of every scenario against an earlier run:
+
+    python -m benchmarks.bench_http --domains 2 --iterations 20 --output before.json
+    python -m benchmarks.bench_http --domains 2 --iterations 20 --output after.json --baseline before.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import resource
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from benchmarks.common import setup_django, benchmark_database, summarize, print_table
+
+
+ENDPOINTS = ("tenants", "organizations", "departments", "customers", "users", "jobs", "token", "protected", "tenant-cache")
+ACTIONS = ("list", "retrieve", "create", "update", "destroy")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS), peak of the whole process so far
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+class Scenarios:
+    """
+    Requests of every endpoint and action for one user on one domain. Every scenario is a function returning
+    (method, path, data) of the next request, objects it needs are created by it, outside of the measured time
+    """
+
+    def __init__(self, user, tenant, targets):
+        self.user = user
+        self.tenant = tenant
+        self.targets = targets
+        self.counter = itertools.count()
+        self.refresh_token = None
+        self.job = None
+
+    def ref(self, instance):
+        # admins address tenant data by global ids, scoped users by local_ids of their tenant (see get_limited_object)
+        return instance.id if self.user.is_admin() or self.user.is_superuser else instance.local_id
+
+    def unique(self, prefix):
+        return f"{prefix} {self.user.username} {next(self.counter)}"
+
+    def all(self):
+        scenarios = {}
+        for endpoint in ("tenants", "organizations", "departments", "customers", "users"):
+            for action in ACTIONS:
+                scenarios[(endpoint, action)] = getattr(self, f"{endpoint}_{action}", None) or getattr(self, f"model_{action}")
+        scenarios[("jobs", "retrieve")] = self.jobs_retrieve
+        scenarios[("token", "obtain")] = self.token_obtain
+        scenarios[("token", "refresh")] = self.token_refresh
+        scenarios[("protected", "retrieve")] = lambda endpoint: ("get", "/protected/", None)
+        scenarios[("tenant-cache", "retrieve")] = lambda endpoint: ("get", "/api/tenant-cache/stats/", None)
+        return scenarios
+
+    def model_list(self, endpoint):
+        return "get", f"/api/{endpoint}/", None
+
+    def model_retrieve(self, endpoint):
+        return "get", f"/api/{endpoint}/{self.ref(self.targets[endpoint])}/", None
+
+    def model_update(self, endpoint):
+        return "patch", f"/api/{endpoint}/{self.ref(self.targets[endpoint])}/", {"name": self.unique(endpoint)}
+
+    def model_create(self, endpoint):
+        return "post", f"/api/{endpoint}/", self.create_payload(endpoint)
+
+    def model_destroy(self, endpoint):
+        return "delete", f"/api/{endpoint}/{self.ref(self.new_object(endpoint))}/", None
+
+    def create_payload(self, endpoint):
+        payload = {"name": self.unique(endpoint)}
+        if endpoint == "departments":
+            payload["organization"] = self.ref(self.targets["organizations"])
+        elif endpoint == "customers":
+            payload["department"] = self.ref(self.targets["departments"])
+        return payload
+
+    def new_object(self, endpoint):
+        from tenants.models import Organization, Department, Customer
+
+        if endpoint == "organizations":
+            instance = Organization(name=self.unique("destroyed"), tenant=self.tenant)
+        elif endpoint == "departments":
+            instance = Department(name=self.unique("destroyed"), organization=self.targets["organizations"])
+        else:
+            instance = Customer(name=self.unique("destroyed"), department=self.targets["departments"])
+        instance.save()
+        return instance
+
+    def tenants_retrieve(self, endpoint):
+        return "get", f"/api/tenants/{self.tenant.pk}/", None
+
+    def tenants_create(self, endpoint):
+        name = self.unique("tenant").replace(" ", "-")
+        return "post", "/api/tenants/", {"name": name, "domain_url": f"{name}.localhost"}
+
+    def tenants_update(self, endpoint):
+        return "patch", f"/api/tenants/{self.targets['tenants'].pk}/", {"name": self.unique("tenant")}
+
+    def tenants_destroy(self, endpoint):
+        from tenants.models import Tenant
+
+        return "delete", f"/api/tenants/{Tenant.objects.create(name=self.unique('destroyed')).pk}/", None
+
+    def users_retrieve(self, endpoint):
+        return "get", f"/api/users/{self.targets['users'].pk}/", None
+
+    def users_create(self, endpoint):
+        return "post", "/api/users/", {"username": self.unique("user").replace(" ", "_"), "tenant_scope": self.tenant.pk}
+
+    def users_update(self, endpoint):
+        return "patch", f"/api/users/{self.targets['users'].pk}/", {"username": self.unique("user").replace(" ", "_")}
+
+    def users_destroy(self, endpoint):
+        from user_management.models import BaseUser
+
+        user = BaseUser.objects.create_user(username=self.unique("destroyed").replace(" ", "_"), password=None, tenant_scope=self.tenant)
+        return "delete", f"/api/users/{user.pk}/", None
+
+    def jobs_retrieve(self, endpoint):
+        from tenants.models import Job
+
+        if self.job is None:
+            self.job = Job.objects.create(kind="benchmark", tenant=self.tenant, created_by_id=self.user.pk)
+        return "get", f"/api/jobs/{self.job.pk}/", None
+
+    def token_obtain(self, endpoint):
+        return "post", "/api/token/", {"username": self.user.username, "password": "password"}
+
+    def token_refresh(self, endpoint):
+        return "post", "/api/token/refresh/", {"refresh": self.refresh_token}
+
+
+def create_users(tenants):
+    """
+    One user of every role for every benchmarked tenant, scoped to the first organization, department and customer
+    """
+    from user_management.models import BaseUser
+    from user_management.utils import Role
+
+    users = {}
+    for index, tenant in enumerate(tenants, start=1):
+        organization = tenant.organizations.order_by("local_id").first()
+        department = organization.departments.order_by("local_id").first()
+        customer = department.customers.order_by("local_id").first()
+        scopes = {
+            Role.ROLE_UNNASIGNED: {},
+            Role.ROLE_TENANT_USER: {"tenant_scope": tenant},
+            Role.ROLE_ORG_USER: {"tenant_scope": tenant, "organization_scope": organization},
+            Role.ROLE_DEPT_USER: {"tenant_scope": tenant, "organization_scope": organization, "department_scope": department},
+            Role.ROLE_CUSTOMER_USER: {
+                "tenant_scope": tenant, "organization_scope": organization, "department_scope": department, "customer_scope": customer,
+            },
+        }
+        for role in Role:
+            username = f"bench_{role.name.lower()}_{index}"
+            if role == Role.ROLE_TENANT_ADMIN:
+                # tenant admins are superusers (like admin_user_1 of setup_tenant_structure)
+                users[(tenant, role)] = BaseUser.objects.create_superuser(username=username, password="password")
+            else:
+                users[(tenant, role)] = BaseUser.objects.create_user(username=username, password="password", **scopes[role])
+
+        target_user = BaseUser.objects.create_user(
+            username=f"bench_target_{index}", password="password",
+            tenant_scope=tenant, organization_scope=organization, department_scope=department, customer_scope=customer,
+        )
+        users[(tenant, "targets")] = {
+            "tenants": tenant, "organizations": organization, "departments": department, "customers": customer, "users": target_user,
+        }
+    return users
+
+
+def authenticate(client, domain, scenarios):
+    """
+    Access token of the user on the domain (kept by the client), refresh token for refresh scenarios.
+    Users that can't obtain a token (unassigned role) send requests unauthenticated
+    """
+    client.credentials()
+    client.defaults["HTTP_HOST"] = domain
+    response = client.post("/api/token/", {"username": scenarios.user.username, "password": "password"}, format="json")
+    if response.status_code != 200:
+        return False
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+    scenarios.refresh_token = response.json()["refresh"]
+    return True
+
+
+def measure(client, scenario, endpoint, iterations, warmup):
+    from django.db import connections
+    from django.test.utils import CaptureQueriesContext
+
+    latencies = []
+    queries = 0
+    statuses = Counter()
+    for iteration in range(warmup + iterations):
+        method, path, data = scenario(endpoint)
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, format="json")
+            elapsed = time.perf_counter() - start
+        if iteration < warmup:
+            continue
+        latencies.append(elapsed)
+        queries += sum(len(context) for context in captured)
+        statuses[str(response.status_code)] += 1
+
+    return {
+        **summarize(latencies),
+        "throughput_rps": round(len(latencies) / sum(latencies), 1),
+        "queries_per_request": round(queries / len(latencies), 2),
+        "statuses": dict(statuses),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(args):
+    from io import StringIO
+    from django.core.management import call_command
+    from rest_framework.test import APIClient
+    from tenants.models import Tenant
+    from user_management.utils import Role
+
+    start = time.perf_counter()
+    call_command(
+        "setup_tenant_structure", "--tenants", str(max(args.domains, args.tenants)), "--organizations", str(args.organizations),
+        "--departments", str(args.departments), "--customers", str(args.customers), "--distribution", args.distribution,
+        "--processes", "1", stdout=StringIO(),
+    )
+    tenants = [Tenant.objects.get(name=f"Tenant{index}") for index in range(1, args.domains + 1)]
+    users = create_users(tenants)
+    setup_seconds = time.perf_counter() - start
+
+    roles = [role for role in Role if not args.roles or role.name in args.roles]
+    rows = []
+    client = APIClient()
+    for tenant in tenants:
+        # domains of tenants generated by setup_tenant_structure
+        domain = f"{tenant.name.lower()}.localhost"
+        for role in roles:
+            scenarios = Scenarios(users[(tenant, role)], tenant, users[(tenant, "targets")])
+            authenticated = authenticate(client, domain, scenarios)
+            for (endpoint, action), scenario in scenarios.all().items():
+                if args.endpoints and endpoint not in args.endpoints:
+                    continue
+                if action == "refresh" and not authenticated:
+                    continue
+                row = {"domain": domain, "role": role.name, "endpoint": endpoint, "action": action}
+                row.update(measure(client, scenario, endpoint, args.iterations, args.warmup))
+                rows.append(row)
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "setup_seconds": round(setup_seconds, 2),
+            "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "scenarios": rows,
+    }
+
+
+def scenario_key(row):
+    return row["domain"], row["role"], row["endpoint"], row["action"]
+
+
+def compare(results, baseline):
+    """
+    Change of p50 latency, throughput and queries per request of every scenario present in both runs
+    """
+    previous = {scenario_key(row): row for row in baseline["scenarios"]}
+    rows = []
+    for row in results["scenarios"]:
+        before = previous.get(scenario_key(row))
+        if before is None:
+            continue
+        rows.append({
+            "domain": row["domain"], "role": row["role"], "endpoint": row["endpoint"], "action": row["action"],
+            "p50_ms": f"{before['p50_ms']} -> {row['p50_ms']}",
+            "p50_change": f"{(row['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100:+.1f}%" if before["p50_ms"] else "",
+            "rps": f"{before['throughput_rps']} -> {row['throughput_rps']}",
+            "queries": f"{before['queries_per_request']} -> {row['queries_per_request']}",
+        })
+    print_table(rows, ["domain", "role", "endpoint", "action", "p50_ms", "p50_change", "rps", "queries"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domains", type=int, default=2, help="tenant domains the scenarios run on")
+    parser.add_argument("--tenants", type=int, default=2, help="tenants of the generated dataset")
+    parser.add_argument("--organizations", type=int, default=5)
+    parser.add_argument("--departments", type=int, default=5)
+    parser.add_argument("--customers", type=int, default=20)
+    parser.add_argument("--distribution", choices=("uniform", "zipf"), default="uniform")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--roles", nargs="+", help="names of roles to run (default all), e.g. ROLE_TENANT_USER")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, help="endpoints to run (default all)")
+    parser.add_argument("--output", default="bench_http.json", help="JSON file of the results")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+
+    print_table(
+        results["scenarios"],
+        ["domain", "role", "endpoint", "action", "statuses", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request", "peak_rss_mb"],
+    )
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Throughput of local_id allocation with concurrent threads (every thread on its own database connection),
+for every allocator of tenants/local_ids.py: sequence (nextval per allocation), counter (upsert of a counter row
+per allocation, row lock held until commit) and hilo (blocks reserved in the counter table, handed out from memory).
+Every allocation is made in its own transaction, the way inserts of regular requests are.
+
+    python -m benchmarks.bench_local_ids --threads 8 --allocations 500
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import setup_django, benchmark_database, print_table
+
+
+def run(threads_count, allocations, block_size):
+    from django.conf import settings
+    from django.db import connections, transaction, DEFAULT_DB_ALIAS
+    from tenants import local_ids
+    from tenants.models import Tenant
+
+    settings.LOCAL_IDS = {**settings.LOCAL_IDS, "HILO_BLOCK_SIZE": block_size}
+
+    rows = []
+    for name in local_ids.LOCAL_ID_ALLOCATORS:
+        settings.LOCAL_IDS = {**settings.LOCAL_IDS, "ALLOCATOR": name}
+        allocator = local_ids.get_local_id_allocator(name)
+        schema_name = Tenant.objects.create(name=f"Benchmark tenant {name}").get_schema_name()
+
+        values = []
+        latencies = []
+
+        def allocate():
+            try:
+                for _ in range(allocations):
+                    start = time.perf_counter()
+                    with transaction.atomic():
+                        values.extend(allocator.allocate(schema_name, "customer_model", 1, DEFAULT_DB_ALIAS))
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=allocate) for _ in range(threads_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        for reservation_connection in getattr(allocator, "_connections", {}).values():
+            reservation_connection.close()
+
+        total = threads_count * allocations
+        assert len(values) == len(set(values)) == total, f"{name} handed out duplicated local_ids"
+        latencies.sort()
+        rows.append({
+            "allocator": name,
+            "threads": threads_count,
+            "allocations": total,
+            "allocations_per_s": round(total / elapsed),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+            "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+            "sequences": _count_sequences(schema_name),
+        })
+
+    print_table(rows, ["allocator", "threads", "allocations", "allocations_per_s", "p50_ms", "p99_ms", "sequences"])
+
+
+def _count_sequences(schema_name):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM information_schema.sequences WHERE sequence_schema = %s", [schema_name])
+        return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--allocations", type=int, default=500, help="allocations per thread")
+    parser.add_argument("--block-size", type=int, default=100, help="block size of hilo allocator")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.threads, args.allocations, args.block_size)
+
+
+if __name__ == "__main__":
+    main()
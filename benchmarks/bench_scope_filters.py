@@ -0,0 +1,61 @@
+"""
+Cost of building scoped querysets (get_limited_queryset) for every model and non-admin user of the example structure,
+with compiled per-(model, role) filter plans compared to building the whole model_role_filters dict on every call
+(previous behaviour, kept as reference in tenants/tests/test_scope_filters.py).
+No query is executed, only querysets are built.
+
+    python -m benchmarks.bench_scope_filters --iterations 2000
+"""
+import argparse
+
+from benchmarks.common import setup_django, benchmark_database, summarize, timed, print_table
+
+
+def run(iterations):
+    from io import StringIO
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from tenants.models import Tenant, Organization, Department, Customer
+    from tenants.tests.test_scope_filters import legacy_get_limited_queryset
+    from user_management.models import BaseUser
+
+    call_command("setup_tenant_structure", stdout=StringIO())
+
+    models = [Tenant, Organization, Department, Customer, BaseUser]
+    users = [user for user in BaseUser.objects.all() if not user.is_admin()]
+
+    variants = {
+        "dict per call": lambda user, model: legacy_get_limited_queryset(user, model),
+        "compiled plans": lambda user, model: user.get_limited_queryset(model),
+    }
+
+    rows = []
+    for name, build in variants.items():
+        def build_all():
+            for user in users:
+                for model in models:
+                    build(user, model)
+
+        with CaptureQueriesContext(connection) as queries:
+            build_all()
+
+        row = {"variant": name, "querysets": len(users) * len(models), "queries": len(queries)}
+        row.update(summarize(timed(build_all, iterations)))
+        rows.append(row)
+
+    print_table(rows, ["variant", "querysets", "queries", "iterations", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
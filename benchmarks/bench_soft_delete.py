@@ -0,0 +1,95 @@
+"""
+Time and query count of soft deleting an organization with its whole subtree (departments, customers, scoped users),
+object by object (soft_delete() of every instance, as the cascade of the viewset used to) compared to
+tenants.cascade.soft_delete_cascade (one UPDATE per level and model)
+
+    python -m benchmarks.bench_soft_delete --departments 20 --customers 5000
+"""
+import argparse
+import time
+
+from benchmarks.common import setup_django, benchmark_database, print_table
+
+
+def run(departments_count, customers_count, users_count):
+    from django.db import connection, transaction
+    from tenants.cascade import soft_delete_cascade
+    from tenants.models import Tenant, Organization, Department, Customer
+    from user_management.models import BaseUser
+
+    tenant = Tenant.objects.create(name="Benchmark tenant")
+
+    def create_organization(prefix):
+        organization = Organization.objects.create(name=f"{prefix} organization", tenant=tenant)
+        departments = Department.bulk_create_for_tenant(
+            [Department(name=f"{prefix} department {index}", organization=organization) for index in range(departments_count)], tenant,
+        )
+        Customer.bulk_create_for_tenant(
+            [
+                Customer(name=f"{prefix} customer {index}", department=departments[index % len(departments)])
+                for index in range(customers_count)
+            ],
+            tenant,
+        )
+        for index in range(users_count):
+            BaseUser.objects.create_user(
+                username=f"{prefix.lower()}_user_{index}", password="password",
+                tenant_scope=tenant, organization_scope=organization, department_scope=departments[index % len(departments)],
+            )
+        return organization
+
+    def object_by_object(organization):
+        organization.soft_delete()
+        for department in organization.departments.all():
+            department.soft_delete()
+            for customer in department.customers.all():
+                customer.soft_delete()
+        for user in BaseUser.objects.filter(organization_scope=organization):
+            user.soft_delete()
+
+    def set_based(organization):
+        organization.soft_delete()
+        soft_delete_cascade(organization)
+
+    rows = []
+    for name, soft_delete in {"object by object": object_by_object, "set based": set_based}.items():
+        organization = create_organization(name.title().replace(" ", ""))
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            with transaction.atomic():
+                soft_delete(organization)
+            elapsed = time.perf_counter() - start
+
+        assert not Customer.objects.filter(organization=organization, is_deleted=False).exists()
+        rows.append({
+            "variant": name,
+            "departments": departments_count,
+            "customers": customers_count,
+            "users": users_count,
+            "queries": len(queries),
+            "seconds": round(elapsed, 3),
+        })
+
+    print_table(rows, ["variant", "departments", "customers", "users", "queries", "seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--departments", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.departments, args.customers, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Latency of creating tenants (Tenant.save) with schema DDL in the request compared to claiming a spare schema from a warm pool
+(filled beforehand by refill_schema_pool, its time isn't part of the measurement)
+
+    python -m benchmarks.bench_tenant_create --tenants 200
+"""
+import argparse
+import time
+
+from benchmarks.common import setup_django, benchmark_database, summarize, print_table
+
+
+def run(tenants):
+    from tenants.models import Tenant
+    from tenants.schema_pool import refill_schema_pool
+
+    def create_all(prefix):
+        latencies = []
+        for index in range(tenants):
+            start = time.perf_counter()
+            Tenant.objects.create(name=f"{prefix} {index}")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    rows = []
+    rows.append({"variant": "schema DDL in save", **summarize(create_all("DDL"))})
+
+    refill_schema_pool("default", tenants)
+    rows.append({"variant": "warm schema pool", **summarize(create_all("Pooled"))})
+
+    print_table(rows, ["variant", "iterations", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.tenants)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Time and query count of creating users of a tenant one by one (TenantBaseUserManager.create_user per user)
+compared to provision_users (passwords hashed in one process and in a process pool, bulk inserts of users and permissions)
+
+    python -m benchmarks.bench_user_provisioning --users 500 --processes 8
+"""
+import argparse
+import os
+import time
+
+from benchmarks.common import setup_django, benchmark_database, print_table
+
+
+def run(users, processes):
+    from io import StringIO
+    from django.core.management import call_command
+    from django.db import connection
+    from tenants.models import Tenant, Organization, Department
+    from user_management.models import BaseUser
+    from user_management.provisioning import provision_users
+
+    call_command("setup_tenant_structure", stdout=StringIO())
+
+    tenant = Tenant.objects.get(name="Tenant1")
+    scopes = [
+        {"tenant_scope": tenant},
+        *({"tenant_scope": tenant, "organization_scope": organization} for organization in Organization.objects.filter(tenant=tenant)),
+        *(
+            {"tenant_scope": tenant, "organization_scope": department.organization, "department_scope": department}
+            for department in Department.objects.filter(tenant=tenant).select_related("organization")
+        ),
+    ]
+
+    def items(prefix):
+        return [
+            {"username": f"{prefix}_{index}", "password": f"password {index}", **scopes[index % len(scopes)]}
+            for index in range(users)
+        ]
+
+    def one_by_one():
+        for item in items("single"):
+            BaseUser.objects.create_user(**item)
+
+    variants = {
+        "create_user one by one": one_by_one,
+        "provision_users, 1 process": lambda: provision_users(items("bulk"), processes=1),
+        f"provision_users, {processes} processes": lambda: provision_users(items("pool"), processes=processes),
+    }
+
+    rows = []
+    for name, create in variants.items():
+        # counted with a wrapper, query log keeps only the last 9000 queries
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            create()
+            elapsed = time.perf_counter() - start
+
+        rows.append({
+            "variant": name,
+            "users": users,
+            "queries": len(queries),
+            "seconds": round(elapsed, 3),
+            "users_per_s": round(users / elapsed),
+        })
+
+    print_table(rows, ["variant", "users", "queries", "seconds", "users_per_s"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=None, help="hashing processes (defaults to CPU count)")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.users, args.processes or os.cpu_count())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Creates a throwaway test database (same way pytest does), and destroys it afterwards
+    Benchmarks never touch data of the configured database
+    """
+    from django.test.utils import setup_test_environment, teardown_test_environment, setup_databases, teardown_databases
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def get_access_token(client, domain, username, password="password"):
+    client.defaults["HTTP_HOST"] = domain
+    response = client.post("/api/token/", {"username": username, "password": password}, format="json")
+    assert response.status_code == 200, response.content
+    return response.json()["access"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """
+    Latencies in seconds -> summary in milliseconds
+    """
+    ordered = sorted(latencies)
+    return {
+        "iterations": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+def timed(func, iterations, warmup=10):
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def print_table(rows, columns):
+    widths = {column: max(len(column), *(len(str(row.get(column, ""))) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
@@ -2,6 +2,8 @@ import environ
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 env = environ.Env()
@@ -63,10 +65,51 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'main.wsgi.application'
 
+# "wsgi" (gunicorn sync workers) or "asgi" (uvicorn), under asgi list/retrieve of scoped viewsets run on the async ORM
+SERVER_MODE = env("SERVER_MODE", default="wsgi")
+
 DATABASES = {
     "default": env.db("DATABASE_URL")
 }
 
+# Persistent connections, search_path of the tenant is applied (and cached) per connection by tenants.tenant_schema
+# under ASGI every request runs in its own thread, connections can't be reused there
+DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60 if SERVER_MODE == "wsgi" else 0)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Tenant shards, TENANT_SHARDS=shard_1,shard_2 with SHARD_1_DATABASE_URL, SHARD_2_DATABASE_URL...
+# position in the list selects id range of the shard, new shards must be appended at the end
+for shard_index, shard_alias in enumerate(env.list("TENANT_SHARDS", default=[]), start=1):
+    DATABASES[shard_alias] = env.db(f"{shard_alias.upper()}_DATABASE_URL")
+    DATABASES[shard_alias]["SHARD_INDEX"] = shard_index
+    DATABASES[shard_alias]["CONN_MAX_AGE"] = DATABASES["default"]["CONN_MAX_AGE"]
+    DATABASES[shard_alias]["CONN_HEALTH_CHECKS"] = True
+
+# shard of newly created tenants
+TENANT_DEFAULT_SHARD = env("TENANT_DEFAULT_SHARD", default="default")
+
+# Read replicas, DATABASE_REPLICAS=replica_1,... with REPLICA_1_DATABASE_URL and REPLICA_1_REPLICA_OF (alias of primary)
+if env.list("DATABASE_REPLICAS", default=[]) and not env("TENANT_CACHE_REDIS_URL", default=None):
+    # users are pinned to the primary after a write in the shared tier of tenant cache, without redis the pin
+    # is kept only by the worker that handled the write and reads served by other workers could miss the write
+    raise ImproperlyConfigured("DATABASE_REPLICAS require TENANT_CACHE_REDIS_URL (read-your-writes pinning is shared through redis)")
+for replica_alias in env.list("DATABASE_REPLICAS", default=[]):
+    DATABASES[replica_alias] = env.db(f"{replica_alias.upper()}_DATABASE_URL")
+    DATABASES[replica_alias]["REPLICA_OF"] = env(f"{replica_alias.upper()}_REPLICA_OF", default="default")
+    DATABASES[replica_alias]["TEST"] = {"MIRROR": DATABASES[replica_alias]["REPLICA_OF"]}
+    DATABASES[replica_alias]["CONN_MAX_AGE"] = DATABASES["default"]["CONN_MAX_AGE"]
+    DATABASES[replica_alias]["CONN_HEALTH_CHECKS"] = True
+
+# list and retrieve of scoped viewsets (and token refresh) read from replicas with lag under MAX_LAG seconds,
+# users are pinned to the primary for READ_YOUR_WRITES_WINDOW seconds after each write
+READ_REPLICAS = {
+    "MAX_LAG": env.float("REPLICA_MAX_LAG", default=5),
+    "LAG_CHECK_INTERVAL": env.float("REPLICA_LAG_CHECK_INTERVAL", default=1),
+    "READ_YOUR_WRITES_WINDOW": env.int("REPLICA_READ_YOUR_WRITES_WINDOW", default=5),
+}
+
+DATABASE_ROUTERS = ["tenants.db_router.TenantDatabaseRouter"]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -110,7 +153,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user_management.authentication.RequestScopedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     "EXCEPTION_HANDLER": "exception_handlers.custom_exception_handler",
@@ -122,6 +165,13 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'user_management.BaseUser'
 
+# Permissions of users come from their role (RolePermissionsManager): "rows" also writes them into user_permissions
+# of every user, "virtual" computes them from the role only (no rows written, purge old ones with "manage.py purge_role_permissions")
+ROLE_PERMISSIONS_MODE = env("ROLE_PERMISSIONS_MODE", default="rows")
+if ROLE_PERMISSIONS_MODE not in ("rows", "virtual"):
+    raise ImproperlyConfigured("ROLE_PERMISSIONS_MODE has to be 'rows' or 'virtual'")
+AUTHENTICATION_BACKENDS = ["user_management.backends.RolePermissionBackend"]
+
 LOGIN_REDIRECT_URL = '/api/'
 
 from datetime import timedelta
@@ -129,7 +179,46 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'TOKEN_OBTAIN_SERIALIZER': 'user_management.custom_token_logic.TenantAwareTokenObtainPairSerializer',
+    'TOKEN_USER_CLASS': 'user_management.models.ScopedTokenUser',
 }
 
+# Domain -> tenant resolution cache, used by TenantMiddleware and token views
+# without SHARED_URL (redis) shared tier falls back to in-process storage
+TENANT_CACHE = {
+    "SHARED_URL": env("TENANT_CACHE_REDIS_URL", default=None),
+    "SHARED_TIMEOUT": env.int("TENANT_CACHE_SHARED_TIMEOUT", default=300),
+    "LOCAL_MAX_SIZE": env.int("TENANT_CACHE_LOCAL_MAX_SIZE", default=1024),
+    "LOCAL_TIMEOUT": env.int("TENANT_CACHE_LOCAL_TIMEOUT", default=30),
+}
 
+# Allocation of local_ids: "sequence" (postgres sequences in the schema of every tenant),
+# "counter" (row per tenant and counter in tenants_localidcounter, no sequences) or "hilo" (blocks of counter values reserved per process)
+LOCAL_IDS = {
+    "ALLOCATOR": env("LOCAL_ID_ALLOCATOR", default="sequence"),
+    "HILO_BLOCK_SIZE": env.int("LOCAL_ID_HILO_BLOCK_SIZE", default=100),
+}
+
+# Background jobs (tenants/jobs.py) executed by "manage.py run_job_worker": objects per batch (checkpoint after every batch),
+# seconds between polls of an idle worker, seconds without heartbeat after which a running job is taken over by another worker
+JOBS = {
+    "BATCH_SIZE": env.int("JOB_BATCH_SIZE", default=1000),
+    "POLL_INTERVAL": env.float("JOB_POLL_INTERVAL", default=1.0),
+    "STALE_AFTER": env.int("JOB_STALE_AFTER", default=60),
+    "MAX_ATTEMPTS": 3,
+}
 
+# Spare tenant schemas kept on every shard by "manage.py refill_schema_pool --watch", new tenants claim one instead of running DDL
+# (SIZE 0 disables the pool, schemas are then created by Tenant.save), seconds between refills
+SCHEMA_POOL = {
+    "SIZE": env.int("SCHEMA_POOL_SIZE", default=20),
+    "REFILL_INTERVAL": env.float("SCHEMA_POOL_REFILL_INTERVAL", default=5.0),
+}
+
+# Bulk user provisioning (POST /api/users/bulk/, "manage.py provision_users"): processes hashing passwords (defaults to CPU count),
+# lists shorter than POOL_MIN_SIZE are hashed without starting the pool, users and permission rows per INSERT
+USER_PROVISIONING = {
+    "HASH_PROCESSES": env.int("USER_PROVISIONING_HASH_PROCESSES", default=None),
+    "POOL_MIN_SIZE": env.int("USER_PROVISIONING_POOL_MIN_SIZE", default=32),
+    "BATCH_SIZE": env.int("USER_PROVISIONING_BATCH_SIZE", default=1000),
+}
@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from tenants.views import OrganizationViewSet, DepartmentViewSet, CustomerViewSet, TenantViewSet
+from tenants.views import OrganizationViewSet, DepartmentViewSet, CustomerViewSet, TenantViewSet, TenantCacheStatsView, JobViewSet
 from user_management.views import BaseUserViewSet, ProtectedApiView
 from user_management.custom_token_logic import TenantAwareTokenObtainPairView, TenantAwareTokenRefreshView
 
@@ -27,6 +27,7 @@ router.register(r"organizations", OrganizationViewSet, basename="organization")
 router.register(r"departments", DepartmentViewSet, basename="department")
 router.register(r"customers", CustomerViewSet, basename="customer")
 router.register(r'users', BaseUserViewSet, basename='user')
+router.register(r'jobs', JobViewSet, basename='job')
 
 
 urlpatterns = [
@@ -36,4 +37,5 @@ urlpatterns = [
     path('protected/', ProtectedApiView.as_view(), name='protected'),
     path('api/token/', TenantAwareTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TenantAwareTokenRefreshView.as_view(), name='token_refresh'),
+    path('api/tenant-cache/stats/', TenantCacheStatsView.as_view(), name='tenant_cache_stats'),
 ]
@@ -3,6 +3,9 @@ set -e
 
 echo "Running migrations..."
 python manage.py migrate
+for shard in $(echo "${TENANT_SHARDS:-}" | tr ',' ' '); do
+    python manage.py migrate --database "$shard"
+done
 
 echo "Setting up tenant structure..."
 python manage.py setup_tenant_structure
@@ -10,6 +13,11 @@ python manage.py setup_tenant_structure
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting Uvicorn..."
+    exec uvicorn main.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-2}"
+fi
+
 echo "Starting Gunicorn..."
 exec gunicorn --bind 0.0.0.0:8000 main.wsgi:application
 
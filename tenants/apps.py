@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class TenantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tenants'
+
+    def ready(self):
+        # connects cache invalidation signals
+        from . import tenant_cache
+        # installs search_path wrapper on new connections
+        from . import tenant_schema
+        from django.db.models.signals import post_migrate
+        from .sharding import reserve_shard_id_range
+
+        post_migrate.connect(reserve_shard_id_range, sender=self)
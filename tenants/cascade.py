@@ -0,0 +1,111 @@
+from django.apps import apps
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+# Soft deletion of an instance cascades to children of these models: parent model -> [(child model, its parent field)]
+SOFT_DELETE_CASCADE = {
+    "tenants.tenant": [("tenants.organization", "tenant"), ("user_management.baseuser", "tenant_scope")],
+    "tenants.organization": [("tenants.department", "organization"), ("user_management.baseuser", "organization_scope")],
+    "tenants.department": [("tenants.customer", "department"), ("user_management.baseuser", "department_scope")],
+    "tenants.customer": [("user_management.baseuser", "customer_scope")],
+}
+
+# Names of soft deleted objects listed per model in the result
+SOFT_DELETE_SAMPLE_SIZE = 10
+
+
+def soft_delete_cascade(instance, sample_size=SOFT_DELETE_SAMPLE_SIZE):
+    """
+    Soft deletes every not deleted descendant of an instance (already soft deleted itself) in one transaction,
+    with one UPDATE per level and child model (and one query for a sample of names), no matter the size of the subtree.
+    Objects deleted at one level are found by deleted_at of the instance, so subtrees that were soft deleted before
+    aren't touched again. Deleted users get new token_version, their tokens stop working after commit.
+    Returns {model label: {"count": deleted objects, "sample": up to sample_size names}}
+    """
+    result = {}
+    using = get_cascade_alias(instance)
+    if using is None:
+        return result
+
+    with transaction.atomic(using=using):
+        for _ in iter_soft_delete_cascade(instance, result, sample_size):
+            pass
+    return result
+
+
+def get_cascade_alias(instance):
+    """
+    Database of descendants of the instance (shard of its tenant), None when soft deletion of the instance doesn't cascade
+    """
+    cascade = SOFT_DELETE_CASCADE.get(instance._meta.label_lower)
+    if not cascade:
+        return None
+    return router.db_for_write(apps.get_model(cascade[0][0]), instance=instance)
+
+
+def iter_soft_delete_cascade(instance, result, sample_size=SOFT_DELETE_SAMPLE_SIZE, batch_size=None):
+    """
+    Steps of soft_delete_cascade, yields after every UPDATE (of at most batch_size rows, when given), counts are added to result.
+    Steps can run in separate transactions (see jobs.SoftDeleteCascadeJob), after an interruption iteration can start
+    from the beginning with the result collected so far, rows deleted before are skipped by the UPDATEs
+    """
+    using = get_cascade_alias(instance)
+    deleted_at = instance.deleted_at or timezone.now()
+
+    # (model label, pks of deleted parents) of the current level, a subquery below the first level
+    level = [(instance._meta.label_lower, [instance.pk])]
+    while level:
+        next_level = []
+        for parent_label, parents in level:
+            for child_label, parent_field in SOFT_DELETE_CASCADE.get(parent_label, []):
+                child_model = apps.get_model(child_label)
+                children = child_model._base_manager.using(using).filter(
+                    **{f"{parent_field}__in": parents}, is_deleted=False,
+                )
+                while True:
+                    count = _soft_delete_children(child_model, children, deleted_at, sample_size, batch_size, result)
+                    yield result
+                    if not batch_size or count < batch_size:
+                        break
+
+                if child_label in SOFT_DELETE_CASCADE:
+                    next_level.append((child_label, child_model._base_manager.using(using).filter(
+                        **{f"{parent_field}__in": parents}, is_deleted=True, deleted_at=deleted_at,
+                    ).values("pk")))
+        level = next_level
+
+
+def _soft_delete_children(model, children, deleted_at, sample_size, batch_size, result):
+    label = model._meta.label_lower
+    summary = result.get(label, {"count": 0, "sample": []})
+    if batch_size:
+        children = model._base_manager.using(children.db).filter(pk__in=children.order_by("pk").values("pk")[:batch_size])
+
+    if len(summary["sample"]) < sample_size:
+        name_field = model.USERNAME_FIELD if hasattr(model, "USERNAME_FIELD") else "name"
+        sample = list(children.order_by("pk").values_list(name_field, flat=True)[:sample_size - len(summary["sample"])])
+        if not sample:
+            # nothing left to delete
+            return 0
+        summary["sample"].extend(sample)
+
+    values = {"is_deleted": True, "deleted_at": deleted_at}
+    if hasattr(model, "token_version"):
+        values["token_version"] = F("token_version") + 1
+        user_ids = list(children.values_list("pk", flat=True))
+        children = model._base_manager.using(children.db).filter(pk__in=user_ids)
+        _forget_token_versions_on_commit(user_ids, children.db)
+
+    count = children.update(**values)
+    if count:
+        summary["count"] += count
+        result[label] = summary
+    return count
+
+
+def _forget_token_versions_on_commit(user_ids, using):
+    from user_management.token_versions import forget_token_versions
+
+    transaction.on_commit(lambda: forget_token_versions(user_ids), using=using)
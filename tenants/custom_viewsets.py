@@ -1,60 +1,291 @@
+import csv
+import json
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router, transaction, DEFAULT_DB_ALIAS
+from django.http import StreamingHttpResponse
 from rest_framework import status
-from rest_framework.exceptions import PermissionDenied, NotFound
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.viewsets import ModelViewSet
+from tenants.cascade import soft_delete_cascade
+from tenants.jobs import enqueue_job
 from tenants.mixins import TenantMixin
-from user_management.models import BaseUser
+from tenants.replicas import is_user_pinned_to_primary, set_read_intent
+from tenants.serializers import JobSerializer
+from user_management.models import ScopedUserMixin
 from django.views.decorators.csrf import csrf_exempt
 
 
 
-class TenantScopedModelViewSet(TenantMixin, ModelViewSet):
+class AsyncReadMixin:
+    """
+    Serves list and retrieve with async ORM when app runs under ASGI (SERVER_MODE = "asgi").
+    Authentication and permission checks still run in sync code (request thread),
+    other actions, and every action under WSGI, go through regular sync dispatch.
+    """
+    async_actions = ("list", "retrieve")
+    # relations accessed by serializer, async views must not fetch them lazily
+    read_select_related = ()
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        async_methods = {method for method, action in actions.items() if action in cls.async_actions}
+        if settings.SERVER_MODE != "asgi" or not async_methods:
+            # under WSGI async view would be wrapped in async_to_sync (new event loop) on every request
+            return view
+
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method.lower() not in async_methods:
+                return await sync_view(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        # cls, initkwargs, actions and csrf_exempt are copied from sync view
+        update_wrapper(async_view, view)
+        del async_view.__wrapped__
+        return async_view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        Async counterpart of APIView.dispatch
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f"a{self.action}")
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def alist(self, request, *args, **kwargs):
+        if self.paginator is not None and not hasattr(self.paginator, "apaginate_queryset"):
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).select_related(*self.read_select_related)
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer([obj async for obj in queryset], many=True)
+        return Response(serializer.data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    async def aget_object(self):
+        user = self.request.user
+        model = self.queryset.model
+        obj_id = self.kwargs.get("pk")
+        queryset = self.get_queryset().select_related(*self.read_select_related)
+        return await user.aget_limited_object(model, obj_id, queryset=queryset)
+
+
+class _EchoBuffer:
+    """
+    csv.writer target, returns written line instead of storing it
+    """
+    def write(self, value):
+        return value
+
+
+async def _aiterate(iterator):
+    # under ASGI sync iterators of streaming responses are read into memory as a whole,
+    # chunks are pulled one by one in the request thread instead
+    sentinel = object()
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(iterator, sentinel)
+        if chunk is sentinel:
+            return
+        yield chunk
+
+
+class StreamingExportMixin:
+    """
+    GET <list url>/export/?type=ndjson|csv streams every row of the list (same scope and serializer, no pagination).
+    Rows are read with a server-side cursor in chunks of export_chunk_size, so memory stays constant for any tenant size
+    """
+    export_types = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+    }
+    export_chunk_size = 2000
+    # relations accessed by serializer, loaded with the rows instead of a query per row
+    export_select_related = ()
+
+    @action(detail=False, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        export_type = request.query_params.get("type", "ndjson")
+        if export_type not in self.export_types:
+            raise ValidationError({"type": f"Unsupported export type, use one of: {', '.join(self.export_types)}"})
+
+        queryset = self.filter_queryset(self.get_queryset()).select_related(*self.export_select_related).order_by("pk")
+        rows = self.export_rows(queryset)
+        chunks = self.export_csv(rows) if export_type == "csv" else self.export_ndjson(rows)
+
+        if settings.SERVER_MODE == "asgi":
+            chunks = _aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=self.export_types[export_type])
+        response["Content-Disposition"] = f'attachment; filename="{self.basename}.{export_type}"'
+        return response
+
+    def export_rows(self, queryset):
+        serializer = self.get_serializer()
+        for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+            yield serializer.to_representation(obj)
+
+    def export_ndjson(self, rows):
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(row, cls=JSONEncoder))
+            if len(lines) >= self.export_chunk_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    def export_csv(self, rows):
+        writer = csv.writer(_EchoBuffer())
+        lines = []
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row)
+                lines.append(writer.writerow(header))
+            lines.append(writer.writerow([row.get(column) for column in header]))
+            if len(lines) >= self.export_chunk_size:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+
+class BackgroundJobMixin:
+    """
+    Writes that can run in the job worker (tenants/jobs.py) instead of the request. Clients opt in with
+    "Prefer: respond-async" header, the request only validates and responds 202 Accepted with the job to poll at /api/jobs/<id>/
+    """
+    def wants_background_job(self, request):
+        return "respond-async" in request.headers.get("Prefer", "")
+
+    def job_accepted(self, job):
+        url = reverse("job-detail", kwargs={"pk": job.pk}, request=self.request)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={"Location": url})
+
+
+class BulkCreateMixin:
+    """
+    POST <list url>/bulk/ creates a list of objects at once, with the same serializer and role/scope checks as create.
+    The whole list is validated before anything is written and inserted with bulk_create, in batches of bulk_create_batch_size.
+    With "Prefer: respond-async" the validated list is created by a background job (see BackgroundJobMixin)
+    """
+    bulk_create_max_size = 10000
+    bulk_create_batch_size = 1000
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False, max_length=self.bulk_create_max_size)
+        serializer.is_valid(raise_exception=True)
+        if self.wants_background_job(request):
+            payload = serializer.to_job_payload()
+            job = enqueue_job("bulk_create", payload, tenant=self.get_tenant(), user=request.user, total=len(payload["items"]))
+            return self.job_accepted(job)
+
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["bulk_create_batch_size"] = self.bulk_create_batch_size
+        return context
+
+
+class TenantScopedModelViewSet(BackgroundJobMixin, TenantMixin, ModelViewSet):
+    # actions read from replicas, unless the user wrote something recently (see TenantMiddleware.pin_writer)
+    replica_actions = ("list", "retrieve", "export")
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions and not is_user_pinned_to_primary(request.user.pk):
+            set_read_intent(True)
 
     def get_queryset(self):
         user = self.request.user
 
-        if not user.is_authenticated or not isinstance(user, BaseUser):
+        if not user.is_authenticated or not isinstance(user, ScopedUserMixin):
             return super().get_queryset().none()
 
         model = self.queryset.model
-        return user.get_limited_queryset(model)
+        queryset = user.get_limited_queryset(model)
+        # columns read by the serializer (local_ids of parents), rows are serialized without further queries
+        annotate_queryset = getattr(self.get_serializer_class(), "annotate_queryset", None)
+        return annotate_queryset(queryset) if annotate_queryset else queryset
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         tenant = self.get_tenant()
         context["tenant"] = tenant
+        user = self.request.user
+        if user.is_authenticated and isinstance(user, ScopedUserMixin):
+            context["is_admin"] = user.is_admin()
         return context
 
     def soft_delete_cascade(self, instance):
-        soft_deleted_objects = []
-        for relation in instance._meta.related_objects:
-            # I'm ignoring ManyToMany relations, because they dont exist in current implementation
-            if not relation.auto_created or not relation.related_model:
-                continue
-
-            accessor = relation.get_accessor_name()
-            related_manager = getattr(instance, accessor, None)
-            if related_manager:
-                for obj in related_manager.all():
-                    if hasattr(obj, "is_deleted"):
-                        if not obj.is_deleted:
-                            soft_deleted_objects.append(str(obj))
-                            obj.soft_delete()
-        return soft_deleted_objects
+        return soft_delete_cascade(instance)
 
     def soft_delete(self, instance):
         if instance.is_deleted:
             return Response({"soft_deletion": f"{instance} is already soft deleted"},status=status.HTTP_410_GONE)
 
-        instance.soft_delete()
+        if self.wants_background_job(self.request):
+            # the object disappears right away, its descendants are soft deleted by the job
+            using = router.db_for_write(type(instance), instance=instance)
+            with transaction.atomic(using=using), transaction.atomic(using=DEFAULT_DB_ALIAS):
+                instance.soft_delete()
+                job = enqueue_job(
+                    "soft_delete_cascade", {"model": instance._meta.label_lower, "pk": instance.pk},
+                    tenant=self.get_tenant(), user=self.request.user,
+                )
+            return self.job_accepted(job)
 
-        soft_deleted_objects = self.soft_delete_cascade(instance)
+        with transaction.atomic(using=router.db_for_write(type(instance), instance=instance)):
+            instance.soft_delete()
+            soft_deleted_objects = self.soft_delete_cascade(instance)
 
         return Response({"soft_deletion": f"Performed soft delete on {instance}", "soft_deletion_cascade": soft_deleted_objects}, status=status.HTTP_204_NO_CONTENT)
 
     def destroy(self, request, *args, **kwargs):
         user = self.request.user
-        if not user.is_authenticated or not isinstance(user, BaseUser):
+        if not user.is_authenticated or not isinstance(user, ScopedUserMixin):
             raise PermissionDenied("Authentication is required for access")
 
         if user.is_admin() or user.is_superuser:
@@ -67,6 +298,6 @@ class TenantScopedModelViewSet(TenantMixin, ModelViewSet):
         user = self.request.user
         model = self.queryset.model
         obj_id = self.kwargs.get("pk")
-        return user.get_limited_object(model, obj_id)
+        return user.get_limited_object(model, obj_id, queryset=self.get_queryset())
 
 
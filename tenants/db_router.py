@@ -1,14 +1,64 @@
-from .middleware import get_current_tenant
+from django.db import DEFAULT_DB_ALIAS
+
+from .replicas import get_primary_alias, get_read_alias, is_replica, mark_written, wants_replica
+from .sharding import SHARDED_MODELS, get_current_shard
+
 
 class TenantDatabaseRouter:
+    """
+    Routes organizations, departments, customers and users to the shard of their tenant (Tenant.db_alias).
+    Instances stay on the database they were loaded from, new ones go to the shard of their parent object,
+    queries without instance go to the shard of the current request (see TenantMiddleware and sharding.use_shard).
+    Tenant and Domain (shard map) always live in default database.
+
+    Reads of sharded models go to a read replica of the shard while a request asked for it (see replicas.read_from_replica),
+    writes always go to the primary and keep following reads of the request on it.
+    """
+
+    def _db_for_model(self, model, **hints):
+        label = model._meta.label_lower
+        if label in ("tenants.tenant", "tenants.domain"):
+            return DEFAULT_DB_ALIAS
+        if label not in SHARDED_MODELS:
+            # permissions, groups, m2m rows... follow the instance they are accessed from
+            return None
+
+        instance = hints.get("instance")
+        if instance is not None:
+            if instance._meta.label_lower == "tenants.tenant":
+                # related objects of a tenant (tenant.organizations, assigning tenant_scope...)
+                return instance.db_alias
+            if isinstance(instance, model) and instance._state.adding:
+                shard_alias = instance.get_shard_alias()
+                if shard_alias:
+                    return shard_alias
+            if instance._state.db:
+                return instance._state.db
+
+        return get_current_shard() or DEFAULT_DB_ALIAS
+
     def db_for_read(self, model, **hints):
-        tenant = get_current_tenant()
-        if tenant:
-            return tenant.db_alias
-        return None
+        alias = self._db_for_model(model, **hints)
+        if model._meta.label_lower not in SHARDED_MODELS or not wants_replica() or is_replica(alias):
+            return alias
+        return get_read_alias(alias)
 
     def db_for_write(self, model, **hints):
-        tenant = get_current_tenant()
-        if tenant:
-            return tenant.db_alias
-        return None
\ No newline at end of file
+        alias = self._db_for_model(model, **hints)
+        mark_written()
+        return get_primary_alias(alias)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every shard has a mirrored row of its tenants
+        if obj1._meta.label_lower == "tenants.tenant" or obj2._meta.label_lower == "tenants.tenant":
+            return True
+        # rows read from a replica relate to rows of its primary
+        if obj1._state.db and obj2._state.db and get_primary_alias(obj1._state.db) == get_primary_alias(obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive schema changes from their primary
+        if is_replica(db):
+            return False
+        return None
@@ -16,4 +16,20 @@ def tenant_scope_required(cls):
         return original_dispatch(self, request, *args, **kwargs)
 
     cls.dispatch = new_dispatch
-    return cls
\ No newline at end of file
+
+    # async read views (AsyncReadMixin) bypass dispatch
+    if hasattr(cls, "adispatch"):
+        original_adispatch = cls.adispatch
+
+        @wraps(original_adispatch)
+        async def new_adispatch(self, request, *args, **kwargs):
+            tenant = get_current_tenant()
+
+            if not tenant:
+                return HttpResponseForbidden("Tenant not found or not authorized.")
+
+            kwargs["tenant"] = tenant
+            return await original_adispatch(self, request, *args, **kwargs)
+
+        cls.adispatch = new_adispatch
+    return cls
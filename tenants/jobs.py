@@ -0,0 +1,235 @@
+import logging
+from abc import ABC, abstractmethod
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import router, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+from .cascade import get_cascade_alias, iter_soft_delete_cascade
+from .models import Job, Tenant
+from .sharding import use_shard
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_jobs_setting(name):
+    defaults = {"BATCH_SIZE": 1000, "POLL_INTERVAL": 1.0, "STALE_AFTER": 60, "MAX_ATTEMPTS": 3}
+    return getattr(settings, "JOBS", {}).get(name, defaults[name])
+
+
+class JobTakenOver(Exception):
+    """
+    Job was claimed by another worker after heartbeats of this one stopped, this worker must not write to it anymore
+    """
+
+
+class JobHandler(ABC):
+    """
+    Runs one kind of job in batches. Every batch saves its checkpoint in the same transaction as its data when
+    both live in one database (see save_progress), a handler created again for the same job continues from the checkpoint
+    """
+    kind = None
+
+    def __init__(self, job, batch_size):
+        self.job = job
+        self.batch_size = batch_size
+
+    @abstractmethod
+    def run_batch(self):
+        """
+        Runs the next batch and saves progress, returns True when the job is finished
+        """
+
+    def get_result(self):
+        return self.job.result
+
+    def data_transaction(self, using):
+        """
+        Transaction of a batch on the data database and of its checkpoint in the jobs database
+        """
+        stack = ExitStack()
+        stack.enter_context(transaction.atomic(using=using))
+        stack.enter_context(transaction.atomic(using=DEFAULT_DB_ALIAS))
+        return stack
+
+    def save_progress(self, **changes):
+        """
+        Saves changes only while the job belongs to this worker, raises JobTakenOver (rolling back the batch) otherwise
+        """
+        changes["heartbeat_at"] = timezone.now()
+        if not Job.objects.filter(pk=self.job.pk, worker=self.job.worker).update(**changes):
+            raise JobTakenOver(self.job.pk)
+        for field, value in changes.items():
+            setattr(self.job, field, value)
+
+
+class SoftDeleteCascadeJob(JobHandler):
+    """
+    Soft deletion cascade of an object that was already soft deleted by the request, batch_size rows per UPDATE.
+    payload: {"model": label, "pk": pk}, checkpoint: {"result": counts collected so far}
+    """
+    kind = "soft_delete_cascade"
+
+    def __init__(self, job, batch_size):
+        super().__init__(job, batch_size)
+        self._steps = None
+        self._result = job.checkpoint.get("result", {})
+
+    def run_batch(self):
+        if self._steps is None:
+            model = apps.get_model(self.job.payload["model"])
+            instance = model._base_manager.using(self.job.tenant.db_alias).get(pk=self.job.payload["pk"])
+            self._using = get_cascade_alias(instance)
+            if self._using is None:
+                return True
+            # rows deleted before an interruption are skipped, counts of them come from the checkpoint
+            self._steps = iter_soft_delete_cascade(instance, self._result, batch_size=self.batch_size)
+
+        with self.data_transaction(self._using):
+            finished = next(self._steps, None) is None
+            self.save_progress(
+                checkpoint={"result": self._result},
+                processed=sum(summary["count"] for summary in self._result.values()),
+            )
+        return finished
+
+    def get_result(self):
+        return self._result
+
+
+class BulkCreateJob(JobHandler):
+    """
+    Bulk creation of validated objects (see BulkScopedListSerializer.to_job_payload), batch_size objects per batch.
+    payload: {"model": label, "items": [{field: value or id of related object}]}, checkpoint: {"offset": created items}.
+    Names are unique, items of a batch whose checkpoint wasn't saved (data on another shard) are skipped when they exist
+    """
+    kind = "bulk_create"
+
+    def run_batch(self):
+        model = apps.get_model(self.job.payload["model"])
+        items = self.job.payload["items"]
+        offset = self.job.checkpoint.get("offset", 0)
+        batch = items[offset:offset + self.batch_size]
+
+        instances = self.build_instances(model, batch)
+        using = router.db_for_write(model, instance=instances[0]) if instances else DEFAULT_DB_ALIAS
+        with self.data_transaction(using):
+            existing = set(model._base_manager.using(using).filter(name__in=[item["name"] for item in batch]).values_list("name", flat=True))
+            model.bulk_create_for_tenant([instance for instance in instances if instance.name not in existing], self.job.tenant)
+            self.save_progress(checkpoint={"offset": offset + len(batch)}, processed=offset + len(batch))
+        return offset + len(batch) >= len(items)
+
+    def build_instances(self, model, items):
+        """
+        Instances of the items, related objects of all of them are fetched with one query per field (ancestry is copied from them)
+        """
+        related = {}
+        for field in model._meta.concrete_fields:
+            if field.is_relation and any(field.name in item for item in items):
+                ids = {item[field.name] for item in items if item.get(field.name) is not None}
+                related[field.name] = field.related_model._base_manager.using(self.job.tenant.db_alias).in_bulk(ids)
+
+        instances = []
+        for item in items:
+            values = {field: related[field][value] if field in related else value for field, value in item.items()}
+            instances.append(model(**values))
+        return instances
+
+    def get_result(self):
+        return {"created": self.job.processed}
+
+
+class CreateTenantJob(JobHandler):
+    """
+    Tenant with its schema and domain, payload: validated data of TenantSerializer
+    """
+    kind = "create_tenant"
+
+    def run_batch(self):
+        from .serializers import TenantSerializer
+
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            # tenant created by an interrupted run
+            tenant = Tenant.objects.filter(name=self.job.payload["name"]).first()
+            if tenant is None:
+                tenant = TenantSerializer().create(dict(self.job.payload))
+            self.save_progress(tenant=tenant, processed=1, result={"id": tenant.id})
+        return True
+
+
+JOB_HANDLERS = {handler.kind: handler for handler in (SoftDeleteCascadeJob, BulkCreateJob, CreateTenantJob)}
+
+
+def enqueue_job(kind, payload, tenant=None, user=None, total=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}', use one of: {', '.join(JOB_HANDLERS)}")
+    return Job.objects.create(
+        kind=kind, payload=payload, tenant=tenant, total=total,
+        created_by_id=user.pk if user is not None and user.is_authenticated else None,
+    )
+
+
+def claim_job(worker):
+    """
+    Oldest pending job, or running job whose worker stopped sending heartbeats, marked as running by this worker.
+    Jobs of tenants that are being moved to another shard wait until the move is finished
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=get_jobs_setting("STALE_AFTER"))
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        job = (
+            Job.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(Q(status=Job.Status.PENDING) | Q(status=Job.Status.RUNNING, heartbeat_at__lt=stale_before))
+            .exclude(tenant__is_migrating=True)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.attempts += 1
+        if job.attempts > get_jobs_setting("MAX_ATTEMPTS"):
+            job.status = Job.Status.FAILED
+            job.error = f"Job was interrupted {job.attempts - 1} times."
+            job.finished_at = now
+        else:
+            job.status = Job.Status.RUNNING
+            job.worker = worker
+            job.heartbeat_at = now
+            job.started_at = job.started_at or now
+        job.save(update_fields=["attempts", "status", "error", "finished_at", "worker", "heartbeat_at", "started_at"])
+    return job if job.status == Job.Status.RUNNING else None
+
+
+def run_job(job, batch_size=None):
+    """
+    Runs a claimed job to the end, batch by batch, failures are stored in the job.
+    A job taken over by another worker is left to it, this worker stops without saving anything
+    """
+    handler = JOB_HANDLERS[job.kind](job, batch_size or get_jobs_setting("BATCH_SIZE"))
+    try:
+        with use_shard(job.tenant.db_alias if job.tenant else None):
+            while not handler.run_batch():
+                pass
+    except JobTakenOver:
+        logger.warning("Job %s was taken over by another worker, %s stopped", job.pk, job.worker)
+        return job
+    except Exception as exc:
+        logger.exception("Job %s failed", job.pk)
+        job.status = Job.Status.FAILED
+        job.error = str(exc)
+    else:
+        job.status = Job.Status.SUCCEEDED
+        job.result = handler.get_result()
+    job.finished_at = timezone.now()
+    finished = Job.objects.filter(pk=job.pk, worker=job.worker).update(
+        status=job.status, error=job.error, result=job.result, finished_at=job.finished_at,
+    )
+    if not finished:
+        logger.warning("Job %s was taken over by another worker, %s didn't save its end", job.pk, job.worker)
+    return job
@@ -0,0 +1,232 @@
+import threading
+from abc import ABC, abstractmethod
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+
+# Counters of every tenant: "<model>_model" for organizations, departments and customers, "<lowest scope>_user" for users
+LOCAL_ID_COUNTERS = (
+    "organization_model",
+    "department_model",
+    "customer_model",
+    "tenant_user",
+    "organization_user",
+    "department_user",
+    "customer_user",
+)
+
+
+def _counter_table():
+    return apps.get_model("tenants", "LocalIdCounter")._meta.db_table
+
+
+class LocalIdAllocator(ABC):
+    """
+    Hands out local_ids of a tenant (its schema_name), separately for every counter of LOCAL_ID_COUNTERS.
+    State of a tenant (last handed out value of every counter) can be moved to another database (see move_tenant_shard)
+    """
+    def create_tenant(self, schema_name, using):
+        """
+        Prepares counters of a new tenant, called after its schema was created
+        """
+        pass
+
+    def delete_tenant(self, schema_name, using):
+        """
+        Drops counters of a tenant that are not stored in its schema
+        """
+        pass
+
+    @abstractmethod
+    def allocate(self, schema_name, counter, count, using):
+        """
+        Returns count new local_ids of the counter, in ascending order
+        """
+
+    @abstractmethod
+    def get_state(self, schema_name, using):
+        """
+        {counter: last handed out value} of the tenant, 0 for counters that weren't used yet
+        """
+
+    @abstractmethod
+    def set_state(self, schema_name, state, using):
+        """
+        Continues counters of the tenant after given {counter: last handed out value}
+        """
+
+
+class SequenceAllocator(LocalIdAllocator):
+    """
+    Postgres sequence per counter in the schema of the tenant (7 sequences per tenant), one nextval() round trip per allocation.
+    Values of rolled back transactions are lost (gaps)
+    """
+    def sequence_name(self, schema_name, counter):
+        return f"{schema_name}.{counter}_local_id"
+
+    def create_tenant(self, schema_name, using):
+        with connections[using].cursor() as cursor:
+            for counter in LOCAL_ID_COUNTERS:
+                cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {self.sequence_name(schema_name, counter)} START WITH 1")
+
+    def allocate(self, schema_name, counter, count, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT nextval('{self.sequence_name(schema_name, counter)}') FROM generate_series(1, %s)", [count]
+            )
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def get_state(self, schema_name, using):
+        state = {}
+        with connections[using].cursor() as cursor:
+            for counter in LOCAL_ID_COUNTERS:
+                cursor.execute(f"SELECT last_value, is_called FROM {self.sequence_name(schema_name, counter)}")
+                last_value, is_called = cursor.fetchone()
+                state[counter] = last_value if is_called else last_value - 1
+        return state
+
+    def set_state(self, schema_name, state, using):
+        self.create_tenant(schema_name, using)
+        with connections[using].cursor() as cursor:
+            for counter, value in state.items():
+                sequence_name = self.sequence_name(schema_name, counter)
+                if value > 0:
+                    cursor.execute("SELECT setval(%s, %s, true)", [sequence_name, value])
+                else:
+                    cursor.execute("SELECT setval(%s, 1, false)", [sequence_name])
+
+
+class CounterTableAllocator(LocalIdAllocator):
+    """
+    Row per tenant and counter in tenants_localidcounter (no sequences), incremented with one upsert per allocation.
+    The upsert is part of the current transaction: rolled back inserts leave no gaps, but concurrent inserts of one tenant
+    wait for each other until the transaction that allocated first commits
+    """
+    def allocate(self, schema_name, counter, count, using):
+        last_value = self._increment(connections[using], schema_name, counter, count)
+        return list(range(last_value - count + 1, last_value + 1))
+
+    def _increment(self, connection, schema_name, counter, count):
+        """
+        Adds count to the counter (created on first use), returns its new value
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {_counter_table()} AS counter (schema_name, name, value) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (schema_name, name) DO UPDATE SET value = counter.value + EXCLUDED.value "
+                f"RETURNING value",
+                [schema_name, counter, count],
+            )
+            return cursor.fetchone()[0]
+
+    def delete_tenant(self, schema_name, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {_counter_table()} WHERE schema_name = %s", [schema_name])
+
+    def get_state(self, schema_name, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"SELECT name, value FROM {_counter_table()} WHERE schema_name = %s", [schema_name])
+            values = dict(cursor.fetchall())
+        return {counter: values.get(counter, 0) for counter in LOCAL_ID_COUNTERS}
+
+    def set_state(self, schema_name, state, using):
+        self._set_values(connections[using], schema_name, state)
+
+    def _set_values(self, connection, schema_name, state):
+        with connection.cursor() as cursor:
+            for counter, value in state.items():
+                cursor.execute(
+                    f"INSERT INTO {_counter_table()} (schema_name, name, value) VALUES (%s, %s, %s) "
+                    f"ON CONFLICT (schema_name, name) DO UPDATE SET value = EXCLUDED.value",
+                    [schema_name, counter, value],
+                )
+
+
+class HiLoAllocator(CounterTableAllocator):
+    """
+    Every process reserves blocks of block_size values in tenants_localidcounter and hands them out from memory,
+    so most allocations need no query at all. Blocks are reserved on a separate autocommit connection,
+    a rolled back transaction can't return a block that was already handed out.
+    Values are unique, but not ordered by time of insert across processes, and unused rest of a block is lost on restart
+    """
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.LOCAL_IDS.get("HILO_BLOCK_SIZE", 100)
+        self._lock = threading.Lock()
+        # (using, schema_name, counter) -> [next value, last value of the reserved block]
+        self._blocks = {}
+        self._connections = {}
+
+    def reset(self):
+        """
+        Forgets reserved blocks (their unused values are lost)
+        """
+        with self._lock:
+            self._blocks.clear()
+
+    def allocate(self, schema_name, counter, count, using):
+        key = (using, schema_name, counter)
+        values = []
+        with self._lock:
+            while len(values) < count:
+                block = self._blocks.get(key)
+                if block is None or block[0] > block[1]:
+                    block = self._blocks[key] = self._reserve_block(schema_name, counter, max(self.block_size, count - len(values)), using)
+
+                taken = min(count - len(values), block[1] - block[0] + 1)
+                values.extend(range(block[0], block[0] + taken))
+                block[0] += taken
+        return values
+
+    def set_state(self, schema_name, state, using):
+        # written on the reservation connection, otherwise reservations would wait for the transaction that sets the state
+        with self._lock:
+            self._set_values(self._reservation_connection(using), schema_name, state)
+            for counter in state:
+                self._blocks.pop((using, schema_name, counter), None)
+
+    def _reserve_block(self, schema_name, counter, size, using):
+        try:
+            last_value = self._increment(self._reservation_connection(using), schema_name, counter, size)
+        except DatabaseError:
+            # connection could have been closed by the server, reconnect once
+            self._connections.pop(using).close()
+            last_value = self._increment(self._reservation_connection(using), schema_name, counter, size)
+        return [last_value - size + 1, last_value]
+
+    def _reservation_connection(self, using):
+        """
+        Separate autocommit connection to the database, reservations are committed right away
+        """
+        if using not in self._connections:
+            connection = connections.create_connection(using)
+            # shared by every thread of the process, access is serialized by self._lock
+            connection.inc_thread_sharing()
+            self._connections[using] = connection
+        return self._connections[using]
+
+
+LOCAL_ID_ALLOCATORS = {
+    "sequence": SequenceAllocator,
+    "counter": CounterTableAllocator,
+    "hilo": HiLoAllocator,
+}
+
+_allocators = {}
+
+
+def get_local_id_allocator_name():
+    return settings.LOCAL_IDS.get("ALLOCATOR", "sequence")
+
+
+def get_local_id_allocator(name=None):
+    """
+    Allocator selected by LOCAL_IDS["ALLOCATOR"] (or given name), one instance per process
+    """
+    name = name or get_local_id_allocator_name()
+    if name not in _allocators:
+        if name not in LOCAL_ID_ALLOCATORS:
+            raise ValueError(f"Unknown local_id allocator '{name}', use one of: {', '.join(LOCAL_ID_ALLOCATORS)}")
+        _allocators[name] = LOCAL_ID_ALLOCATORS[name]()
+    return _allocators[name]
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, DatabaseError
+
+from tenants.local_ids import LOCAL_ID_ALLOCATORS, get_local_id_allocator
+from tenants.models import Tenant
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies local_id counters of every tenant from one allocator to another, run it before changing LOCAL_ID_ALLOCATOR "
+        "(counters of the target only move forward, so it can be run again right after the switch)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", choices=list(LOCAL_ID_ALLOCATORS), help="allocator used until now")
+        parser.add_argument("target", choices=list(LOCAL_ID_ALLOCATORS), help="allocator that will be used")
+
+    def handle(self, *args, **options):
+        source = get_local_id_allocator(options["source"])
+        target = get_local_id_allocator(options["target"])
+        if isinstance(source, type(target)) or isinstance(target, type(source)):
+            # counter and hilo share tenants_localidcounter
+            raise CommandError(f"'{options['source']}' and '{options['target']}' use the same counters, nothing to copy")
+
+        tenants = Tenant.objects.order_by("pk")
+        for tenant in tenants:
+            schema_name = tenant.get_schema_name()
+            using = tenant.db_alias
+            state = source.get_state(schema_name, using)
+            target_state = self._get_target_state(target, schema_name, using)
+            target.set_state(
+                schema_name, {counter: max(value, target_state.get(counter, 0)) for counter, value in state.items()}, using,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Counters of {tenants.count()} tenants were copied from '{options['source']}' to '{options['target']}'"
+        ))
+
+    def _get_target_state(self, target, schema_name, using):
+        try:
+            with transaction.atomic(using=using):
+                return target.get_state(schema_name, using)
+        except DatabaseError:
+            # sequences of the tenant weren't created yet
+            return {}
@@ -0,0 +1,175 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from tenants.local_ids import get_local_id_allocator
+from tenants.models import Tenant, Organization, Department, Customer
+from tenants.sharding import get_shard_aliases, mirror_tenant
+from user_management.models import BaseUser
+from user_management.token_versions import forget_token_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves data of a tenant to another shard. "
+        "Tenant stays readable during the move, writes are rejected (503) until data is switched to the target shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=int)
+        parser.add_argument("target", help="database alias of the target shard")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--keep-source", action="store_true", help="moved rows are not deleted from the source shard")
+        parser.add_argument(
+            "--cache-wait",
+            type=float,
+            default=None,
+            help=(
+                "seconds to wait until other processes drop their cached tenant (defaults to TENANT_CACHE LOCAL_TIMEOUT, "
+                "or SHARED_TIMEOUT when it is longer and no TENANT_CACHE_REDIS_URL is configured)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            tenant = Tenant.objects.get(pk=options["tenant_id"])
+        except Tenant.DoesNotExist:
+            raise CommandError(f"Tenant {options['tenant_id']} does not exist")
+
+        source = tenant.db_alias
+        target = options["target"]
+        if target not in get_shard_aliases():
+            raise CommandError(f"'{target}' is not a registered shard")
+        if source == target:
+            raise CommandError(f"{tenant} is already stored on '{target}'")
+        if tenant.is_migrating:
+            raise CommandError(f"{tenant} is already being moved")
+
+        cache_wait = options["cache_wait"]
+        if cache_wait is None:
+            cache_wait = self.get_default_cache_wait()
+
+        self.stdout.write(f"Moving {tenant} from '{source}' to '{target}'...")
+        self._set_migrating(tenant, True)
+        # processes that cached the tenant before the flag was set could still accept writes
+        time.sleep(cache_wait)
+
+        try:
+            with transaction.atomic(using=target):
+                mirror_tenant(tenant, target)
+                tenant.create_schema(target)
+                self._copy_local_ids(tenant, source, target)
+                counts = self._copy_rows(tenant, source, target, options["batch_size"])
+        except Exception:
+            self._set_migrating(tenant, False)
+            raise
+
+        tenant.db_alias = target
+        tenant.is_migrating = False
+        tenant.save(update_fields=["db_alias", "is_migrating"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{tenant} is served from '{target}': " + ", ".join(f"{count} {name}" for name, count in counts.items())
+        ))
+
+        if not options["keep_source"]:
+            # processes that cached the tenant before the switch still read from the source
+            time.sleep(cache_wait)
+            self._delete_source(tenant, source)
+            self.stdout.write(self.style.SUCCESS(f"Data of {tenant} was deleted from '{source}'"))
+
+    @staticmethod
+    def get_default_cache_wait():
+        tenant_cache = getattr(settings, "TENANT_CACHE", {})
+        cache_wait = tenant_cache.get("LOCAL_TIMEOUT", 30)
+        if not tenant_cache.get("SHARED_URL"):
+            # without redis every process has its own "shared" tier, saving the tenant invalidates only the one
+            # of this process, the others keep the tenant until it expires
+            cache_wait = max(cache_wait, tenant_cache.get("SHARED_TIMEOUT", 300))
+        return cache_wait
+
+    def _set_migrating(self, tenant, is_migrating):
+        tenant.is_migrating = is_migrating
+        tenant.save(update_fields=["is_migrating"])
+
+    def _copy_local_ids(self, tenant, source, target):
+        """
+        local_id counters continue on the target where they stopped on the source
+        """
+        allocator = get_local_id_allocator()
+        schema_name = tenant.get_schema_name()
+        allocator.set_state(schema_name, allocator.get_state(schema_name, source), target)
+
+    def _copy_rows(self, tenant, source, target, batch_size):
+        # parents first, rows keep their ids (id ranges of shards don't overlap)
+        querysets = {
+            "organizations": Organization.objects.using(source).filter(tenant_id=tenant.pk),
+            "departments": Department.objects.using(source).filter(tenant_id=tenant.pk),
+            "customers": Customer.objects.using(source).filter(tenant_id=tenant.pk),
+            "users": BaseUser.objects.using(source).filter(tenant_scope_id=tenant.pk),
+        }
+
+        counts = {}
+        for name, queryset in querysets.items():
+            counts[name] = 0
+            batch = []
+            for obj in queryset.order_by("pk").iterator(chunk_size=batch_size):
+                batch.append(obj)
+                if len(batch) >= batch_size:
+                    counts[name] += len(queryset.model.objects.using(target).bulk_create(batch))
+                    batch = []
+            if batch:
+                counts[name] += len(queryset.model.objects.using(target).bulk_create(batch))
+
+        self._copy_user_relations(tenant, source, target)
+        return counts
+
+    def _copy_user_relations(self, tenant, source, target):
+        """
+        Permission and group ids differ between databases, they are matched by natural keys
+        """
+        target_permissions = {
+            (app_label, codename): permission_id
+            for permission_id, app_label, codename in Permission.objects.using(target).values_list("id", "content_type__app_label", "codename")
+        }
+        permission_ids = {
+            permission_id: target_permissions.get((app_label, codename))
+            for permission_id, app_label, codename in Permission.objects.using(source).values_list("id", "content_type__app_label", "codename")
+        }
+        PermissionThrough = BaseUser.user_permissions.through
+        PermissionThrough.objects.using(target).bulk_create([
+            PermissionThrough(baseuser_id=user_id, permission_id=permission_ids[permission_id])
+            for user_id, permission_id in PermissionThrough.objects.using(source)
+            .filter(baseuser__tenant_scope_id=tenant.pk)
+            .values_list("baseuser_id", "permission_id")
+            if permission_ids.get(permission_id)
+        ])
+
+        GroupThrough = BaseUser.groups.through
+        group_rows = list(
+            GroupThrough.objects.using(source).filter(baseuser__tenant_scope_id=tenant.pk).values_list("baseuser_id", "group__name")
+        )
+        group_ids = {
+            name: Group.objects.using(target).get_or_create(name=name)[0].pk
+            for name in {group_name for _, group_name in group_rows}
+        }
+        GroupThrough.objects.using(target).bulk_create([
+            GroupThrough(baseuser_id=user_id, group_id=group_ids[group_name]) for user_id, group_name in group_rows
+        ])
+
+    def _delete_source(self, tenant, source):
+        user_ids = list(BaseUser.objects.using(source).filter(tenant_scope_id=tenant.pk).values_list("pk", flat=True))
+
+        with transaction.atomic(using=source):
+            BaseUser.objects.using(source).filter(tenant_scope_id=tenant.pk).delete()
+            Organization.objects.using(source).filter(tenant_id=tenant.pk).delete()
+            if source != DEFAULT_DB_ALIAS:
+                Tenant.objects.using(source).filter(pk=tenant.pk).delete()
+            get_local_id_allocator().delete_tenant(tenant.get_schema_name(), source)
+            with connections[source].cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {tenant.get_schema_name()} CASCADE")
+
+        # deletion marks token versions of deleted users, but the users live on under the same ids on the target
+        forget_token_versions(user_ids)
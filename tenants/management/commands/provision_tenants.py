@@ -0,0 +1,194 @@
+import csv
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from tenants.local_ids import get_local_id_allocator_name
+from tenants.models import Tenant, Domain, SpareSchema
+from tenants.schema_pool import claim_spare_schemas, create_tenant_schema, new_schema_uuid, tenant_schema_name
+from tenants.sharding import default_shard_alias, get_shard_aliases
+from tenants.tenant_cache import invalidate_domains
+
+
+def _setup_worker():
+    # spawned processes (non fork start methods) don't inherit configured django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+    django.setup()
+
+
+def create_schemas(alias, schema_uuids):
+    """
+    Creates schemas (with local_id counters) of a chunk in one transaction, runs in a worker process on its own connection
+    """
+    with transaction.atomic(using=alias):
+        for schema_uuid in schema_uuids:
+            create_tenant_schema(tenant_schema_name(schema_uuid), alias)
+    return alias, schema_uuids
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates tenants with their domains and schemas from a CSV or JSON manifest (columns: name, domain_url, optional shard). "
+        "Spare schemas of the pool are used first, the rest of the DDL is spread over a pool of processes (one connection each), "
+        "Tenant and Domain rows are inserted in batches. Prints throughput and time of every phase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="path of a .csv (with header row) or .json (list of objects) file")
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="processes running schema DDL")
+        parser.add_argument("--chunk-size", type=int, default=50, help="schemas created per transaction of a process")
+        parser.add_argument("--batch-size", type=int, default=1000, help="rows per INSERT")
+        parser.add_argument("--no-schema-pool", action="store_true", help="don't claim spare schemas of the pool")
+
+    def handle(self, *args, **options):
+        timings = {}
+        start = time.perf_counter()
+
+        items = self.read_manifest(Path(options["manifest"]))
+        self.validate(items)
+        timings["validate"] = time.perf_counter() - start
+
+        phase_start = time.perf_counter()
+        uuids_by_alias, claimed = self.prepare_schemas(items, options)
+        timings["schemas"] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        try:
+            tenants = self.insert_rows(items, uuids_by_alias, options["batch_size"])
+        except Exception:
+            # created schemas aren't lost, the next provisioning or tenant creation claims them
+            self.return_to_pool(uuids_by_alias)
+            raise
+        timings["rows"] = time.perf_counter() - phase_start
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Provisioned {len(tenants)} tenants in {elapsed:.2f} s ({len(tenants) / elapsed:.0f} tenants/s), "
+            f"{claimed} schemas claimed from the pool"
+        ))
+        for phase, seconds in timings.items():
+            self.stdout.write(f"  {phase}: {seconds:.3f} s")
+
+    def read_manifest(self, path):
+        if not path.exists():
+            raise CommandError(f"Manifest {path} does not exist")
+
+        if path.suffix == ".json":
+            items = json.loads(path.read_text())
+            if not isinstance(items, list):
+                raise CommandError("JSON manifest has to be a list of tenants")
+        elif path.suffix == ".csv":
+            with path.open(newline="") as manifest:
+                items = [{field: value for field, value in row.items() if value} for row in csv.DictReader(manifest)]
+        else:
+            raise CommandError("Manifest has to be a .csv or .json file")
+
+        if not items:
+            raise CommandError("Manifest is empty")
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("name") or not item.get("domain_url"):
+                raise CommandError(f"Row {index + 1}: name and domain_url are required")
+            item.setdefault("shard", default_shard_alias())
+        return items
+
+    def validate(self, items):
+        """
+        Names and domains are unique, checked for the whole manifest with one query each
+        """
+        for field in ("name", "domain_url"):
+            duplicates = sorted(value for value, count in Counter(item[field] for item in items).items() if count > 1)
+            if duplicates:
+                raise CommandError(f"Duplicated {field} in manifest: {', '.join(duplicates[:20])}")
+
+        unknown = sorted({item["shard"] for item in items} - set(get_shard_aliases()))
+        if unknown:
+            raise CommandError(f"Unknown shards: {', '.join(unknown)}")
+
+        existing = sorted(Tenant.objects.filter(name__in=[item["name"] for item in items]).values_list("name", flat=True))
+        if existing:
+            raise CommandError(f"Tenants already exist: {', '.join(existing[:20])}")
+        existing = sorted(Domain.objects.filter(domain_url__in=[item["domain_url"] for item in items]).values_list("domain_url", flat=True))
+        if existing:
+            raise CommandError(f"Domains already exist: {', '.join(existing[:20])}")
+
+    def prepare_schemas(self, items, options):
+        """
+        uuids of ready schemas for every shard ({alias: [uuid]}, as many as tenants of the shard), spare schemas of the pool
+        are claimed first, missing ones are created by a pool of processes
+        """
+        needed = Counter(item["shard"] for item in items)
+        uuids_by_alias = {}
+        claimed = 0
+        for alias, count in needed.items():
+            uuids_by_alias[alias] = [] if options["no_schema_pool"] else claim_spare_schemas(alias, count)
+            claimed += len(uuids_by_alias[alias])
+
+        chunks = []
+        for alias, count in needed.items():
+            missing = [new_schema_uuid() for _ in range(count - len(uuids_by_alias[alias]))]
+            chunks.extend((alias, missing[start:start + options["chunk_size"]]) for start in range(0, len(missing), options["chunk_size"]))
+
+        if not chunks:
+            return uuids_by_alias, claimed
+
+        processes = min(options["processes"], len(chunks))
+        if processes < 2:
+            results = (create_schemas(alias, chunk) for alias, chunk in chunks)
+            self.collect_schemas(results, uuids_by_alias)
+        else:
+            # forked workers open their own connections, they must not inherit (and close) connections of this process
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes, initializer=_setup_worker) as pool:
+                results = pool.map(create_schemas, *zip(*chunks))
+                self.collect_schemas(results, uuids_by_alias)
+        return uuids_by_alias, claimed
+
+    def collect_schemas(self, results, uuids_by_alias):
+        try:
+            for alias, schema_uuids in results:
+                uuids_by_alias[alias].extend(schema_uuids)
+        except Exception:
+            self.return_to_pool(uuids_by_alias)
+            raise
+
+    def insert_rows(self, items, uuids_by_alias, batch_size):
+        """
+        Tenant and Domain rows in default database, and mirrored Tenant rows on other shards, in one transaction per database
+        """
+        available = {alias: iter(uuids) for alias, uuids in uuids_by_alias.items()}
+        tenants = [Tenant(name=item["name"], db_alias=item["shard"], uuid=next(available[item["shard"]])) for item in items]
+
+        aliases = {DEFAULT_DB_ALIAS} | {tenant.db_alias for tenant in tenants}
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(transaction.atomic(using=alias))
+
+            Tenant.objects.bulk_create(tenants, batch_size=batch_size)
+            Domain.objects.bulk_create(
+                [Domain(tenant=tenant, domain_url=item["domain_url"]) for tenant, item in zip(tenants, items)], batch_size=batch_size,
+            )
+            # bulk_create sends no post_save, domains requested before provisioning would stay cached as unknown
+            invalidate_domains(item["domain_url"] for item in items)
+
+            # every shard keeps a mirrored copy of its Tenant rows (see sharding.mirror_tenant)
+            mirrored = defaultdict(list)
+            for tenant in tenants:
+                if tenant.db_alias != DEFAULT_DB_ALIAS:
+                    values = {field.attname: getattr(tenant, field.attname) for field in Tenant._meta.concrete_fields}
+                    mirrored[tenant.db_alias].append(Tenant(**values))
+            for alias, rows in mirrored.items():
+                Tenant.objects.using(alias).bulk_create(rows, batch_size=batch_size)
+        return tenants
+
+    def return_to_pool(self, uuids_by_alias):
+        allocator = get_local_id_allocator_name()
+        for alias, schema_uuids in uuids_by_alias.items():
+            SpareSchema.objects.using(alias).bulk_create([SpareSchema(uuid=schema_uuid, allocator=allocator) for schema_uuid in schema_uuids])
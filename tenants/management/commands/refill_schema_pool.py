@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tenants.schema_pool import get_pool_size, get_schema_pool_setting, refill_schema_pool
+from tenants.sharding import get_shard_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Keeps a pool of spare tenant schemas (with local_id counters) on every shard, new tenants claim one instead of running DDL. "
+        "Creates missing spare schemas and drops surplus ones, once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=None, help="spare schemas per shard (defaults to SCHEMA_POOL SIZE)")
+        parser.add_argument("--shard", action="append", default=None, help="database alias of a shard (repeatable, defaults to every shard)")
+        parser.add_argument("--watch", action="store_true", help="keep refilling every SCHEMA_POOL REFILL_INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        size = options["size"]
+        if size is None:
+            size = get_schema_pool_setting("SIZE")
+        if size < 0:
+            raise CommandError("--size can't be negative")
+
+        aliases = options["shard"] or get_shard_aliases()
+        unknown = set(aliases) - set(get_shard_aliases())
+        if unknown:
+            raise CommandError(f"Unknown shards: {', '.join(sorted(unknown))}")
+
+        while True:
+            for alias in aliases:
+                created, dropped = refill_schema_pool(alias, size)
+                if created or dropped or not options["watch"]:
+                    self.stdout.write(f"{alias}: {get_pool_size(alias)} spare schemas (created {created}, dropped {dropped})")
+            if not options["watch"]:
+                break
+            # idle process doesn't keep connections open
+            connections.close_all()
+            time.sleep(get_schema_pool_setting("REFILL_INTERVAL"))
@@ -0,0 +1,41 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tenants.jobs import claim_job, get_jobs_setting, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs background jobs (soft deletion cascades, bulk imports, tenant creation) one after another. "
+        "Any number of workers can run at once, a job interrupted by a stopped worker is continued from its last checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="exit when no job is waiting instead of polling")
+        parser.add_argument("--batch-size", type=int, default=None, help="objects per batch (defaults to JOBS BATCH_SIZE)")
+        parser.add_argument("--poll-interval", type=float, default=None, help="seconds between polls (defaults to JOBS POLL_INTERVAL)")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        poll_interval = options["poll_interval"]
+        if poll_interval is None:
+            poll_interval = get_jobs_setting("POLL_INTERVAL")
+
+        self.stdout.write(f"Job worker {worker} started")
+        while True:
+            job = claim_job(worker)
+            if job is None:
+                if options["once"]:
+                    break
+                # idle worker doesn't keep connections open
+                connections.close_all()
+                time.sleep(poll_interval)
+                continue
+
+            job = run_job(job, options["batch_size"])
+            style = self.style.SUCCESS if job.status == job.Status.SUCCEEDED else self.style.ERROR
+            self.stdout.write(style(f"Job {job.kind} {job.pk} {job.status} ({job.processed} processed)"))
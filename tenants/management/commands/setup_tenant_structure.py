@@ -1,164 +1,246 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from typing import Dict, List, Any
-
-from tenants.models import Tenant, Domain, Organization, Department, Customer
-from user_management.models import BaseUser, Role
+import csv
+import io
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from tenants.management.commands.provision_tenants import Command as ProvisionTenantsCommand
+from tenants.models import Tenant, Organization, Department, Customer
+from tenants.sharding import default_shard_alias, get_shard_aliases
+from user_management.models import BaseUser
+from user_management.provisioning import provision_users
+
+SCOPE_LEVELS = ("tenant", "organization", "department", "customer")
+
+
+def distribute(total, parents, distribution="uniform", skew=1.2):
+    """
+    Number of children of every parent, total split evenly, or by Zipf weights (1 / rank ** skew) so that the first
+    parents get most of the children and the rest form a long tail. Every parent gets at least one child
+    """
+    if parents <= 0:
+        return []
+    if distribution == "uniform":
+        base, extra = divmod(total, parents)
+        return [max(1, base + (index < extra)) for index in range(parents)]
+
+    # every parent gets one child, the rest is split by weights, rounding leftovers go to the largest parents
+    weights = [1 / rank ** skew for rank in range(1, parents + 1)]
+    remaining = max(0, total - parents)
+    scale = remaining / sum(weights)
+    shares = [weight * scale for weight in weights]
+    counts = [1 + int(share) for share in shares]
+    leftovers = remaining - sum(int(share) for share in shares)
+    for index in range(leftovers):
+        counts[index] += 1
+    return counts
 
 
 class Command(BaseCommand):
-    help = "Sets up initial tenant structure and test users."
-
-    multiplier = 2
-
-    def handle(self, *args, **kwargs):
+    help = (
+        "Sets up tenant structure and test users. Defaults create the example structure (2 tenants, 2 organizations per tenant, "
+        "2 departments per organization, 2 customers per department), options generate large datasets: customers are streamed "
+        "with COPY, other rows are inserted with bulk_create, local_ids are allocated with one query per tenant and batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenants", type=int, default=2, help="number of tenants (besides localhost)")
+        parser.add_argument("--organizations", type=int, default=2, help="average organizations per tenant")
+        parser.add_argument("--departments", type=int, default=2, help="average departments per organization")
+        parser.add_argument("--customers", type=int, default=2, help="average customers per department")
+        parser.add_argument("--users", type=int, default=0, help="average generated users per tenant, spread over scope levels")
+        parser.add_argument(
+            "--distribution", choices=("uniform", "zipf"), default="uniform",
+            help="how children are split between parents, zipf gives a few huge tenants (and organizations, departments) and a long tail",
+        )
+        parser.add_argument("--skew", type=float, default=1.2, help="exponent of the zipf distribution")
+        parser.add_argument("--shards", nargs="+", default=None, help="database aliases tenants are spread over (round robin)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="rows per INSERT and per local_id allocation")
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="processes running schema DDL of tenants")
 
+    def handle(self, *args, **options):
         if Tenant.objects.exists():
             self.stdout.write(self.style.WARNING("Tenants already exist. No objects will be created."))
-        else:
-            self.stdout.write(self.style.SUCCESS("Starting setup..."))
-            with transaction.atomic():
-                test_data = self._setup_test_data()
-            self.stdout.write(self.style.SUCCESS("Tenant structure setup complete"))
-
-    def _setup_test_data(self) :
-        test_data = {
-            "tenants": [],
-            "domains": {},
-            "organizations": {},
-            "departments": {},
-            "customers": {},
-            "users": {
-                "admins": [],
-                "tenants": [],
-                "organizations": [],
-                "departments": [],
-                "customers": [],
-            },
-        }
-
-        self._create_initial_tenant()
-        self._create_tenants_and_domains(test_data)
-        self._create_organizations(test_data)
-        self._create_departments(test_data)
-        self._create_customers(test_data)
-        self._create_users(test_data)
-
-        return test_data
-
-    def _create_initial_tenant(self):
-        tenant, _ = Tenant.objects.get_or_create(name="localhost")
-        Domain.objects.get_or_create(tenant=tenant, domain_url="localhost")
-
-    def _create_tenants_and_domains(self, test_data):
-        for i in range(1, self.multiplier + 1):
-            tenant, _ = Tenant.objects.get_or_create(name=f"Tenant{i}")
-            test_data["tenants"].append(tenant)
-            domain, _ = Domain.objects.get_or_create(
-                tenant=tenant, domain_url=f"tenant{i}.localhost"
-            )
-            test_data["domains"][tenant] = domain
-
-    def _create_organizations(self, test_data):
-        for tenant in test_data["tenants"]:
-            organizations: List[Organization] = []
-            for i in range(1, self.multiplier + 1):
-                org_name = f"Org{i}_{tenant}"
-                organization, _ = Organization.objects.get_or_create(name=org_name, tenant=tenant)
-                organizations.append(organization)
-            test_data["organizations"][tenant] = organizations
-
-    def _create_departments(self, test_data):
-        for tenant, organizations in test_data["organizations"].items():
-            for organization in organizations:
-                departments: List[Department] = []
-                for i in range(1, self.multiplier + 1):
-                    dept_name = f"Dept{i}_{organization}"
-                    department, _ = Department.objects.get_or_create(name=dept_name, organization=organization)
-                    departments.append(department)
-                test_data["departments"][organization] = departments
-
-    def _create_customers(self, test_data):
-        for organization, departments in test_data["departments"].items():
-            for department in departments:
-                customers: List[Customer] = []
-                for i in range(1, self.multiplier + 1):
-                    customer_name = f"Customer{i}_{department}"
-                    customer, _ = Customer.objects.get_or_create(name=customer_name, department=department)
-                    customers.append(customer)
-                test_data["customers"][department] = customers
-
-    def _create_users(self, test_data):
-        admin_user = BaseUser.objects.create_superuser(
-            username="admin_user_1",
-            password="password",
+            return
+
+        shards = options["shards"] or [default_shard_alias()]
+        unknown = sorted(set(shards) - set(get_shard_aliases()))
+        if unknown:
+            raise CommandError(f"Unknown shards: {', '.join(unknown)}")
+
+        self.stdout.write(self.style.SUCCESS("Starting setup..."))
+        self.options = options
+        self.created = Counter()
+        self.timings = {}
+        start = time.perf_counter()
+
+        tenants = self._create_tenants(shards)
+        self._measure("structure", self._create_structure, tenants)
+        self._measure("users", self._create_users, tenants)
+
+        elapsed = time.perf_counter() - start
+        for model, count in self.created.items():
+            self.stdout.write(f"  {model}: {count}")
+        for phase, seconds in self.timings.items():
+            self.stdout.write(f"  {phase}: {seconds:.2f} s")
+        rows = sum(self.created.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Tenant structure setup complete, {rows} rows in {elapsed:.2f} s ({rows / elapsed:.0f} rows/s)"
+        ))
+
+    def _measure(self, phase, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.timings[phase] = time.perf_counter() - start
+        return result
+
+    def _create_tenants(self, shards):
+        """
+        Generated tenants (Tenant1..N) with tenant<i>.localhost domains, and localhost tenant, created like provision_tenants does
+        """
+        items = [{"name": "localhost", "domain_url": "localhost", "shard": default_shard_alias()}]
+        items.extend(
+            {"name": f"Tenant{i}", "domain_url": f"tenant{i}.localhost", "shard": shards[(i - 1) % len(shards)]}
+            for i in range(1, self.options["tenants"] + 1)
         )
-        test_data["users"]["admins"].append(admin_user)
-
-        if len(test_data["tenants"]) >= 2:
-            tenant1, tenant2 = test_data["tenants"][:2]
-            tenant1_user = BaseUser.objects.create_user(
-                username="tenant_user_1",
-                password="password",
-                tenant_scope=tenant1,
-            )
-            tenant2_user = BaseUser.objects.create_user(
-                username="tenant_user_2",
-                password="password",
-                tenant_scope=tenant2,
-            )
-            test_data["users"]["tenants"].extend([tenant1_user, tenant2_user])
-
-            org1 = test_data["organizations"][tenant1][0]
-            org2 = test_data["organizations"][tenant2][0]
-            org1_user = BaseUser.objects.create_user(
-                username="org_user_1",
-                password="password",
-                tenant_scope=tenant1,
-                organization_scope=org1,
-            )
-            org2_user = BaseUser.objects.create_user(
-                username="org_user_2",
-                password="password",
-                tenant_scope=tenant2,
-                organization_scope=org2,
-            )
-            test_data["users"]["organizations"].extend([org1_user, org2_user])
-
-            dept1 = test_data["departments"][org1][0]
-            dept2 = test_data["departments"][org2][0]
-            dept1_user = BaseUser.objects.create_user(
-                username="dept_user_1",
-                password="password",
-                tenant_scope=tenant1,
-                organization_scope=org1,
-                department_scope=dept1,
-            )
-            dept2_user = BaseUser.objects.create_user(
-                username="dept_user_2",
-                password="password",
-                tenant_scope=tenant2,
-                organization_scope=org2,
-                department_scope=dept2,
+
+        provisioning = ProvisionTenantsCommand(stdout=self.stdout, stderr=self.stderr)
+        provisioning.validate(items)
+        start = time.perf_counter()
+        uuids_by_alias, _ = provisioning.prepare_schemas(
+            items, {"no_schema_pool": False, "chunk_size": 50, "processes": self.options["processes"]},
+        )
+        try:
+            tenants = provisioning.insert_rows(items, uuids_by_alias, self.options["batch_size"])
+        except Exception:
+            provisioning.return_to_pool(uuids_by_alias)
+            raise
+        self.timings["tenants"] = time.perf_counter() - start
+        self.created["tenants"] += len(tenants)
+        return tenants[1:]
+
+    def _create_structure(self, tenants):
+        options = self.options
+        organization_counts = distribute(len(tenants) * options["organizations"], len(tenants), options["distribution"], options["skew"])
+
+        self.samples = {}
+        for tenant, organization_count in zip(tenants, organization_counts):
+            organizations = Organization.bulk_create_for_tenant(
+                [Organization(name=f"Org{i}_{tenant}", tenant=tenant) for i in range(1, organization_count + 1)],
+                tenant, options["batch_size"],
             )
-            test_data["users"]["departments"].extend([dept1_user, dept2_user])
-
-            customer1 = test_data["customers"][dept1][0]
-            customer2 = test_data["customers"][dept2][0]
-            customer1_user = BaseUser.objects.create_user(
-                username="customer_user_1",
-                password="password",
-                tenant_scope=tenant1,
-                organization_scope=org1,
-                department_scope=dept1,
-                customer_scope=customer1,
+
+            department_counts = distribute(len(organizations) * options["departments"], len(organizations), options["distribution"], options["skew"])
+            departments = Department.bulk_create_for_tenant(
+                [
+                    Department(name=f"Dept{i}_{organization}", organization=organization)
+                    for organization, count in zip(organizations, department_counts)
+                    for i in range(1, count + 1)
+                ],
+                tenant, options["batch_size"],
             )
-            customer2_user = BaseUser.objects.create_user(
-                username="customer_user_2",
-                password="password",
-                tenant_scope=tenant2,
-                organization_scope=org2,
-                department_scope=dept2,
-                customer_scope=customer2,
+
+            customer_counts = distribute(len(departments) * options["customers"], len(departments), options["distribution"], options["skew"])
+            customers = self._create_customers(tenant, departments, customer_counts)
+
+            self.created["organizations"] += len(organizations)
+            self.created["departments"] += len(departments)
+            # scopes of users of the tenant, first batch of customers only
+            self.samples[tenant] = {
+                "tenant": [tenant], "organization": organizations, "department": departments, "customer": customers,
+            }
+            if options["verbosity"] >= 2:
+                self.stdout.write(
+                    f"{tenant}: {len(organizations)} organizations, {len(departments)} departments, {sum(customer_counts)} customers"
+                )
+
+    def _create_customers(self, tenant, departments, counts):
+        """
+        Customers are streamed to COPY batch by batch, no model instances are built. Returns the first batch as instances
+        """
+        batch_size = self.options["batch_size"]
+        using = router.db_for_write(Customer, instance=Customer(department=departments[0])) if departments else None
+        batch = []
+        for department, count in zip(departments, counts):
+            for i in range(1, count + 1):
+                batch.append((department, i))
+                if len(batch) >= batch_size:
+                    self._copy_customers(tenant, batch, using)
+                    batch = []
+        if batch:
+            self._copy_customers(tenant, batch, using)
+        if not departments:
+            return []
+        return list(Customer.objects.using(using).filter(tenant=tenant).order_by("local_id")[:batch_size])
+
+    def _copy_customers(self, tenant, batch, using):
+        connection = connections[using]
+        fields = [field for field in Customer._meta.concrete_fields if not field.primary_key]
+        name_index, local_id_index = fields.index(Customer._meta.get_field("name")), fields.index(Customer._meta.get_field("local_id"))
+
+        # values of every column come from one instance per department, only name and local_id differ between rows
+        templates = {}
+        for department, _ in batch:
+            if department.pk not in templates:
+                template = Customer(department=department)
+                template.set_ancestry()
+                templates[department.pk] = [field.get_db_prep_save(field.pre_save(template, True), connection) for field in fields]
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for (department, i), local_id in zip(batch, Customer.allocate_local_ids(tenant, len(batch), using)):
+            row = list(templates[department.pk])
+            row[name_index], row[local_id_index] = f"Customer{i}_{department}", local_id
+            writer.writerow(["\\N" if value is None else value for value in row])
+        buffer.seek(0)
+
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(Customer._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer,
             )
-            test_data["users"]["customers"].extend([customer1_user, customer2_user])
+        self.created["customers"] += len(batch)
+
+    def _create_users(self, tenants):
+        BaseUser.objects.create_superuser(username="admin_user_1", password="password")
+        self.created["users"] += 1
+
+        # generated users share one hash, hashing millions of passwords would take longer than everything else
+        password = make_password("password")
+        items = []
+        if len(tenants) >= 2:
+            # example users of the first two tenants, scoped to their first organization, department and customer
+            for number, tenant in enumerate(tenants[:2], start=1):
+                samples = self.samples[tenant]
+                for prefix, level in zip(("tenant", "org", "dept", "customer"), SCOPE_LEVELS):
+                    items.append({"username": f"{prefix}_user_{number}", "password": password, **self._scopes(samples, level, 0)})
+
+        user_counts = distribute(len(tenants) * self.options["users"], len(tenants), self.options["distribution"], self.options["skew"]) if self.options["users"] else []
+        for number, (tenant, count) in enumerate(zip(tenants, user_counts), start=1):
+            samples = self.samples[tenant]
+            for i in range(count):
+                level = SCOPE_LEVELS[i % len(SCOPE_LEVELS)]
+                items.append({"username": f"user{number}_{i + 1}", "password": password, **self._scopes(samples, level, i // len(SCOPE_LEVELS))})
+
+        for start in range(0, len(items), self.options["batch_size"]):
+            users = provision_users(items[start:start + self.options["batch_size"]], self.options["batch_size"], hashed=True)
+            self.created["users"] += len(users)
+
+    def _scopes(self, samples, level, index):
+        """
+        Scope fields of a user of the given level, scoped to one of the sampled objects of that level
+        """
+        scope = samples[level][index % len(samples[level])]
+        # ancestry ids are denormalized on the objects, tenant has to be an object (it selects the shard)
+        scopes = {"tenant_scope": samples["tenant"][0]}
+        if level in ("organization", "department", "customer"):
+            scopes["organization_scope_id"] = scope.pk if level == "organization" else scope.organization_id
+        if level in ("department", "customer"):
+            scopes["department_scope_id"] = scope.pk if level == "department" else scope.department_id
+        if level == "customer":
+            scopes["customer_scope_id"] = scope.pk
+        return scopes
@@ -1,11 +1,16 @@
 from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.core.signals import request_finished
 from rest_framework.exceptions import ValidationError, PermissionDenied, APIException, AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.renderers import JSONRenderer
-from tenants.models import Tenant
 from exception_handlers import custom_exception_handler
-from .tenant_schema import set_tenant_schema
+from user_management.authentication import RequestScopedJWTAuthentication
+from .replicas import pin_user_to_primary, reset_read_intent
+from .sharding import set_current_shard
+from .tenant_cache import get_tenant_for_domain
+from .tenant_schema import set_tenant_schema, reset_tenant_schema
 
 
 _thread_locals = Local()
@@ -15,54 +20,113 @@ def get_current_tenant():
     return getattr(_thread_locals, 'tenant', None)
 
 
+def clear_current_tenant(**kwargs):
+    # threads (and pooled connections) are reused by following requests, tenant of this one must not leak into them
+    _thread_locals.tenant = None
+    set_current_shard(None)
+    reset_read_intent()
+    reset_tenant_schema()
+
+
+class TenantMigrating(APIException):
+    status_code = 503
+    default_detail = "Tenant is being moved to another database, only reading is possible. Try again later."
+    default_code = "tenant_migrating"
+
+
+request_finished.connect(clear_current_tenant)
+
+
 class TenantMiddleware:
+    """
+    Resolves tenant of the request and activates its schema.
+    Works in both sync (WSGI) and async (ASGI) stacks, tenant context is kept in asgiref Local,
+    so under ASGI every request task has its own tenant.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        try:
-            domain_tenant = self.get_tenant_from_request(request)
-            tenant = None
-
-            if (
-                    request.path == "/api/"
-                    or request.path.startswith("/admin/")
-                    or request.path.startswith("/api-auth/")
-                    or request.path.startswith("/api/token/")
-            ):
-                # api root, /admin/, /api/token/ and /api-auth/ are exempt
-                # this makes it easier to use browsable api, and to switch users
-                return self.get_response(request)
-
-            if isinstance(request.user, AnonymousUser):
-                request.user = self.get_user_from_token(request)
-
-            if not hasattr(request.user, "tenant_scope") or getattr(request.user, "tenant_scope", None) is None:
-                # admin users and unauthenticated users use domain_tenant
-                # unauthenticated users, will not be able to access any other api endpoint (401)
-                tenant = domain_tenant
-            else:
-                if not domain_tenant:
-                    raise ValidationError("No tenant")
-                tenant_scope = getattr(request.user, "tenant_scope")
-                if tenant_scope != domain_tenant:
-                    raise PermissionDenied(f"user belongs to a different tenant. User tenant is {tenant_scope} while domain tenant is {domain_tenant}")
-                else:
-                    tenant = tenant_scope
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
 
-            if not tenant:
-                raise PermissionDenied(f"Domain '{request.get_host()} 'does not exist in the system. Create new tenant with this domain_url, to access the app through it")
-
-            set_tenant_schema(tenant.get_schema_name())
-            _thread_locals.tenant = tenant
-            request.tenant = tenant
+        try:
+            self.activate_tenant(request)
+        except APIException as e:
+            return self._handle_exception(e, request)
 
-            response = self.get_response(request)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            self.pin_writer(request)
+        return response
 
-            return response
+    async def __acall__(self, request):
+        try:
+            # resolution can query database (cache misses, session users), so it runs in the request thread,
+            # Local changes made there are propagated back to this task
+            await sync_to_async(self.activate_tenant)(request)
         except APIException as e:
             return self._handle_exception(e, request)
 
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            await sync_to_async(self.pin_writer)(request)
+        return response
+
+    def activate_tenant(self, request):
+        domain_tenant = self.get_tenant_from_request(request)
+        tenant = None
+
+        # users, organizations, departments and customers of the domain are read from its shard
+        set_current_shard(domain_tenant.db_alias if domain_tenant else None)
+        if domain_tenant and domain_tenant.is_migrating and request.method not in SAFE_METHODS:
+            raise TenantMigrating()
+
+        if (
+                request.path == "/api/"
+                or request.path.startswith("/admin/")
+                or request.path.startswith("/api-auth/")
+                or request.path.startswith("/api/token/")
+        ):
+            # api root, /admin/, /api/token/ and /api-auth/ are exempt
+            # this makes it easier to use browsable api, and to switch users
+            return
+
+        if isinstance(request.user, AnonymousUser):
+            request.user = self.get_user_from_token(request)
+
+        # tenant_scope_id is compared, so token users (claims) are authorized without loading BaseUser
+        if getattr(request.user, "tenant_scope_id", None) is None:
+            # admin users and unauthenticated users use domain_tenant
+            # unauthenticated users, will not be able to access any other api endpoint (401)
+            tenant = domain_tenant
+        else:
+            if not domain_tenant:
+                raise ValidationError("No tenant")
+            if request.user.tenant_scope_id != domain_tenant.id:
+                tenant_scope = request.user.tenant_scope
+                raise PermissionDenied(f"user belongs to a different tenant. User tenant is {tenant_scope} while domain tenant is {domain_tenant}")
+            else:
+                tenant = domain_tenant
+
+        if not tenant:
+            raise PermissionDenied(f"Domain '{request.get_host()} 'does not exist in the system. Create new tenant with this domain_url, to access the app through it")
+
+        set_tenant_schema(tenant.get_schema_name())
+        _thread_locals.tenant = tenant
+        request.tenant = tenant
+
+    def pin_writer(self, request):
+        # replicas may not have changes of this request yet, following reads of the user go to the primary
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            pin_user_to_primary(user.pk)
+
     def _handle_exception(self, exc, request):
         response = custom_exception_handler(exc, {'request': request})
 
@@ -79,16 +143,15 @@ class TenantMiddleware:
     def get_tenant_from_request(self, request):
         domain = request.get_host()
 
-        try:
-            tenant = Tenant.objects.get(domain__domain_url=domain)
+        tenant = get_tenant_for_domain(domain)
+        if tenant:
             set_tenant_schema(tenant.get_schema_name())
-            return tenant
-        except Tenant.DoesNotExist:
-            return None
+        return tenant
 
     def get_user_from_token(self, request):
         try:
-            user_auth_tuple = JWTAuthentication().authenticate(request)
+            # result is kept on the request and reused by DRF authentication
+            user_auth_tuple = RequestScopedJWTAuthentication().authenticate(request)
             if user_auth_tuple:
                 return user_auth_tuple[0]
         except AuthenticationFailed:
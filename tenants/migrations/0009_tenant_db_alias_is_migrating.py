@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:32
+
+import tenants.sharding
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0008_customer_local_id_department_local_id_and_more'),
+    ]
+
+    operations = [
+        # existing tenants are stored in default database, whatever TENANT_DEFAULT_SHARD is
+        migrations.AddField(
+            model_name='tenant',
+            name='db_alias',
+            field=models.CharField(default='default', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='tenant',
+            name='db_alias',
+            field=models.CharField(default=tenants.sharding.default_shard_alias, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='is_migrating',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0009_tenant_db_alias_is_migrating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['local_id', 'id'], name='tenants_customer_local_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['local_id', 'id'], name='tenants_department_local_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(fields=['local_id', 'id'], name='tenants_organization_local_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['local_id', 'id'], name='tenants_tenant_local_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_ancestry(apps, schema_editor):
+    Organization = apps.get_model("tenants", "Organization")
+    Department = apps.get_model("tenants", "Department")
+    Customer = apps.get_model("tenants", "Customer")
+    using = schema_editor.connection.alias
+
+    Department.objects.using(using).update(
+        tenant_id=Subquery(Organization.objects.filter(pk=OuterRef("organization_id")).values("tenant_id")[:1])
+    )
+    departments = Department.objects.filter(pk=OuterRef("department_id"))
+    Customer.objects.using(using).update(
+        organization_id=Subquery(departments.values("organization_id")[:1]),
+        tenant_id=Subquery(departments.values("tenant_id")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0010_local_id_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tenants.organization'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='tenant',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tenants.tenant'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='tenant',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tenants.tenant'),
+        ),
+        migrations.RunPython(backfill_ancestry, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['tenant', 'local_id', 'id'], name='customer_tenant_local_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['tenant', 'local_id', 'id'], name='department_tenant_local_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0011_department_customer_ancestry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocalIdCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_name', models.CharField(max_length=63)),
+                ('name', models.CharField(max_length=32)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('schema_name', 'name'), name='localidcounter_unique_counter')],
+            },
+        ),
+    ]
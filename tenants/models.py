@@ -1,7 +1,11 @@
 import uuid
-from django.db import models, connections, connection
+from django.db import models, router, transaction, DEFAULT_DB_ALIAS
 from django.utils import timezone
 
+from .local_ids import get_local_id_allocator
+from .schema_pool import claim_spare_schema, create_tenant_schema, new_schema_uuid, tenant_schema_name
+from .sharding import default_shard_alias, mirror_tenant
+
 
 class BaseModel(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -13,6 +17,10 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+        indexes = [
+            # keyset pagination of scoped lists (ScopedCursorPagination orders by local_id, id)
+            models.Index(fields=["local_id", "id"], name="%(app_label)s_%(class)s_local_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -32,7 +40,8 @@ class BaseModel(models.Model):
         self.save(update_fields=["is_deleted", "deleted_at"])
 
     def get_tenant(self):
-        if hasattr(self, 'tenant'):
+        # departments and customers keep tenant_id of their ancestry (see Department.save and Customer.save)
+        if getattr(self, 'tenant_id', None):
             return self.tenant
         elif hasattr(self, 'organization'):
             return self.organization.tenant
@@ -40,56 +49,91 @@ class BaseModel(models.Model):
             return self.department.organization.tenant
         return None
 
+    def get_shard_alias(self):
+        """
+        Database of a new instance, tenant data is stored on the shard of its tenant
+        """
+        return None
+
+    def set_ancestry(self):
+        """
+        Copies denormalized ancestry from the parent, called by save() and bulk_create_for_tenant()
+        """
+        pass
+
+    @classmethod
+    def allocate_local_ids(cls, tenant, count, using):
+        """
+        Next count local_ids of the model in the tenant, from the configured allocator (see local_ids.py)
+        """
+        # counters live on the shard of the tenant
+        return get_local_id_allocator().allocate(tenant.get_schema_name(), f"{cls.__name__.lower()}_model", count, using)
+
+    @classmethod
+    def bulk_create_for_tenant(cls, instances, tenant, batch_size=None):
+        """
+        Inserts new instances of the tenant with bulk_create, local_ids of all of them are allocated with one query.
+        bulk_create doesn't call save(), so ancestry and shard of the instances are set here
+        """
+        if not instances:
+            return []
+
+        for instance in instances:
+            instance.set_ancestry()
+
+        using = router.db_for_write(cls, instance=instances[0])
+        pending = [instance for instance in instances if instance.local_id is None]
+        if pending:
+            for instance, local_id in zip(pending, cls.allocate_local_ids(tenant, len(pending), using)):
+                instance.local_id = local_id
+
+        with transaction.atomic(using=using):
+            return cls.objects.using(using).bulk_create(instances, batch_size=batch_size)
+
     def save(self, *args, **kwargs):
+        if self._state.adding and self.get_shard_alias():
+            # managers pass their own database, new rows always go to the shard of their tenant (its primary)
+            kwargs["using"] = router.db_for_write(self.__class__, instance=self)
+
         if self.local_id is None:
             tenant = self.get_tenant()
             if tenant:
-                schema_name = tenant.get_schema_name()
-                model_name = self.__class__.__name__.lower()
-
-                sequence_name = f"{schema_name}.{model_name}_model_local_id"
-
-                with connection.cursor() as cursor:
-                    cursor.execute(f"SELECT nextval('{sequence_name}')")
-                    self.local_id = cursor.fetchone()[0]
+                using = kwargs.get("using") or router.db_for_write(self.__class__, instance=self)
+                self.local_id = self.allocate_local_ids(tenant, 1, using)[0]
 
         super().save(*args, **kwargs)
 
 class Tenant(BaseModel):
     uuid = models.CharField(max_length=36, unique=True, editable=False, null=True)
+    # database alias of the shard that stores data of this tenant
+    db_alias = models.CharField(max_length=64, default=default_shard_alias)
+    # set while tenant is being moved between shards, writes are rejected meanwhile
+    is_migrating = models.BooleanField(default=False)
 
     def get_schema_name(self):
-        return f"tenant_{self.uuid}"
+        return tenant_schema_name(self.uuid)
 
     def save(self, *args, **kwargs):
         if not self.pk:
-            self.uuid = str(uuid.uuid4()).replace("-", "_")
-            db_schema_name = self.get_schema_name()
-            with connections['default'].cursor() as cursor:
-                try:
-
-                    cursor.execute(
-                        f"CREATE SCHEMA IF NOT EXISTS {db_schema_name}"
-                    )
-
-                    sequence_types = ["model", "user"]
-                    sequence_names = ["organization", "department", "customer"]
-
-                    for sequence_type in sequence_types:
-                        for sequence_name in sequence_names:
-                            cursor.execute(
-                                f"CREATE SEQUENCE IF NOT EXISTS {db_schema_name}.{sequence_name}_{sequence_type}_local_id START WITH 1"
-                            )
-
-                    cursor.execute(
-                        f"CREATE SEQUENCE IF NOT EXISTS {db_schema_name}.tenant_user_local_id START WITH 1"
-                    )
-
-                except Exception as e:
-                    print(f"Error creating schema: {e}")
-                    raise
+            # schema prepared in advance by "manage.py refill_schema_pool", created here only when the pool is empty
+            self.uuid = claim_spare_schema(self.db_alias)
+            if self.uuid is None:
+                self.uuid = new_schema_uuid()
+                self.create_schema(self.db_alias)
         super().save(*args, **kwargs)
 
+        if self.db_alias != DEFAULT_DB_ALIAS:
+            mirror_tenant(self, self.db_alias)
+
+    def delete(self, *args, **kwargs):
+        if self.db_alias != DEFAULT_DB_ALIAS:
+            # tenant data is removed together with the mirrored row on its shard
+            Tenant.objects.using(self.db_alias).filter(pk=self.pk).delete()
+        return super().delete(*args, **kwargs)
+
+    def create_schema(self, using):
+        create_tenant_schema(self.get_schema_name(), using)
+
 
 class Domain(models.Model):
     tenant = models.OneToOneField(Tenant, related_name='domain', on_delete=models.CASCADE)
@@ -100,11 +144,165 @@ class Domain(models.Model):
     def __str__(self):
         return self.domain_url
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # url that is currently cached for this domain, used to invalidate it after domain_url changes
+        instance._loaded_domain_url = instance.__dict__.get("domain_url")
+        return instance
+
+class SpareSchema(models.Model):
+    """
+    Schema created in advance (with local_id counters of its allocator) for a future tenant of the shard, see schema_pool.py.
+    Every shard keeps its own rows
+    """
+    uuid = models.CharField(max_length=36, unique=True)
+    allocator = models.CharField(max_length=16)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"tenant_{self.uuid} ({self.allocator})"
+
+
+class LocalIdCounter(models.Model):
+    """
+    Last local_id handed out for a tenant (its schema_name) and counter, used by counter and hilo allocators (see local_ids.py)
+    """
+    schema_name = models.CharField(max_length=63)
+    name = models.CharField(max_length=32)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["schema_name", "name"], name="localidcounter_unique_counter"),
+        ]
+
+    def __str__(self):
+        return f"{self.schema_name}.{self.name} = {self.value}"
+
+class Job(models.Model):
+    """
+    Long running operation (soft deletion cascade, bulk import, tenant creation) executed by run_job_worker in batches.
+    Progress is saved after every batch (checkpoint), a worker that picks up a job again continues from the last checkpoint.
+    Jobs live in default database, next to Tenant rows
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    tenant = models.ForeignKey(Tenant, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    # users live on shards, so the user isn't a foreign key
+    created_by_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    checkpoint = models.JSONField(default=dict)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=128, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="tenants_job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.pk} ({self.status})"
+
 class Organization(BaseModel):
     tenant = models.ForeignKey(Tenant, related_name='organizations', on_delete=models.CASCADE)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_tenant_id = instance.__dict__.get("tenant_id")
+        return instance
+
+    def get_shard_alias(self):
+        return self.tenant.db_alias
+
+    def save(self, *args, **kwargs):
+        moved = not self._state.adding and getattr(self, "_loaded_tenant_id", self.tenant_id) != self.tenant_id
+        super().save(*args, **kwargs)
+
+        if moved:
+            # departments and customers keep tenant_id of their organization
+            Department.objects.using(self._state.db).filter(organization=self).update(tenant_id=self.tenant_id)
+            Customer.objects.using(self._state.db).filter(organization=self).update(tenant_id=self.tenant_id)
+        self._loaded_tenant_id = self.tenant_id
+
 class Department(BaseModel):
     organization = models.ForeignKey(Organization, related_name='departments', on_delete=models.CASCADE)
+    # denormalized ancestry, scope filters of departments don't join organizations
+    tenant = models.ForeignKey(Tenant, related_name='+', on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=["tenant", "local_id", "id"], name="department_tenant_local_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_organization_id = instance.__dict__.get("organization_id")
+        return instance
+
+    def get_shard_alias(self):
+        return self.organization._state.db
+
+    def set_ancestry(self):
+        self.tenant_id = self.organization.tenant_id
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "organization" in update_fields:
+            self.set_ancestry()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "tenant"}
+
+        moved = not self._state.adding and getattr(self, "_loaded_organization_id", self.organization_id) != self.organization_id
+        super().save(*args, **kwargs)
+
+        if moved:
+            # customers keep ancestry of their department
+            Customer.objects.using(self._state.db).filter(department=self).update(
+                organization_id=self.organization_id, tenant_id=self.tenant_id,
+            )
+        self._loaded_organization_id = self.organization_id
 
 class Customer(BaseModel):
-    department = models.ForeignKey(Department, related_name='customers', on_delete=models.CASCADE)
\ No newline at end of file
+    department = models.ForeignKey(Department, related_name='customers', on_delete=models.CASCADE)
+    # denormalized ancestry, scope filters of customers don't join departments and organizations
+    organization = models.ForeignKey(Organization, related_name='+', on_delete=models.CASCADE, null=True, blank=True)
+    tenant = models.ForeignKey(Tenant, related_name='+', on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=["tenant", "local_id", "id"], name="customer_tenant_local_idx"),
+        ]
+
+    def get_shard_alias(self):
+        return self.department._state.db
+
+    def set_ancestry(self):
+        self.organization_id = self.department.organization_id
+        self.tenant_id = self.department.tenant_id
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "department" in update_fields:
+            self.set_ancestry()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "organization", "tenant"}
+
+        super().save(*args, **kwargs)
\ No newline at end of file
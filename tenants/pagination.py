@@ -0,0 +1,178 @@
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class ScopedCursorPagination(CursorPagination):
+    """
+    Keyset pagination for scoped list endpoints.
+    Admins page through actual ids, other users through local_id (ids they see). local_ids of users come from
+    separate counters of every scope and repeat, views with such lists set local_id_tie_breaker (unique fields
+    that users can see), the cursor then holds values of all ordering fields and pages are filtered by the whole row
+    (local_id > x OR local_id = x AND username > y), never by position + offset.
+    Values keep increasing, so rows inserted meanwhile only appear on later pages. Rows without local_id (tenant admins
+    scoped to a tenant) are ordered after all others, NULL is kept as null in the cursor.
+    Viewsets opt in by setting pagination_class, with only_when_requested lists are paginated only for clients
+    that send cursor or page_size.
+    """
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    only_when_requested = False
+
+    def is_requested(self, request):
+        if not self.only_when_requested:
+            return True
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+    def get_ordering(self, request, queryset, view):
+        user = request.user
+        if user.is_admin() or user.is_superuser:
+            return ("id",)
+        return ("local_id", *getattr(view, "local_id_tie_breaker", ()))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset of async views, only the page is read with async ORM
+        """
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([obj async for obj in page_queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        First part of CursorPagination.paginate_queryset (filtered by every ordering field instead of the first one),
+        returns unevaluated queryset of the page and one following row, None when the list isn't paginated
+        """
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        self.nullable_fields = {
+            order.lstrip("-") for order in self.ordering
+            if order.lstrip("-") != "pk" and queryset.model._meta.get_field(order.lstrip("-")).null
+        }
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*(self.get_order_expression(order) for order in ordering))
+
+        if current_position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(self._decode_position(current_position), reverse))
+
+        return queryset[offset:offset + self.page_size + 1]
+
+    def set_page(self, results):
+        """
+        Second part of CursorPagination.paginate_queryset, results are rows of get_page_queryset()
+        """
+        (offset, reverse, current_position) = self.cursor or (0, False, None)
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_order_expression(self, order):
+        # NULLs are the largest values: last in ascending order, first in descending (same as PostgreSQL default, explicit
+        # because get_keyset_filter relies on it)
+        field_name = order.lstrip("-")
+        if field_name not in self.nullable_fields:
+            return order
+        return F(field_name).desc(nulls_first=True) if order.startswith("-") else F(field_name).asc(nulls_last=True)
+
+    def get_keyset_filter(self, values, reverse):
+        """
+        Rows after (before for reversed cursor) the row with given values of ordering fields
+        """
+        keyset_filter = Q()
+        equal = Q()
+        for order, value in zip(self.ordering, values):
+            field_name = order.lstrip("-")
+            lookup = "lt" if reverse != order.startswith("-") else "gt"
+            if field_name not in self.nullable_fields:
+                keyset_filter |= equal & Q(**{f"{field_name}__{lookup}": value})
+                equal &= Q(**{field_name: value})
+            elif value is None:
+                # nothing is greater than NULL, every value is smaller
+                if lookup == "lt":
+                    keyset_filter |= equal & Q(**{f"{field_name}__isnull": False})
+                equal &= Q(**{f"{field_name}__isnull": True})
+            else:
+                greater_or_smaller = Q(**{f"{field_name}__{lookup}": value})
+                if lookup == "gt":
+                    greater_or_smaller |= Q(**{f"{field_name}__isnull": True})
+                keyset_filter |= equal & greater_or_smaller
+                equal &= Q(**{field_name: value})
+        # no field can be after the position (single NULL ordering field), no rows follow
+        return keyset_filter if keyset_filter else Q(pk__in=[])
+
+    def _decode_position(self, position):
+        if len(self.ordering) == 1:
+            return [position]
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_position_from_instance(self, instance, ordering):
+        if len(ordering) == 1:
+            return super()._get_position_from_instance(instance, ordering)
+
+        values = []
+        for order in ordering:
+            field_name = order.lstrip("-")
+            value = instance[field_name] if isinstance(instance, dict) else getattr(instance, field_name)
+            values.append(None if value is None else str(value))
+        return json.dumps(values)
+
+
+class OptionalScopedCursorPagination(ScopedCursorPagination):
+    only_when_requested = True
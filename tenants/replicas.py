@@ -0,0 +1,171 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import environ
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from tenants.tenant_cache import get_tenant_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Replicas are aliases in DATABASES with REPLICA_OF set to alias of their primary (default or a shard).
+# Reads are sent to a replica only when the request asked for it (read_from_replica), nothing was written in the request,
+# the user didn't write anything in the last READ_YOUR_WRITES_WINDOW seconds and lag of the replica is under MAX_LAG.
+
+_thread_locals = Local()
+
+_lag_lock = threading.Lock()
+# alias -> (checked_at, lag in seconds)
+_measured_lags = {}
+
+LAG_QUERY = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def get_replica_settings():
+    return {
+        "MAX_LAG": 5,
+        "LAG_CHECK_INTERVAL": 1,
+        "READ_YOUR_WRITES_WINDOW": 5,
+        **getattr(settings, "READ_REPLICAS", {}),
+    }
+
+
+def get_primary_alias(alias):
+    """
+    Writes always go to the primary, instances loaded from a replica are saved to it
+    """
+    if alias is None:
+        return None
+    return connections.settings[alias].get("REPLICA_OF") or alias
+
+
+def is_replica(alias):
+    return bool(connections.settings[alias].get("REPLICA_OF"))
+
+
+def get_replica_aliases(primary_alias):
+    return [alias for alias in connections.settings if connections.settings[alias].get("REPLICA_OF") == primary_alias]
+
+
+def register_replica(alias, database, replica_of=DEFAULT_DB_ALIAS):
+    """
+    Adds a read replica of `replica_of` to DATABASES at runtime, `database` is a database url or a settings dict
+    """
+    if isinstance(database, str):
+        database = environ.Env.db_url_config(database)
+
+    # test databases of replicas are never created, replica points at test database of its primary
+    config = {**database, "REPLICA_OF": replica_of, "TEST": {"MIRROR": replica_of}}
+    configured = connections.configure_settings({DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], alias: config})
+    settings.DATABASES[alias] = config
+    connections.settings[alias] = configured[alias]
+    return connections[alias]
+
+
+def unregister_replica(alias):
+    connections[alias].close()
+    del connections[alias]
+    connections.settings.pop(alias, None)
+    settings.DATABASES.pop(alias, None)
+    _measured_lags.pop(alias, None)
+
+
+def measure_replica_lag(alias):
+    """
+    Seconds since the last replayed transaction, 0 when replica replayed everything it received
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            return float(cursor.fetchone()[0])
+    except DatabaseError as e:
+        logger.warning("Replica '%s' is unavailable: %s", alias, e)
+        return float("inf")
+
+
+def get_replica_lag(alias):
+    """
+    Lag is measured at most once per LAG_CHECK_INTERVAL in each process
+    """
+    check_interval = get_replica_settings()["LAG_CHECK_INTERVAL"]
+    now = time.monotonic()
+
+    with _lag_lock:
+        checked_at, lag = _measured_lags.get(alias, (None, None))
+    if checked_at is not None and now - checked_at < check_interval:
+        return lag
+
+    lag = measure_replica_lag(alias)
+    with _lag_lock:
+        _measured_lags[alias] = (now, lag)
+    return lag
+
+
+def get_read_alias(primary_alias):
+    """
+    Replica of the primary with lag under MAX_LAG, primary itself when there is none
+    """
+    max_lag = get_replica_settings()["MAX_LAG"]
+    replica_aliases = [alias for alias in get_replica_aliases(primary_alias) if get_replica_lag(alias) <= max_lag]
+    if not replica_aliases:
+        return primary_alias
+    return random.choice(replica_aliases)
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Reads of sharded models made inside are sent to a replica, until something is written
+    """
+    previous_intent = getattr(_thread_locals, "read_intent", False)
+    previous_wrote = getattr(_thread_locals, "wrote", False)
+    _thread_locals.read_intent = True
+    _thread_locals.wrote = False
+    try:
+        yield
+    finally:
+        _thread_locals.read_intent = previous_intent
+        _thread_locals.wrote = previous_wrote
+
+
+def set_read_intent(read_intent):
+    _thread_locals.read_intent = read_intent
+
+
+def wants_replica():
+    return getattr(_thread_locals, "read_intent", False) and not getattr(_thread_locals, "wrote", False)
+
+
+def mark_written():
+    # everything read after a write in the same request is read from the primary
+    _thread_locals.wrote = True
+
+
+def reset_read_intent(**kwargs):
+    _thread_locals.read_intent = False
+    _thread_locals.wrote = False
+
+
+def _pin_key(user_id):
+    return f"tenants:replica_pin:{user_id}"
+
+
+def pin_user_to_primary(user_id):
+    """
+    Following requests of the user read from the primary, until replicas catch up with their writes
+    """
+    window = get_replica_settings()["READ_YOUR_WRITES_WINDOW"]
+    get_tenant_cache().shared_backend.set(_pin_key(user_id), "1", window)
+
+
+def is_user_pinned_to_primary(user_id):
+    return get_tenant_cache().shared_backend.get(_pin_key(user_id)) is not None
@@ -0,0 +1,102 @@
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+
+from .local_ids import get_local_id_allocator, get_local_id_allocator_name
+
+
+def get_schema_pool_setting(name):
+    defaults = {"SIZE": 0, "REFILL_INTERVAL": 5.0}
+    return getattr(settings, "SCHEMA_POOL", {}).get(name, defaults[name])
+
+
+def new_schema_uuid():
+    return str(uuid.uuid4()).replace("-", "_")
+
+
+def tenant_schema_name(schema_uuid):
+    return f"tenant_{schema_uuid}"
+
+
+def create_tenant_schema(schema_name, using):
+    """
+    Schema of a tenant with counters of the local_id allocator (7 sequences with the default one), DDL of the shard
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name}")
+    get_local_id_allocator().create_tenant(schema_name, using)
+
+
+def _spare_schemas(using):
+    return apps.get_model("tenants", "SpareSchema").objects.using(using)
+
+
+def claim_spare_schema(using):
+    """
+    Takes a spare schema of the shard out of the pool and returns its uuid (the new tenant's uuid), None when the pool is empty.
+    Spare schemas are created under their final name, claiming one is a row lock and a DELETE, no DDL and no catalog locks.
+    Concurrent claims skip rows locked by each other, a claim rolled back with its transaction returns the schema to the pool
+    """
+    claimed = claim_spare_schemas(using, 1)
+    return claimed[0] if claimed else None
+
+
+def claim_spare_schemas(using, count):
+    """
+    uuids of up to count spare schemas of the shard taken out of the pool at once (see claim_spare_schema)
+    """
+    with transaction.atomic(using=using):
+        pks, uuids = [], []
+        spares = (
+            _spare_schemas(using).select_for_update(skip_locked=True)
+            .filter(allocator=get_local_id_allocator_name())
+            .order_by("pk")
+            .values_list("pk", "uuid")[:count]
+        )
+        for pk, schema_uuid in spares:
+            pks.append(pk)
+            uuids.append(schema_uuid)
+        if pks:
+            _spare_schemas(using).filter(pk__in=pks).delete()
+    return uuids
+
+
+def get_pool_size(using):
+    return _spare_schemas(using).filter(allocator=get_local_id_allocator_name()).count()
+
+
+def refill_schema_pool(using, size):
+    """
+    Creates spare schemas until the shard has `size` of them, one transaction per schema keeps catalog locks short.
+    Surplus spare schemas, and those prepared for another allocator (LOCAL_ID_ALLOCATOR changed), are dropped.
+    Returns (created, dropped)
+    """
+    allocator_name = get_local_id_allocator_name()
+
+    created = 0
+    for _ in range(size - get_pool_size(using)):
+        schema_uuid = new_schema_uuid()
+        with transaction.atomic(using=using):
+            create_tenant_schema(tenant_schema_name(schema_uuid), using)
+            _spare_schemas(using).create(uuid=schema_uuid, allocator=allocator_name)
+        created += 1
+
+    dropped = 0
+    surplus = max(0, get_pool_size(using) - size)
+    stale = list(_spare_schemas(using).exclude(allocator=allocator_name).values_list("pk", flat=True))
+    stale += list(_spare_schemas(using).filter(allocator=allocator_name).order_by("-pk").values_list("pk", flat=True)[:surplus])
+    for pk in stale:
+        with transaction.atomic(using=using):
+            spare = _spare_schemas(using).select_for_update(skip_locked=True).filter(pk=pk).first()
+            if spare is None:
+                # claimed meanwhile
+                continue
+            schema_name = tenant_schema_name(spare.uuid)
+            get_local_id_allocator(spare.allocator).delete_tenant(schema_name, using)
+            with connections[using].cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
+            spare.delete()
+        dropped += 1
+    return created, dropped
@@ -1,6 +1,11 @@
+from collections import Counter
+
+from django.db import models
+from django.db.models import F
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError, PermissionDenied, NotFound
-from .models import Tenant, Organization, Department, Customer, Domain
+from rest_framework.validators import UniqueValidator
+from .models import Tenant, Organization, Department, Customer, Domain, Job
 
 
 class TenantSerializer(serializers.ModelSerializer):
@@ -29,39 +34,183 @@ class TenantSerializer(serializers.ModelSerializer):
         return instance
 
 
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'processed', 'total', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class ScopedParentField(serializers.PrimaryKeyRelatedField):
+    """
+    Parent of a scoped object, bulk creation fetches parents of the whole list beforehand (context["bulk_parents"])
+    """
+    def to_internal_value(self, data):
+        parents = self.context.get("bulk_parents", {}).get(self.field_name, {})
+        if isinstance(data, int) and not isinstance(data, bool) and data in parents:
+            return parents[data]
+        return super().to_internal_value(data)
+
+
+class BulkScopedListSerializer(serializers.ListSerializer):
+    """
+    Creates the whole list with bulk inserts (see BaseModel.bulk_create_for_tenant).
+    Parents of all items are fetched with one query per parent type and names are checked with one query,
+    instead of the queries per item done by related and unique validators of the child serializer
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if "data" in kwargs:
+            for field in self.child.fields.values():
+                field.validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.context["bulk_parents"] = self.child.resolve_bulk_parents(data)
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        names = Counter(item["name"] for item in attrs)
+        duplicates = sorted(name for name, count in names.items() if count > 1)
+        if duplicates:
+            raise ValidationError(f"Names must be unique, duplicated: {', '.join(duplicates)}.")
+
+        existing = sorted(self.child.Meta.model.objects.filter(name__in=names).values_list("name", flat=True))
+        if existing:
+            raise ValidationError(f"Names already exist: {', '.join(existing)}.")
+        return attrs
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        tenant = self.context.get("tenant")
+
+        instances = []
+        for attrs in validated_data:
+            self.child.check_create_scope(attrs)
+            instances.append(model(**attrs))
+
+        return model.bulk_create_for_tenant(instances, tenant, batch_size=self.context.get("bulk_create_batch_size"))
+
+    def to_job_payload(self):
+        """
+        Validated list for jobs.BulkCreateJob (related objects by id), scope of every item is checked here, in the request
+        """
+        items = []
+        for attrs in self.validated_data:
+            self.child.check_create_scope(attrs)
+            items.append({field: value.pk if isinstance(value, models.Model) else value for field, value in attrs.items()})
+        return {"model": self.child.Meta.model._meta.label_lower, "items": items}
+
+
 class BaseScopedSerializer(serializers.ModelSerializer):
+    serializer_related_field = ScopedParentField
+    # parent FK, non admin users send local_id of the parent (resolved within their tenant)
+    scope_parent_field = None
+    # parents whose local_id is in the output, annotated as <parent>_local_id columns by annotate_queryset()
+    scope_parent_local_ids = ()
+
+    @classmethod
+    def annotate_queryset(cls, queryset):
+        """
+        Adds local_ids of parents to the rows (joined in the same query), to_representation() then reads only columns of the row
+        """
+        if not cls.scope_parent_local_ids:
+            return queryset
+        return queryset.annotate(**{f"{field}_local_id": F(f"{field}__local_id") for field in cls.scope_parent_local_ids})
+
+    def is_admin_request(self):
+        # decided once per response, child serializers of a list share the context of the list
+        if "is_admin" not in self.context:
+            self.context["is_admin"] = self.context['request'].user.is_admin()
+        return self.context["is_admin"]
+
+    def get_parent_local_id(self, instance, field):
+        annotated = f"{field}_local_id"
+        if annotated in instance.__dict__:
+            return instance.__dict__[annotated]
+        # instance that wasn't loaded through annotate_queryset() (created or moved to another parent)
+        return getattr(instance, field).local_id
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        for field in self.scope_parent_local_ids:
+            # parent could have been changed
+            instance.__dict__.pop(f"{field}_local_id", None)
+        return instance
+
+    def check_create_scope(self, validated_data):
+        """
+        Role/scope checks of a new object, shared by create() and bulk creation, returns tenant of the request
+        """
+        tenant = self.context.get("tenant")
+        if not tenant:
+            raise ValidationError("Tenant is required.")
+        return tenant
+
+    def resolve_bulk_parents(self, items):
+        """
+        Fetches parents of all items with one query, returns {field name: {id: parent}}.
+        local_ids of parents sent by non admin users are replaced with ids, as is_valid() does for a single object
+        """
+        if not self.scope_parent_field:
+            return {}
+
+        field_name = self.scope_parent_field
+        parent_model = self.Meta.model._meta.get_field(field_name).related_model
+        user = self.context.get("request").user
+        values = {
+            item[field_name] for item in items
+            if isinstance(item, dict) and isinstance(item.get(field_name), int) and not isinstance(item[field_name], bool)
+        }
+
+        if user.is_admin():
+            return {field_name: parent_model.objects.in_bulk(values)}
+
+        parents = {
+            parent.local_id: parent
+            for parent in parent_model.objects.filter(local_id__in=values, tenant_id=user.tenant_scope_id)
+        }
+        missing = sorted(values - parents.keys())
+        if missing:
+            raise NotFound(f"{parent_model.__name__} with local_id {', '.join(map(str, missing))} does not exist.")
+
+        for item in items:
+            if isinstance(item, dict) and item.get(field_name) in parents:
+                item[field_name] = parents[item[field_name]].id
+        return {field_name: {parent.id: parent for parent in parents.values()}}
+
     def to_representation(self, instance):
-        user = self.context['request'].user
+        is_admin = self.is_admin_request()
         data = super().to_representation(instance)
 
         if "tenant" in data:
-            data["tenant_id"] = instance.tenant.id
+            data["tenant_id"] = instance.tenant_id
             data.pop("tenant", None)
 
         if "organization" in data:
-            data["organization_id"] = instance.organization.id
+            data["organization_id"] = instance.organization_id
             data.pop("organization", None)
 
         if "department" in data:
-            data["department_id"] = instance.department.id
+            data["department_id"] = instance.department_id
             data.pop("department", None)
 
-        if not user.is_admin():
+        if not is_admin:
             data["id"] = data["local_id"]
             data.pop("local_id", None)
             data.pop("is_deleted", None)
 
             if "organization_id" in data:
-                data["organization_id"] = instance.organization.local_id
+                data["organization_id"] = self.get_parent_local_id(instance, "organization")
 
             if "department_id" in data:
-                data["department_id"] = instance.department.local_id
+                data["department_id"] = self.get_parent_local_id(instance, "department")
         else:
             if "organization_id" in data:
-                data["organization_local_id"] = instance.organization.local_id
+                data["organization_local_id"] = self.get_parent_local_id(instance, "organization")
 
             if "department_id" in data:
-                data["department_local_id"] = instance.department.local_id
+                data["department_local_id"] = self.get_parent_local_id(instance, "department")
 
         return data
 
@@ -71,13 +220,15 @@ class OrganizationSerializer(BaseScopedSerializer):
         model = Organization
         fields = ['id', 'local_id', 'name', 'tenant', 'is_deleted']
         read_only_fields = ['id', 'local_id', 'tenant', 'is_deleted']
+        list_serializer_class = BulkScopedListSerializer
 
-    def create(self, validated_data):
-        tenant = self.context.get("tenant")
-        if not tenant:
-            raise ValidationError("Tenant is required.")
-
+    def check_create_scope(self, validated_data):
+        tenant = super().check_create_scope(validated_data)
         validated_data["tenant"] = tenant
+        return tenant
+
+    def create(self, validated_data):
+        self.check_create_scope(validated_data)
         return super().create(validated_data)
 
 
@@ -87,6 +238,10 @@ class DepartmentSerializer(BaseScopedSerializer):
         model = Department
         fields = ['id', 'local_id', 'name', 'organization', 'is_deleted']
         read_only_fields = ['id', 'local_id', 'is_deleted']
+        list_serializer_class = BulkScopedListSerializer
+
+    scope_parent_field = "organization"
+    scope_parent_local_ids = ("organization",)
 
     def is_valid(self, raise_exception=False):
         user = self.context.get("request").user
@@ -94,25 +249,26 @@ class DepartmentSerializer(BaseScopedSerializer):
             organization_data = self.initial_data.get("organization")
             if isinstance(organization_data, int):
                 try:
-                    organization = Organization.objects.get(local_id=organization_data, tenant=user.tenant_scope)
+                    organization = Organization.objects.get(local_id=organization_data, tenant_id=user.tenant_scope_id)
                     self.initial_data["organization"] = organization.id
                 except Organization.DoesNotExist:
                     raise NotFound("Organization with this local_id does not exist.")
 
         return super().is_valid(raise_exception=raise_exception)
 
-    def create(self, validated_data):
-        tenant = self.context.get("tenant")
-        if not tenant:
-            raise ValidationError("Tenant is required.")
+    def check_create_scope(self, validated_data):
+        tenant = super().check_create_scope(validated_data)
         user = self.context.get("request").user
         organization = validated_data.get("organization")
-        if organization and organization.tenant != tenant:
+        if organization and organization.tenant_id != tenant.id:
             raise PermissionDenied(f"Organization's tenant does not match the current tenant.")
-        if hasattr(user, 'organization_scope') and user.organization_scope:
-            if organization != user.organization_scope:
+        if getattr(user, 'organization_scope_id', None):
+            if organization is None or organization.id != user.organization_scope_id:
                 raise PermissionDenied("You can only create departments within your assigned organization.")
+        return tenant
 
+    def create(self, validated_data):
+        self.check_create_scope(validated_data)
         return super().create(validated_data)
 
 
@@ -121,6 +277,10 @@ class CustomerSerializer(BaseScopedSerializer):
         model = Customer
         fields = ['id', 'local_id', 'name', 'department', 'is_deleted']
         read_only_fields = ['id', 'local_id', 'is_deleted']
+        list_serializer_class = BulkScopedListSerializer
+
+    scope_parent_field = "department"
+    scope_parent_local_ids = ("department",)
 
     def is_valid(self, raise_exception=False):
         user = self.context.get("request").user
@@ -130,12 +290,12 @@ class CustomerSerializer(BaseScopedSerializer):
                 try:
                     filters = {"local_id": department_data}
 
-                    if hasattr(user, "tenant_scope") and user.tenant_scope:
-                        filters["organization__tenant"] = user.tenant_scope
-                    if hasattr(user, "organization_scope") and user.organization_scope:
-                        filters["organization"] = user.organization_scope
+                    if getattr(user, "tenant_scope_id", None):
+                        filters["tenant"] = user.tenant_scope_id
+                    if getattr(user, "organization_scope_id", None):
+                        filters["organization"] = user.organization_scope_id
 
-                    department = Department.objects.get(local_id=department_data, organization__tenant=user.tenant_scope)
+                    department = Department.objects.get(local_id=department_data, tenant=user.tenant_scope_id)
                     if department:
                         try:
                             department = Department.objects.get(**filters)
@@ -147,23 +307,23 @@ class CustomerSerializer(BaseScopedSerializer):
 
         return super().is_valid(raise_exception=raise_exception)
 
-    def create(self, validated_data):
-        tenant = self.context.get("tenant")
-        if not tenant:
-            raise ValidationError("Tenant is required.")
-
+    def check_create_scope(self, validated_data):
+        tenant = super().check_create_scope(validated_data)
         department = validated_data.get("department")
-        if department and department.organization.tenant != tenant:
+        if department and department.tenant_id != tenant.id:
             raise PermissionDenied("Invalid department for the current tenant.")
 
         user = self.context.get("request").user
-        if hasattr(user, 'organization_scope') and user.organization_scope:
-            if department and department.organization != user.organization_scope:
+        if getattr(user, 'organization_scope_id', None):
+            if department and department.organization_id != user.organization_scope_id:
                 raise PermissionDenied("You can only create customers within your assigned organization.")
 
-        if hasattr(user, 'department_scope') and user.department_scope:
-            if department and department != user.department_scope:
+        if getattr(user, 'department_scope_id', None):
+            if department and department.id != user.department_scope_id:
                 raise PermissionDenied("You can only create customers within your assigned department.")
+        return tenant
 
+    def create(self, validated_data):
+        self.check_create_scope(validated_data)
         return super().create(validated_data)
 
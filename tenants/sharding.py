@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+
+import environ
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Tenant data lives on the shard of its tenant, everything else (Tenant and Domain rows = shard map) in default database.
+# Shards hold a mirrored copy of their Tenant rows, so foreign keys to tenants_tenant still hold there.
+SHARDED_MODELS = {
+    "tenants.organization",
+    "tenants.department",
+    "tenants.customer",
+    "user_management.baseuser",
+}
+
+# Primary keys of sharded models are allocated from a separate range on every shard (SHARD_INDEX * SHARD_ID_RANGE + 1 ...),
+# so ids stay globally unique and rows keep their ids when a tenant is moved between shards
+SHARD_ID_RANGE = 10 ** 12
+
+_thread_locals = Local()
+
+
+def get_current_shard():
+    return getattr(_thread_locals, "shard_alias", None)
+
+
+def set_current_shard(alias):
+    _thread_locals.shard_alias = alias
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Routes queries of sharded models without instance hints (filters, creates through managers) to given shard
+    """
+    previous_alias = get_current_shard()
+    set_current_shard(alias)
+    try:
+        yield
+    finally:
+        set_current_shard(previous_alias)
+
+
+def default_shard_alias():
+    """
+    Shard of newly created tenants
+    """
+    return getattr(settings, "TENANT_DEFAULT_SHARD", DEFAULT_DB_ALIAS)
+
+
+def get_user_db_alias(tenant_scope_id):
+    """
+    Users of a tenant live on its shard (shard of the current request), users without tenant (admins) in default database
+    """
+    if tenant_scope_id:
+        return get_current_shard() or DEFAULT_DB_ALIAS
+    return DEFAULT_DB_ALIAS
+
+
+def get_shard_index(alias):
+    if alias == DEFAULT_DB_ALIAS:
+        return 0
+    return connections.settings[alias]["SHARD_INDEX"]
+
+
+def get_shard_aliases():
+    return [alias for alias in connections.settings if alias == DEFAULT_DB_ALIAS or "SHARD_INDEX" in connections.settings[alias]]
+
+
+def register_shard(alias, database, index):
+    """
+    Adds a shard to DATABASES at runtime, `database` is a database url or a settings dict.
+    `index` selects id range of the shard, it must never be reused by another shard.
+    """
+    if isinstance(database, str):
+        database = environ.Env.db_url_config(database)
+
+    config = {**database, "SHARD_INDEX": index}
+    if any(get_shard_index(other_alias) == index for other_alias in get_shard_aliases() if other_alias != alias):
+        raise ValueError(f"Shard index {index} is already used")
+
+    # connection handler reads DATABASES only once, new alias is added to both of them
+    configured = connections.configure_settings({DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], alias: config})
+    settings.DATABASES[alias] = config
+    connections.settings[alias] = configured[alias]
+    return connections[alias]
+
+
+def unregister_shard(alias):
+    connections[alias].close()
+    del connections[alias]
+    connections.settings.pop(alias, None)
+    settings.DATABASES.pop(alias, None)
+
+
+def reserve_shard_id_range(using, **kwargs):
+    """
+    post_migrate receiver, moves identity sequences of sharded tables into id range of the shard
+    """
+    from django.apps import apps
+
+    if using not in get_shard_aliases() or get_shard_index(using) == 0:
+        return
+
+    range_start = get_shard_index(using) * SHARD_ID_RANGE + 1
+    with connections[using].cursor() as cursor:
+        for label in SHARDED_MODELS:
+            table = apps.get_model(label)._meta.db_table
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false) "
+                "WHERE (SELECT COALESCE(MAX(id), 0) FROM " + connections[using].ops.quote_name(table) + ") < %s",
+                [table, range_start, range_start],
+            )
+
+
+def mirror_tenant(tenant, alias):
+    """
+    Copies Tenant row into a shard (target of foreign keys of tenant data there)
+    """
+    from tenants.models import Tenant
+
+    values = {field.attname: getattr(tenant, field.attname) for field in Tenant._meta.concrete_fields if not field.primary_key}
+    if not Tenant.objects.using(alias).filter(pk=tenant.pk).update(**values):
+        Tenant.objects.using(alias).bulk_create([Tenant(pk=tenant.pk, **values)])
@@ -0,0 +1,257 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tenants.models import Tenant, Domain
+
+
+logger = logging.getLogger(__name__)
+
+# Only the columns needed to route a request are cached, the rest of the row is deferred
+CACHED_TENANT_FIELDS = ("id", "name", "uuid", "local_id", "is_deleted", "db_alias", "is_migrating")
+
+_MISSING = object()
+
+
+class LocalSharedBackend:
+    """
+    In-process stand-in for the shared tier (used when no redis url is configured and in tests)
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (None, 0))
+            if expires_at < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisSharedBackend:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.errors = (redis.RedisError,)
+
+    def get(self, key):
+        try:
+            return self.client.get(key)
+        except self.errors as e:
+            logger.warning("Shared tenant cache unavailable: %s", e)
+            return None
+
+    def set(self, key, value, timeout):
+        try:
+            self.client.set(key, value, ex=timeout)
+        except self.errors as e:
+            logger.warning("Shared tenant cache unavailable: %s", e)
+
+    def delete_many(self, keys):
+        try:
+            if keys:
+                self.client.delete(*keys)
+        except self.errors as e:
+            logger.warning("Shared tenant cache unavailable: %s", e)
+
+    def clear(self):
+        # keys of other applications can live in the same redis database, so only our prefix is removed
+        try:
+            keys = list(self.client.scan_iter(f"{DomainTenantCache.key_prefix}*"))
+            if keys:
+                self.client.delete(*keys)
+        except self.errors as e:
+            logger.warning("Shared tenant cache unavailable: %s", e)
+
+
+class DomainTenantCache:
+    """
+    Two tier domain -> tenant resolution cache.
+
+    First tier is a per-process LRU with a short timeout (it's not reachable by invalidations sent from other processes),
+    second tier is a shared backend (redis) that is invalidated by Domain and Tenant signals.
+    Domains without tenant are cached as well, so unknown hosts don't hit the database on every request.
+    """
+    key_prefix = "tenants:domain:"
+
+    def __init__(self, shared_backend, local_max_size=1024, local_timeout=30, shared_timeout=300):
+        self.shared_backend = shared_backend
+        self.local_max_size = local_max_size
+        self.local_timeout = local_timeout
+        self.shared_timeout = shared_timeout
+
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+    def get_tenant(self, domain_url):
+        values = self._get_local(domain_url)
+        if values is _MISSING:
+            values = self._get_shared(domain_url)
+            if values is _MISSING:
+                values = self._get_from_db(domain_url)
+                self.shared_backend.set(self._key(domain_url), json.dumps(values), self.shared_timeout)
+                self._count("misses")
+            else:
+                self._count("shared_hits")
+            self._set_local(domain_url, values)
+        else:
+            self._count("local_hits")
+
+        if values is None:
+            return None
+
+        # every caller gets its own instance, cached rows are never shared between requests
+        # from_db expects values in the order of model fields
+        field_names = [field.attname for field in Tenant._meta.concrete_fields if field.attname in values]
+        return Tenant.from_db("default", field_names, [values[field_name] for field_name in field_names])
+
+    def invalidate(self, domain_urls):
+        domain_urls = [domain_url for domain_url in domain_urls if domain_url]
+        if not domain_urls:
+            return
+
+        with self._lock:
+            for domain_url in domain_urls:
+                self._local.pop(domain_url, None)
+            self._stats["invalidations"] += len(domain_urls)
+        self.shared_backend.delete_many([self._key(domain_url) for domain_url in domain_urls])
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            for counter in self._stats:
+                self._stats[counter] = 0
+        self.shared_backend.clear()
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["local_size"] = len(self._local)
+
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else None
+        return stats
+
+    def _key(self, domain_url):
+        return f"{self.key_prefix}{domain_url}"
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _get_local(self, domain_url):
+        with self._lock:
+            entry = self._local.get(domain_url)
+            if entry is None:
+                return _MISSING
+            values, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._local[domain_url]
+                return _MISSING
+            self._local.move_to_end(domain_url)
+            return values
+
+    def _set_local(self, domain_url, values):
+        with self._lock:
+            self._local[domain_url] = (values, time.monotonic() + self.local_timeout)
+            self._local.move_to_end(domain_url)
+            while len(self._local) > self.local_max_size:
+                self._local.popitem(last=False)
+
+    def _get_shared(self, domain_url):
+        raw_value = self.shared_backend.get(self._key(domain_url))
+        if raw_value is None:
+            return _MISSING
+        return json.loads(raw_value)
+
+    def _get_from_db(self, domain_url):
+        return Tenant.objects.filter(domain__domain_url=domain_url).values(*CACHED_TENANT_FIELDS).first()
+
+
+_tenant_cache = None
+_tenant_cache_lock = threading.Lock()
+
+
+def get_tenant_cache():
+    global _tenant_cache
+    if _tenant_cache is None:
+        with _tenant_cache_lock:
+            if _tenant_cache is None:
+                config = getattr(settings, "TENANT_CACHE", {})
+                shared_url = config.get("SHARED_URL")
+                shared_backend = RedisSharedBackend(shared_url) if shared_url else LocalSharedBackend()
+
+                _tenant_cache = DomainTenantCache(
+                    shared_backend,
+                    local_max_size=config.get("LOCAL_MAX_SIZE", 1024),
+                    local_timeout=config.get("LOCAL_TIMEOUT", 30),
+                    shared_timeout=config.get("SHARED_TIMEOUT", 300),
+                )
+    return _tenant_cache
+
+
+def get_tenant_for_domain(domain_url):
+    return get_tenant_cache().get_tenant(domain_url)
+
+
+def get_cache_stats():
+    return get_tenant_cache().stats()
+
+
+def invalidate_domains(domain_urls):
+    domain_urls = set(domain_urls)
+    get_tenant_cache().invalidate(domain_urls)
+    # readers running before commit could have cached the old row again, so we drop it once more after commit
+    transaction.on_commit(lambda: get_tenant_cache().invalidate(domain_urls))
+
+
+@receiver(setting_changed)
+def reset_tenant_cache(setting, **kwargs):
+    global _tenant_cache
+    if setting == "TENANT_CACHE":
+        _tenant_cache = None
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def invalidate_domain(sender, instance, **kwargs):
+    # _loaded_domain_url is the url domain had when it was fetched, so url changes invalidate both urls
+    invalidate_domains({instance.domain_url, getattr(instance, "_loaded_domain_url", None)})
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def invalidate_tenant_domains(sender, instance, created=False, **kwargs):
+    if created:
+        # new tenant has no domain yet, Domain signal will handle it
+        return
+    invalidate_domains(Domain.objects.filter(tenant_id=instance.pk).values_list("domain_url", flat=True))
@@ -1,20 +1,80 @@
 from asgiref.local import Local
+from django.db import DatabaseError, connections
 from django.db.backends.signals import connection_created
 
 
 _thread_locals = Local()
 
+# search_path used by connections while no tenant is active
+DEFAULT_SEARCH_PATH = "public"
+
+
 def set_tenant_schema(tenant_schema_name):
     _thread_locals.schema_name = tenant_schema_name
+    # connections opened before (persistent ones) get the wrapper as well, new ones get it from connection_created
+    for connection in connections.all(initialized_only=True):
+        install_search_path_wrapper(connection)
 
 def get_tenant_schema():
     return getattr(_thread_locals, 'schema_name', None)
 
-def apply_schema(connection, sender, **kwargs):
-    schema_name = get_tenant_schema()
-    if schema_name:
-        with connection.cursor() as cursor:
-            cursor.execute(f'SET search_path TO {schema_name}, public;')
+def get_search_path(schema_name):
+    if not schema_name:
+        return DEFAULT_SEARCH_PATH
+    return f'"{schema_name}", public'
+
+def apply_search_path(connection, schema_name):
+    """
+    Sets search_path of the connection session and verifies the value postgres reports back.
+    Applied path is remembered on the connection, so following queries of the same tenant skip the SET.
+    """
+    search_path = get_search_path(schema_name)
+    # raw cursor of the driver, it doesn't go through execute wrappers again
+    # and it isn't the (possibly server side) cursor of the wrapped query
+    with connection.connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('search_path', %s, false)", [search_path])
+        applied_search_path = cursor.fetchone()[0]
+    if applied_search_path != search_path:
+        connection.tenant_search_path = None
+        raise DatabaseError(f"search_path of connection is '{applied_search_path}' instead of '{search_path}'")
+
+    connection.tenant_search_path = search_path
+    # SET made inside of a transaction is reverted by its rollback, such value can't be trusted by the next request
+    connection.tenant_search_path_in_atomic = connection.in_atomic_block
+
+def search_path_wrapper(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection, it runs before each query in the thread (task) that owns
+    the connection, so a connection checked out by a new request always uses schema of that request's tenant.
+    """
+    connection = context["connection"]
+    search_path = get_search_path(get_tenant_schema())
+
+    if getattr(connection, "tenant_search_path", None) != search_path:
+        apply_search_path(connection, get_tenant_schema())
+
+    return execute(sql, params, many, context)
+
+def install_search_path_wrapper(connection):
+    if search_path_wrapper not in connection.execute_wrappers:
+        # first position, execute_wrapper() context managers pop their wrappers from the end
+        connection.execute_wrappers.insert(0, search_path_wrapper)
+
+def reset_tenant_schema(**kwargs):
+    """
+    Connections are returned at the end of each request (kept open when CONN_MAX_AGE is set),
+    tenant context of the request is cleared, search_path stays cached unless it was set inside a transaction
+    """
+    set_tenant_schema(None)
+    for connection in connections.all(initialized_only=True):
+        if getattr(connection, "tenant_search_path_in_atomic", False):
+            connection.tenant_search_path = None
+
+def prepare_connection(connection, sender, **kwargs):
+    # new session starts with server default search_path
+    connection.tenant_search_path = None
+    connection.tenant_search_path_in_atomic = False
+    install_search_path_wrapper(connection)
 
 # Connecting the signal
-connection_created.connect(apply_schema)
\ No newline at end of file
+connection_created.connect(prepare_connection)
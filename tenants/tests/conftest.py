@@ -9,6 +9,7 @@ from rest_framework.test import APIClient
 from user_management.models import BaseUser
 from user_management.utils import Role
 from tenants.models import Tenant, Domain, Organization, Department, Customer
+from tenants.tenant_cache import get_tenant_cache
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
 django.setup()
@@ -21,6 +22,13 @@ def setup_django():
 def client():
     return APIClient()
 
+@pytest.fixture(autouse=True)
+def clear_tenant_cache():
+    # test database is rolled back after each test, cached tenants would outlive their rows
+    get_tenant_cache().clear()
+    yield
+    get_tenant_cache().clear()
+
 @pytest.fixture
 def tenant_setup(db):
     test_data = {
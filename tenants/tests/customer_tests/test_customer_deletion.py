@@ -50,7 +50,7 @@ def test_admin_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.all().count()
+    assert len(list_response.data["results"]) == Customer.objects.all().count()
 
     assert Customer.objects.filter(id=customer1.id).exists()
 
@@ -63,7 +63,7 @@ def test_admin_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.all().count()
+    assert len(list_response.data["results"]) == Customer.objects.all().count()
 
     client.defaults['HTTP_HOST'] = domain_url2
 
@@ -78,7 +78,7 @@ def test_admin_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.all().count()
+    assert len(list_response.data["results"]) == Customer.objects.all().count()
 
     token_response = get_token_response(client, domain_url1, customer_user.username)
     assert token_response.status_code == HTTP_401_UNAUTHORIZED
@@ -116,7 +116,7 @@ def test_tenant_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department__organization__tenant=tenant1).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization__tenant=tenant1).count()
 
     assert Customer.objects.filter(id=customer1.id).exists()
 
@@ -131,7 +131,7 @@ def test_tenant_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department__organization__tenant=tenant1, is_deleted=False).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization__tenant=tenant1, is_deleted=False).count()
 
     token_response = get_token_response(client, domain_url1, customer_user.username)
     assert token_response.status_code == HTTP_401_UNAUTHORIZED
@@ -169,8 +169,8 @@ def test_organization_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department__organization=org_user.organization_scope, is_deleted=False).count()
-    assert len(list_response.data) == Customer.objects.filter(department__organization=org_user.organization_scope).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization=org_user.organization_scope, is_deleted=False).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization=org_user.organization_scope).count()
 
     delete_response = client.delete(f"/api/customers/{customer1.local_id}/", format="json")
 
@@ -179,8 +179,8 @@ def test_organization_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department__organization=org_user.organization_scope, is_deleted=False).count()
-    assert len(list_response.data) < Customer.objects.filter(department__organization=org_user.organization_scope).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization=org_user.organization_scope, is_deleted=False).count()
+    assert len(list_response.data["results"]) < Customer.objects.filter(department__organization=org_user.organization_scope).count()
 
 
 @pytest.mark.django_db
@@ -217,7 +217,7 @@ def test_department_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department=dept_user.department_scope, is_deleted=False).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department=dept_user.department_scope, is_deleted=False).count()
 
     delete_response = client.delete(f"/api/customers/{customer1.local_id}/", format="json")
 
@@ -226,7 +226,7 @@ def test_department_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department=dept_user.department_scope, is_deleted=False).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department=dept_user.department_scope, is_deleted=False).count()
 
     delete_response = client.delete(f"/api/customers/{customer2.local_id}/", format="json")
 
@@ -264,7 +264,7 @@ def test_customer_user_customer_delete(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == 1
+    assert len(list_response.data["results"]) == 1
 
     delete_response = client.delete(f"/api/customers/{customer1.id}/", format="json")
 
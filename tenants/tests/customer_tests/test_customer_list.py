@@ -27,14 +27,14 @@ def test_admin_customer_list(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == all_customers_count
+    assert len(list_response.data["results"]) == all_customers_count
 
     client.defaults['HTTP_HOST'] = domain_url2
 
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == all_customers_count
+    assert len(list_response.data["results"]) == all_customers_count
 
 
 @pytest.mark.django_db
@@ -58,7 +58,7 @@ def test_tenant_user_customer_list(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department__organization__tenant=tenant1).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization__tenant=tenant1).count()
 
     client.defaults['HTTP_HOST'] = domain_url2
 
@@ -89,7 +89,7 @@ def test_organization_user_customer_list(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department__organization=org_user.organization_scope).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization=org_user.organization_scope).count()
 
     client.defaults['HTTP_HOST'] = domain_url2
 
@@ -118,9 +118,9 @@ def test_department_user_customer_list(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == Customer.objects.filter(department=dept_user.department_scope).count()
+    assert len(list_response.data["results"]) == Customer.objects.filter(department=dept_user.department_scope).count()
 
-    for element in list_response.data:
+    for element in list_response.data["results"]:
         assert element.get("department_id") == dept_user.department_scope.local_id
 
     client.defaults['HTTP_HOST'] = domain_url2
@@ -151,7 +151,7 @@ def test_customer_user_customer_list(client, tenant_setup):
     list_response = client.get(f"/api/customers/", format="json")
 
     assert list_response.status_code == HTTP_200_OK
-    assert len(list_response.data) == 1
+    assert len(list_response.data["results"]) == 1
 
     client.defaults['HTTP_HOST'] = domain_url2
 
@@ -0,0 +1,52 @@
+import pytest
+from rest_framework.status import HTTP_201_CREATED
+
+from tenants.models import Organization, Department, Customer
+from tenants.tests.conftest import get_access_token
+
+
+@pytest.mark.django_db
+def test_ancestry_is_set_on_create(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    for department in Department.objects.all():
+        assert department.tenant_id == department.organization.tenant_id
+    for customer in Customer.objects.all():
+        assert customer.organization_id == customer.department.organization_id
+        assert customer.tenant_id == customer.department.organization.tenant_id
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    create_response = client.post("/api/customers/", {"name": "New Customer", "department": 1}, format="json")
+    assert create_response.status_code == HTTP_201_CREATED
+
+    customer = Customer.objects.get(name="New Customer")
+    assert customer.tenant_id == tenant1.id
+    assert customer.organization_id == customer.department.organization_id
+
+
+@pytest.mark.django_db
+def test_ancestry_follows_moved_department(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    organization1, organization2 = tenant_setup["organizations"][tenant1]
+    department = tenant_setup["departments"][organization1][0]
+
+    department = Department.objects.get(pk=department.pk)
+    department.organization = organization2
+    department.save()
+
+    assert set(Customer.objects.filter(department=department).values_list("organization_id", flat=True)) == {organization2.id}
+
+
+@pytest.mark.django_db
+def test_ancestry_follows_moved_organization(tenant_setup):
+    tenant1, tenant2 = tenant_setup["tenants"][:2]
+    organization = Organization.objects.get(pk=tenant_setup["organizations"][tenant1][0].pk)
+
+    organization.tenant = tenant2
+    organization.save()
+
+    assert set(Department.objects.filter(organization=organization).values_list("tenant_id", flat=True)) == {tenant2.id}
+    assert set(Customer.objects.filter(organization=organization).values_list("tenant_id", flat=True)) == {tenant2.id}
@@ -0,0 +1,139 @@
+import importlib
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.test import AsyncClient
+from django.urls import clear_url_caches, resolve
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_201_CREATED, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND
+
+import main.urls
+from tenants.models import Customer, Department, Domain
+from tenants.views import CustomerViewSet
+from tenants.tests.conftest import get_access_token
+
+
+def reload_urls():
+    # viewsets pick sync or async views when routes are built
+    importlib.reload(main.urls)
+    clear_url_caches()
+
+
+@pytest.fixture
+def asgi_mode(settings):
+    settings.SERVER_MODE = "asgi"
+    reload_urls()
+    yield
+    settings.SERVER_MODE = "wsgi"
+    reload_urls()
+
+
+@pytest.fixture
+def async_domain_url(tenant_setup):
+    """
+    AsyncClient always sends Host: testserver, so first tenant is served on that domain
+    """
+    domain = tenant_setup["domains"][tenant_setup["tenants"][0]]
+    domain.domain_url = "testserver"
+    domain.save()
+    return domain.domain_url
+
+
+def async_get(path, access_token=None):
+    headers = {"authorization": f"Bearer {access_token}"} if access_token else {}
+    return async_to_sync(AsyncClient().get)(path, headers=headers)
+
+
+@pytest.mark.django_db
+def test_read_views_are_async_only_in_asgi_mode(settings, asgi_mode):
+    assert iscoroutinefunction(resolve("/api/customers/").func)
+    assert iscoroutinefunction(resolve("/api/organizations/1/").func)
+    assert not iscoroutinefunction(resolve("/api/tenants/").func)
+
+    settings.SERVER_MODE = "wsgi"
+    reload_urls()
+    assert not iscoroutinefunction(resolve("/api/customers/").func)
+
+
+@pytest.mark.django_db
+def test_async_list_matches_scope(client, tenant_setup, async_domain_url, asgi_mode):
+    dept_user = tenant_setup["users"]["departments"][0]
+
+    access_token = get_access_token(client, async_domain_url, dept_user.username)
+    list_response = async_get("/api/customers/", access_token)
+
+    assert list_response.status_code == HTTP_200_OK
+    expected = Customer.objects.filter(department=dept_user.department_scope, is_deleted=False)
+    assert sorted(item["id"] for item in list_response.json()["results"]) == sorted(expected.values_list("local_id", flat=True))
+    assert all(item["department_id"] == dept_user.department_scope.local_id for item in list_response.json()["results"])
+
+
+@pytest.mark.django_db
+def test_async_list_pages_with_async_orm(client, tenant_setup, async_domain_url, asgi_mode):
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    access_token = get_access_token(client, async_domain_url, tenant_user.username)
+
+    # paginated list must not fall back to sync list view
+    with mock.patch.object(CustomerViewSet, "list", side_effect=AssertionError("sync list was used")):
+        ids = []
+        response = async_get("/api/customers/?page_size=2", access_token)
+        while True:
+            assert response.status_code == HTTP_200_OK
+            assert len(response.json()["results"]) <= 2
+            ids.extend(item["id"] for item in response.json()["results"])
+            if not response.json()["next"]:
+                break
+            response = async_get(response.json()["next"], access_token)
+
+    expected = Customer.objects.filter(tenant=tenant_user.tenant_scope, is_deleted=False).order_by("local_id")
+    assert ids == list(expected.values_list("local_id", flat=True))
+
+
+@pytest.mark.django_db
+def test_async_retrieve(client, tenant_setup, async_domain_url, asgi_mode):
+    org_user = tenant_setup["users"]["organizations"][0]
+    department = Department.objects.filter(organization=org_user.organization_scope).first()
+
+    access_token = get_access_token(client, async_domain_url, org_user.username)
+
+    retrieve_response = async_get(f"/api/departments/{department.local_id}/", access_token)
+    assert retrieve_response.status_code == HTTP_200_OK
+    assert retrieve_response.json()["name"] == department.name
+    assert retrieve_response.json()["organization_id"] == org_user.organization_scope.local_id
+
+    missing_response = async_get("/api/departments/999999/", access_token)
+    assert missing_response.status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_async_views_check_tenant_and_authentication(client, tenant_setup, async_domain_url, asgi_mode):
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    other_tenant_user = tenant_setup["users"]["tenants"][1]
+    tenant2 = tenant_setup["tenants"][1]
+    domain_url2 = tenant_setup["domains"][tenant2].domain_url
+
+    access_token = get_access_token(client, async_domain_url, tenant_user.username)
+    other_access_token = get_access_token(client, domain_url2, other_tenant_user.username)
+
+    assert async_get("/api/organizations/").status_code == HTTP_401_UNAUTHORIZED
+    assert async_get("/api/organizations/", other_access_token).status_code == HTTP_403_FORBIDDEN
+
+    Domain.objects.filter(domain_url=async_domain_url).delete()
+    assert async_get("/api/organizations/", access_token).status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_writes_use_sync_view_in_asgi_mode(client, tenant_setup, async_domain_url, asgi_mode):
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, async_domain_url, tenant_user.username)
+
+    create_response = async_to_sync(AsyncClient().post)(
+        "/api/organizations/",
+        {"name": "Async Organization"},
+        content_type="application/json",
+        headers={"authorization": f"Bearer {access_token}"},
+    )
+
+    assert create_response.status_code == HTTP_201_CREATED
+    assert create_response.json()["name"] == "Async Organization"
@@ -173,3 +173,49 @@ def test_incorrect_user_authentication(client, tenant_setup):
      response = client.post(url, data, format="json")
 
      assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_token_authenticated_once_per_request(client, tenant_setup):
+     """
+     TenantMiddleware and DRF share the same authentication result,
+     so a request decodes the token and fetches its user only once
+     """
+     from unittest import mock
+     from django.db import connection
+     from django.test.utils import CaptureQueriesContext
+     from tenants.tests.conftest import get_access_token
+     from user_management.authentication import RequestScopedJWTAuthentication
+
+     tenant1 = tenant_setup["tenants"][0]
+     domain_url1 = tenant_setup["domains"][tenant1].domain_url
+     access_token = get_access_token(client, domain_url1, tenant_setup["users"]["tenants"][0].username)
+     client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+     with mock.patch.object(
+               RequestScopedJWTAuthentication,
+               "get_validated_token",
+               autospec=True,
+               side_effect=RequestScopedJWTAuthentication.get_validated_token,
+     ) as get_validated_token, CaptureQueriesContext(connection) as queries:
+          response = client.get("/api/customers/", format="json")
+
+     assert response.status_code == status.HTTP_200_OK
+     assert get_validated_token.call_count == 1
+
+     user_queries = [query for query in queries if 'FROM "user_management_baseuser"' in query["sql"]]
+     assert len(user_queries) == 1
+
+
+@pytest.mark.django_db
+def test_invalid_token_rejected_once(client, tenant_setup):
+     """
+     Invalid token is rejected by DRF with 401, even though middleware already failed to authenticate it
+     """
+     tenant1 = tenant_setup["tenants"][0]
+     client.defaults['HTTP_HOST'] = tenant_setup["domains"][tenant1].domain_url
+     client.credentials(HTTP_AUTHORIZATION="Bearer invalid.token.value")
+
+     response = client.get("/api/customers/", format="json")
+
+     assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,124 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from tenants.models import Organization, Department, Customer
+from tenants.tests.conftest import get_access_token
+
+
+def authenticate(client, tenant_setup, user_type):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    user = tenant_setup["users"][user_type][0]
+
+    client.defaults['HTTP_HOST'] = domain_url1
+    access_token = get_access_token(client, domain_url1, user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    return tenant1, user
+
+
+def bulk_customers(prefix, departments, count):
+    return [
+        {"name": f"{prefix} {index}", "department": departments[index % len(departments)].local_id}
+        for index in range(count)
+    ]
+
+
+@pytest.mark.django_db
+def test_tenant_user_bulk_creates_customers(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    departments = list(Department.objects.filter(tenant=tenant1).order_by("pk"))
+
+    response = client.post("/api/customers/bulk/", bulk_customers("Bulk customer", departments, 30), format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.data) == 30
+
+    created = Customer.objects.filter(name__startswith="Bulk customer").select_related("department")
+    assert created.count() == 30
+    local_ids = [customer.local_id for customer in created]
+    assert len(set(local_ids)) == 30
+    assert not set(local_ids) & set(Customer.objects.filter(tenant=tenant1).exclude(pk__in=created).values_list("local_id", flat=True))
+    for customer in created:
+        assert customer.tenant_id == tenant1.id
+        assert customer.organization_id == customer.department.organization_id
+
+    # non admin users see local ids
+    assert sorted(row["id"] for row in response.data) == sorted(local_ids)
+
+
+@pytest.mark.django_db
+def test_bulk_create_query_count_does_not_grow_with_size(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    departments = list(Department.objects.filter(tenant=tenant1).order_by("pk"))
+
+    # first request also warms up permission and tenant caches
+    client.post("/api/customers/bulk/", bulk_customers("Warm up", departments, 1), format="json")
+
+    query_counts = []
+    for prefix, count in [("Small", 5), ("Large", 50)]:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post("/api/customers/bulk/", bulk_customers(prefix, departments, count), format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        query_counts.append(len(queries))
+
+    assert query_counts[0] == query_counts[1]
+
+
+@pytest.mark.django_db
+def test_organization_user_bulk_create_outside_scope_is_rejected(client, tenant_setup):
+    tenant1, org_user = authenticate(client, tenant_setup, "organizations")
+    organization2 = tenant_setup["organizations"][tenant1][1]
+    own_department = Department.objects.filter(organization=org_user.organization_scope_id).first()
+    other_department = tenant_setup["departments"][organization2][0]
+
+    data = [
+        {"name": "Bulk customer 1", "department": own_department.local_id},
+        {"name": "Bulk customer 2", "department": other_department.local_id},
+    ]
+    response = client.post("/api/customers/bulk/", data, format="json")
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert not Customer.objects.filter(name__startswith="Bulk customer").exists()
+
+
+@pytest.mark.django_db
+def test_bulk_create_with_unknown_parent(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    organization1 = tenant_setup["organizations"][tenant1][0]
+
+    data = [
+        {"name": "Bulk department 1", "organization": organization1.local_id},
+        {"name": "Bulk department 2", "organization": 999},
+    ]
+    response = client.post("/api/departments/bulk/", data, format="json")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert not Department.objects.filter(name__startswith="Bulk department").exists()
+
+
+@pytest.mark.django_db
+def test_bulk_create_rejects_duplicate_names(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    existing = Organization.objects.filter(tenant=tenant1).first()
+
+    response = client.post("/api/organizations/bulk/", [{"name": "Bulk org"}, {"name": "Bulk org"}], format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.post("/api/organizations/bulk/", [{"name": "Bulk org"}, {"name": existing.name}], format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Organization.objects.filter(name="Bulk org").exists()
+
+
+@pytest.mark.django_db
+def test_admin_bulk_creates_departments_by_id(client, tenant_setup):
+    tenant1, admin_user = authenticate(client, tenant_setup, "admins")
+    organization1 = tenant_setup["organizations"][tenant1][0]
+
+    data = [{"name": f"Bulk department {index}", "organization": organization1.id} for index in range(3)]
+    response = client.post("/api/departments/bulk/", data, format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [row["organization_id"] for row in response.data] == [organization1.id] * 3
+    assert Department.objects.filter(name__startswith="Bulk department", tenant=tenant1).count() == 3
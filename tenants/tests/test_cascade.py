@@ -0,0 +1,102 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from tenants.cascade import soft_delete_cascade
+from tenants.models import Organization, Department, Customer
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+
+def soft_delete(instance):
+    instance.soft_delete()
+    return soft_delete_cascade(instance, sample_size=3)
+
+
+@pytest.mark.django_db
+def test_organization_cascades_to_customers_and_users(tenant_setup, django_capture_on_commit_callbacks):
+    tenant1 = tenant_setup["tenants"][0]
+    organization = tenant_setup["organizations"][tenant1][0]
+    other_organization = tenant_setup["organizations"][tenant1][1]
+    customer_user = tenant_setup["users"]["customers"][0]
+    token_version = customer_user.token_version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        result = soft_delete(organization)
+
+    assert result["tenants.department"]["count"] == 2
+    assert result["tenants.customer"]["count"] == 4
+    # users of the organization, its departments and customers
+    assert result["user_management.baseuser"]["count"] == 3
+    assert len(result["tenants.customer"]["sample"]) == 3
+
+    assert not Department.objects.filter(organization=organization, is_deleted=False).exists()
+    assert not Customer.objects.filter(organization=organization, is_deleted=False).exists()
+    assert not BaseUser.objects.filter(organization_scope=organization, is_deleted=False).exists()
+    assert Customer.objects.filter(organization=other_organization, is_deleted=False).count() == 4
+    assert not BaseUser.objects.get(pk=tenant_setup["users"]["tenants"][0].pk).is_deleted
+
+    deleted_at = Organization.objects.get(pk=organization.pk).deleted_at
+    assert set(Customer.objects.filter(organization=organization).values_list("deleted_at", flat=True)) == {deleted_at}
+    assert BaseUser.objects.get(pk=customer_user.pk).token_version == token_version + 1
+
+
+@pytest.mark.django_db
+def test_cascade_queries_do_not_depend_on_subtree_size(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    small, large = tenant_setup["organizations"][tenant1]
+    departments = tenant_setup["departments"][large]
+    # users of the small organization are deleted at its level, both subtrees have the same shape
+    BaseUser.objects.create_user(username="cascade_user", password="password", tenant_scope=tenant1, organization_scope=large)
+    Customer.bulk_create_for_tenant(
+        [Customer(name=f"Cascade customer {index}", department=departments[index % 2]) for index in range(200)], tenant1,
+    )
+
+    with CaptureQueriesContext(connection) as small_queries:
+        soft_delete(small)
+    with CaptureQueriesContext(connection) as large_queries:
+        result = soft_delete(large)
+
+    assert result["tenants.customer"]["count"] == 204
+    assert len(result["tenants.customer"]["sample"]) == 3
+    assert len(large_queries) == len(small_queries)
+
+
+@pytest.mark.django_db
+def test_cascade_skips_subtrees_deleted_before(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    organization = tenant_setup["organizations"][tenant1][0]
+    department = tenant_setup["departments"][organization][0]
+    soft_delete(department)
+    department_deleted_at = Department.objects.get(pk=department.pk).deleted_at
+
+    result = soft_delete(organization)
+
+    assert result["tenants.department"]["count"] == 1
+    assert result["tenants.customer"]["count"] == 2
+    assert set(Customer.objects.filter(department=department).values_list("deleted_at", flat=True)) == {department_deleted_at}
+
+
+@pytest.mark.django_db
+def test_soft_deleted_department_users_cannot_authenticate(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    department = tenant_setup["departments"][tenant_setup["organizations"][tenant1][0]][0]
+    customer_user = tenant_setup["users"]["customers"][0]
+
+    client.defaults['HTTP_HOST'] = domain_url1
+    access_token = get_access_token(client, domain_url1, tenant_setup["users"]["tenants"][0].username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    response = client.delete(f"/api/departments/{department.local_id}/", format="json")
+
+    assert response.status_code == 204
+    assert response.data["soft_deletion_cascade"]["tenants.customer"]["count"] == 2
+    assert response.data["soft_deletion_cascade"]["user_management.baseuser"] == {
+        "count": 2, "sample": [tenant_setup["users"]["departments"][0].username, customer_user.username],
+    }
+
+    client.credentials()
+    token_response = client.post(reverse('token_obtain_pair'), {"username": customer_user.username, "password": "password"}, format="json")
+    assert token_response.status_code == 401
@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+
+from tenants.models import Customer, Department
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+
+def read_stream(response):
+    assert response.status_code == HTTP_200_OK
+    assert response.streaming
+    return b"".join(response.streaming_content).decode()
+
+
+def authenticate(client, tenant_setup, user_type):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    user = tenant_setup["users"][user_type][0]
+
+    access_token = get_access_token(client, domain_url1, user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    return tenant1, user
+
+
+@pytest.mark.django_db
+def test_customer_export_ndjson_matches_scope(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+
+    response = client.get("/api/customers/export/", {"type": "ndjson"})
+    assert response["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in read_stream(response).splitlines()]
+
+    expected = Customer.objects.filter(department__organization__tenant=tenant1, is_deleted=False).order_by("pk")
+    assert [row["id"] for row in rows] == list(expected.values_list("local_id", flat=True))
+    # same representation as list endpoint
+    list_response = client.get("/api/customers/", format="json")
+    assert sorted(rows, key=lambda row: row["id"]) == sorted(list_response.data["results"], key=lambda row: row["id"])
+
+
+@pytest.mark.django_db
+def test_department_export_csv(client, tenant_setup):
+    authenticate(client, tenant_setup, "admins")
+
+    response = client.get("/api/departments/export/", {"type": "csv"})
+    assert response["Content-Type"] == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(read_stream(response))))
+
+    assert [int(row["id"]) for row in rows] == list(Department.objects.order_by("pk").values_list("id", flat=True))
+    assert {"name", "organization_id", "organization_local_id"} <= set(rows[0])
+
+
+@pytest.mark.django_db
+def test_user_export_is_limited_to_scope(client, tenant_setup):
+    tenant1, org_user = authenticate(client, tenant_setup, "organizations")
+
+    rows = [json.loads(line) for line in read_stream(client.get("/api/users/export/")).splitlines()]
+
+    expected = org_user.get_limited_queryset(BaseUser)
+    assert sorted(row["username"] for row in rows) == sorted(expected.values_list("username", flat=True))
+
+
+@pytest.mark.django_db
+def test_export_reads_rows_with_single_query(client, tenant_setup):
+    authenticate(client, tenant_setup, "tenants")
+
+    response = client.get("/api/customers/export/")
+    with CaptureQueriesContext(connection) as queries:
+        read_stream(response)
+
+    # related departments come with the rows, no query per row
+    assert len([query for query in queries if "tenants_customer" in query["sql"]]) == 1
+    assert not [query for query in queries if "tenants_customer" not in query["sql"] and "tenants_department" in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_export_under_asgi_streams_asynchronously(client, tenant_setup, settings):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    settings.SERVER_MODE = "asgi"
+
+    response = client.get("/api/customers/export/")
+    assert response.is_async
+
+    async def read_async_stream():
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    content = async_to_sync(read_async_stream)()
+    assert len(content.splitlines()) == Customer.objects.filter(department__organization__tenant=tenant1).count()
+
+
+@pytest.mark.django_db
+def test_export_rejects_unknown_type(client, tenant_setup):
+    authenticate(client, tenant_setup, "tenants")
+
+    response = client.get("/api/customers/export/", {"type": "xml"})
+    assert response.status_code == HTTP_400_BAD_REQUEST
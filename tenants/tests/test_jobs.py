@@ -0,0 +1,200 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+
+from tenants.jobs import SoftDeleteCascadeJob, BulkCreateJob, claim_job, enqueue_job, run_job
+from tenants.models import Job, Tenant, Domain, Department, Customer
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+
+ASYNC = {"HTTP_PREFER": "respond-async"}
+
+
+def authenticate(client, tenant_setup, user_type):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    user = tenant_setup["users"][user_type][0]
+
+    client.defaults['HTTP_HOST'] = domain_url1
+    access_token = get_access_token(client, domain_url1, user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    return tenant1, user
+
+
+def run_worker(batch_size=2):
+    call_command("run_job_worker", "--once", "--batch-size", str(batch_size), stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_soft_delete_runs_in_background(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    organization = tenant_setup["organizations"][tenant1][0]
+
+    response = client.delete(f"/api/organizations/{organization.local_id}/", format="json", **ASYNC)
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data["status"] == Job.Status.PENDING
+    assert response["Location"].endswith(f"/api/jobs/{response.data['id']}/")
+    # the organization is gone right away, its subtree waits for the worker
+    assert len(client.get("/api/organizations/").data) == 1
+    assert Department.objects.filter(organization=organization, is_deleted=False).count() == 2
+
+    run_worker()
+
+    assert not Customer.objects.filter(organization=organization, is_deleted=False).exists()
+    assert not BaseUser.objects.filter(organization_scope=organization, is_deleted=False).exists()
+
+    job_response = client.get(f"/api/jobs/{response.data['id']}/")
+    assert job_response.status_code == status.HTTP_200_OK
+    assert job_response.data["status"] == Job.Status.SUCCEEDED
+    assert job_response.data["result"]["tenants.customer"]["count"] == 4
+    assert job_response.data["processed"] == 2 + 4 + 3
+
+
+@pytest.mark.django_db
+def test_interrupted_job_resumes_from_checkpoint(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    organization = tenant_setup["organizations"][tenant1][0]
+    organization.soft_delete()
+    job = Job.objects.create(
+        kind="soft_delete_cascade", tenant=tenant1, payload={"model": "tenants.organization", "pk": organization.pk},
+        status=Job.Status.RUNNING, attempts=1,
+    )
+
+    # worker stopped after two batches
+    handler = SoftDeleteCascadeJob(job, 1)
+    handler.run_batch()
+    handler.run_batch()
+    Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+    job = claim_job("second worker")
+    assert job is not None and job.attempts == 2
+    assert job.checkpoint["result"]["tenants.department"]["count"] == 2
+
+    job = run_job(job, batch_size=1)
+
+    assert job.status == Job.Status.SUCCEEDED
+    assert job.result["tenants.department"]["count"] == 2
+    assert job.result["tenants.customer"]["count"] == 4
+    assert not Customer.objects.filter(organization=organization, is_deleted=False).exists()
+
+
+@pytest.mark.django_db
+def test_taken_over_job_stops_first_worker(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    organization = tenant_setup["organizations"][tenant1][0]
+    organization.soft_delete()
+    enqueue_job("soft_delete_cascade", {"model": "tenants.organization", "pk": organization.pk}, tenant=tenant1)
+
+    # first worker runs one batch, then its heartbeats stop and the second worker claims the job
+    first = claim_job("first worker")
+    SoftDeleteCascadeJob(first, 1).run_batch()
+    Job.objects.filter(pk=first.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+    second = claim_job("second worker")
+    assert second.pk == first.pk and second.checkpoint["result"]["tenants.department"]["count"] == 1
+
+    # first worker resumes, its batch is rolled back and it stops without finishing the job
+    run_job(first, batch_size=1)
+
+    job = Job.objects.get(pk=first.pk)
+    assert (job.status, job.worker, job.checkpoint) == (Job.Status.RUNNING, "second worker", second.checkpoint)
+    assert Department.objects.filter(organization=organization, is_deleted=False).count() == 1
+
+    second = run_job(second, batch_size=1)
+
+    assert second.status == Job.Status.SUCCEEDED
+    assert second.result["tenants.department"]["count"] == 2
+    assert not Customer.objects.filter(organization=organization, is_deleted=False).exists()
+
+    # a late failure of the first worker doesn't overwrite the end saved by the second one
+    first.payload = {"model": "tenants.organization", "pk": 0}
+    assert run_job(first).status == Job.Status.FAILED
+    job = Job.objects.get(pk=first.pk)
+    assert (job.status, job.error) == (Job.Status.SUCCEEDED, "")
+
+
+@pytest.mark.django_db
+def test_running_job_is_not_taken_over(tenant_setup):
+    Job.objects.create(kind="create_tenant", payload={"name": "Job tenant"}, status=Job.Status.RUNNING, heartbeat_at=timezone.now())
+
+    assert claim_job("second worker") is None
+
+
+@pytest.mark.django_db
+def test_bulk_create_runs_in_background(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    departments = list(Department.objects.filter(tenant=tenant1).order_by("pk"))
+    payload = [
+        {"name": f"Job customer {index}", "department": departments[index % len(departments)].local_id}
+        for index in range(15)
+    ]
+
+    response = client.post("/api/customers/bulk/", payload, format="json", **ASYNC)
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data["total"] == 15
+    assert not Customer.objects.filter(name__startswith="Job customer").exists()
+
+    run_worker(batch_size=4)
+
+    created = Customer.objects.filter(name__startswith="Job customer")
+    assert created.count() == 15
+    assert {customer.tenant_id for customer in created} == {tenant1.id}
+    assert len({customer.local_id for customer in created}) == 15
+
+    job = Job.objects.get(pk=response.data["id"])
+    assert job.status == Job.Status.SUCCEEDED
+    assert job.result == {"created": 15}
+
+
+@pytest.mark.django_db
+def test_bulk_create_batch_without_checkpoint_is_not_repeated(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    department = Department.objects.filter(tenant=tenant1).first()
+    payload = [{"name": f"Job customer {index}", "department": department.local_id} for index in range(5)]
+    job = Job.objects.get(pk=client.post("/api/customers/bulk/", payload, format="json", **ASYNC).data["id"])
+
+    BulkCreateJob(job, 3).run_batch()
+    # checkpoint of the batch was lost (data written to another shard)
+    job.checkpoint = {}
+    job.save()
+
+    job = run_job(claim_job("worker"), batch_size=3)
+
+    assert job.status == Job.Status.SUCCEEDED
+    assert Customer.objects.filter(name__startswith="Job customer").count() == 5
+
+
+@pytest.mark.django_db
+def test_admin_creates_tenant_in_background(client, tenant_setup):
+    admin = tenant_setup["users"]["admins"][0]
+    client.defaults['HTTP_HOST'] = "localhost"
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_access_token(client, 'localhost', admin.username)}")
+
+    response = client.post("/api/tenants/", {"name": "Job tenant", "domain_url": "jobtenant.localhost"}, format="json", **ASYNC)
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert not Tenant.objects.filter(name="Job tenant").exists()
+
+    run_worker()
+
+    tenant = Tenant.objects.get(name="Job tenant")
+    assert Domain.objects.get(tenant=tenant).domain_url == "jobtenant.localhost"
+    assert client.get(f"/api/jobs/{response.data['id']}/").data["result"] == {"id": tenant.id}
+
+
+@pytest.mark.django_db
+def test_jobs_are_visible_to_their_users(client, tenant_setup):
+    tenant1, tenant_user = authenticate(client, tenant_setup, "tenants")
+    job = Job.objects.create(kind="create_tenant", payload={"name": "Job tenant"}, created_by_id=tenant_setup["users"]["admins"][0].pk)
+
+    assert client.get(f"/api/jobs/{job.pk}/").status_code == status.HTTP_404_NOT_FOUND
+
+    job.created_by_id = tenant_user.pk
+    job.save()
+    assert client.get(f"/api/jobs/{job.pk}/").status_code == status.HTTP_200_OK
@@ -0,0 +1,109 @@
+from unittest import mock
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from tenants.models import Organization, Department, Customer
+from tenants.tests.conftest import get_access_token
+from user_management.models import ScopedUserMixin
+
+
+def authenticate(client, tenant_setup, user_type):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    user = tenant_setup["users"][user_type][0]
+
+    client.defaults['HTTP_HOST'] = domain_url1
+    access_token = get_access_token(client, domain_url1, user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    return tenant1
+
+
+def add_objects(tenant_setup, tenant, endpoint, count):
+    organization = tenant_setup["organizations"][tenant][0]
+    department = tenant_setup["departments"][organization][0]
+    if endpoint == "organizations":
+        instances = [Organization(name=f"Query org {index}", tenant=tenant) for index in range(count)]
+    elif endpoint == "departments":
+        instances = [Department(name=f"Query department {index}", organization=organization) for index in range(count)]
+    else:
+        instances = [Customer(name=f"Query customer {index}", department=department) for index in range(count)]
+    type(instances[0]).bulk_create_for_tenant(instances, tenant)
+
+
+def list_queries(client, endpoint):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(f"/api/{endpoint}/", format="json")
+    assert response.status_code == status.HTTP_200_OK
+    return len(queries), response
+
+
+def rows(response):
+    # customers are paginated
+    return response.data["results"] if "results" in response.data else response.data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("user_type", ["admins", "tenants"])
+@pytest.mark.parametrize("endpoint", ["organizations", "departments", "customers"])
+def test_list_queries_do_not_depend_on_rows(client, tenant_setup, user_type, endpoint):
+    tenant1 = authenticate(client, tenant_setup, user_type)
+    # first request of the test warms up caches (tenant resolution, token version)
+    list_queries(client, endpoint)
+    small_count, small_response = list_queries(client, endpoint)
+
+    add_objects(tenant_setup, tenant1, endpoint, 30)
+    large_count, large_response = list_queries(client, endpoint)
+
+    assert len(rows(large_response)) == len(rows(small_response)) + 30
+    assert large_count == small_count
+
+
+@pytest.mark.django_db
+def test_parent_local_ids_come_from_annotations(client, tenant_setup):
+    tenant1 = authenticate(client, tenant_setup, "tenants")
+    organization = tenant_setup["organizations"][tenant1][0]
+    department = tenant_setup["departments"][organization][0]
+
+    response = client.get("/api/customers/", format="json")
+    customers = {item["name"]: item for item in response.data["results"]}
+    customer = tenant_setup["customers"][department][0]
+
+    assert customers[customer.name]["department_id"] == department.local_id
+
+    detail = client.get(f"/api/customers/{customer.local_id}/", format="json")
+    assert detail.data["department_id"] == department.local_id
+
+
+@pytest.mark.django_db
+def test_moved_object_shows_new_parent(client, tenant_setup):
+    tenant1 = authenticate(client, tenant_setup, "admins")
+    organization = tenant_setup["organizations"][tenant1][0]
+    source, target = tenant_setup["departments"][organization]
+    customer = tenant_setup["customers"][source][0]
+
+    response = client.patch(f"/api/customers/{customer.id}/", {"department": target.id}, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["department_id"] == target.id
+    assert response.data["department_local_id"] == target.local_id
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("user_type", ["admins", "tenants"])
+def test_admin_check_runs_once_per_response(client, tenant_setup, user_type):
+    tenant1 = authenticate(client, tenant_setup, user_type)
+    is_admin = ScopedUserMixin.is_admin
+    list_queries(client, "customers")
+
+    calls = []
+    for added in (0, 30):
+        if added:
+            add_objects(tenant_setup, tenant1, "customers", added)
+        with mock.patch.object(ScopedUserMixin, "is_admin", autospec=True, side_effect=is_admin) as patched:
+            list_queries(client, "customers")
+        calls.append(patched.call_count)
+
+    assert calls[0] == calls[1]
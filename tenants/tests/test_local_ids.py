@@ -0,0 +1,155 @@
+import threading
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, connections, transaction, DEFAULT_DB_ALIAS
+
+from tenants import local_ids
+from tenants.local_ids import LOCAL_ID_COUNTERS, get_local_id_allocator
+from tenants.models import Tenant, Organization
+
+
+ALLOCATORS = ["sequence", "counter", "hilo"]
+
+
+def reset_allocators():
+    for allocator in local_ids._allocators.values():
+        # reservation connections of hilo would keep the test database open
+        for reservation_connection in getattr(allocator, "_connections", {}).values():
+            reservation_connection.close()
+    local_ids._allocators.clear()
+
+
+@pytest.fixture(params=ALLOCATORS)
+def allocator_name(request, settings):
+    settings.LOCAL_IDS = {"ALLOCATOR": request.param, "HILO_BLOCK_SIZE": 10}
+    local_ids._allocators.clear()
+    yield request.param
+    reset_allocators()
+
+
+def schema_sequences(schema_name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM information_schema.sequences WHERE sequence_schema = %s", [schema_name])
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def test_local_ids_are_sequential_per_tenant(allocator_name):
+    tenant1 = Tenant.objects.create(name="Allocator tenant 1")
+    tenant2 = Tenant.objects.create(name="Allocator tenant 2")
+
+    for index in range(15):
+        Organization.objects.create(name=f"Allocator org {index} 1", tenant=tenant1)
+        Organization.objects.create(name=f"Allocator org {index} 2", tenant=tenant2)
+
+    for tenant in [tenant1, tenant2]:
+        assert list(Organization.objects.filter(tenant=tenant).order_by("pk").values_list("local_id", flat=True)) == list(range(1, 16))
+
+
+@pytest.mark.django_db
+def test_rolled_back_inserts(allocator_name):
+    tenant = Tenant.objects.create(name="Allocator tenant")
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            Organization.objects.create(name="Rolled back org", tenant=tenant)
+            raise RuntimeError
+
+    organization = Organization.objects.create(name="Allocator org", tenant=tenant)
+    if allocator_name == "counter":
+        # counter row is updated in the rolled back transaction
+        assert organization.local_id == 1
+    else:
+        # sequence values and reserved blocks are never returned
+        assert organization.local_id == 2
+
+
+@pytest.mark.django_db
+def test_catalog_footprint(allocator_name):
+    tenant = Tenant.objects.create(name="Allocator tenant")
+
+    expected_sequences = len(LOCAL_ID_COUNTERS) if allocator_name == "sequence" else 0
+    assert schema_sequences(tenant.get_schema_name()) == expected_sequences
+
+
+@pytest.mark.django_db
+def test_state_can_be_moved(allocator_name):
+    allocator = get_local_id_allocator()
+    source = Tenant.objects.create(name="Allocator source").get_schema_name()
+    target = Tenant.objects.create(name="Allocator target").get_schema_name()
+
+    allocator.allocate(source, "customer_model", 5, DEFAULT_DB_ALIAS)
+    state = allocator.get_state(source, DEFAULT_DB_ALIAS)
+    allocator.set_state(target, state, DEFAULT_DB_ALIAS)
+
+    if allocator_name == "hilo":
+        # whole block was reserved on the source
+        assert state["customer_model"] == 10
+    else:
+        assert state["customer_model"] == 5
+    assert state["tenant_user"] == 0
+    assert allocator.allocate(target, "customer_model", 1, DEFAULT_DB_ALIAS)[0] == state["customer_model"] + 1
+
+
+@pytest.mark.django_db
+def test_hilo_hands_out_reserved_block_without_queries(allocator_name, django_assert_num_queries):
+    if allocator_name != "hilo":
+        pytest.skip("only hilo hands out values from memory")
+
+    allocator = get_local_id_allocator()
+    schema_name = Tenant.objects.create(name="Allocator tenant").get_schema_name()
+
+    assert allocator.allocate(schema_name, "customer_model", 1, DEFAULT_DB_ALIAS) == [1]
+    with django_assert_num_queries(0):
+        assert allocator.allocate(schema_name, "customer_model", 9, DEFAULT_DB_ALIAS) == list(range(2, 11))
+    # larger request than block size reserves enough at once
+    assert allocator.allocate(schema_name, "customer_model", 25, DEFAULT_DB_ALIAS) == list(range(11, 36))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_allocations_are_unique(allocator_name):
+    schema_name = Tenant.objects.create(name="Allocator tenant").get_schema_name()
+    allocator = get_local_id_allocator()
+    threads_count, allocations = 8, 25
+    values = []
+    errors = []
+
+    def allocate():
+        try:
+            for _ in range(allocations):
+                values.extend(allocator.allocate(schema_name, "customer_model", 1, DEFAULT_DB_ALIAS))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=allocate) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(values) == len(set(values)) == threads_count * allocations
+    # no transaction was rolled back, every allocator hands out a gapless range here
+    assert sorted(values) == list(range(1, threads_count * allocations + 1))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("source, target", [("sequence", "counter"), ("sequence", "hilo"), ("counter", "sequence")])
+def test_local_ids_continue_after_allocator_switch(settings, source, target):
+    settings.LOCAL_IDS = {"ALLOCATOR": source, "HILO_BLOCK_SIZE": 10}
+    local_ids._allocators.clear()
+    tenant = Tenant.objects.create(name="Allocator tenant")
+    for index in range(3):
+        Organization.objects.create(name=f"Allocator org {index}", tenant=tenant)
+
+    call_command("copy_local_id_counters", source, target, stdout=StringIO())
+    settings.LOCAL_IDS = {"ALLOCATOR": target, "HILO_BLOCK_SIZE": 10}
+    try:
+        organization = Organization.objects.create(name="Allocator org after switch", tenant=tenant)
+        assert organization.local_id == 4
+    finally:
+        reset_allocators()
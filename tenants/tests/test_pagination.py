@@ -0,0 +1,178 @@
+import pytest
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED
+
+from tenants.models import Customer, Organization
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+
+def collect_pages(client, url, page_size=3):
+    """
+    Follows next links, returns ids of all pages
+    """
+    ids = []
+    response = client.get(url, {"page_size": page_size}, format="json")
+    while True:
+        assert response.status_code == HTTP_200_OK
+        assert len(response.data["results"]) <= page_size
+        ids.extend(item["id"] for item in response.data["results"])
+        if not response.data["next"]:
+            return ids
+        response = client.get(response.data["next"], format="json")
+
+
+@pytest.mark.django_db
+def test_admin_pages_through_ids(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    admin_user = tenant_setup["users"]["admins"][0]
+
+    access_token = get_access_token(client, domain_url1, admin_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    assert collect_pages(client, "/api/customers/") == list(Customer.objects.order_by("id").values_list("id", flat=True))
+    assert collect_pages(client, "/api/users/") == list(BaseUser.objects.order_by("id").values_list("id", flat=True))
+
+
+@pytest.mark.django_db
+def test_scoped_user_pages_through_local_ids(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    expected = Customer.objects.filter(department__organization__tenant=tenant1, is_deleted=False).order_by("local_id")
+    assert collect_pages(client, "/api/customers/") == list(expected.values_list("local_id", flat=True))
+
+
+@pytest.mark.django_db
+def test_pages_are_stable_under_inserts(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    first_page = client.get("/api/customers/", {"page_size": 3}, format="json")
+    create_response = client.post("/api/customers/", {"name": "Inserted Customer", "department": 1}, format="json")
+    assert create_response.status_code == HTTP_201_CREATED
+
+    ids = [item["id"] for item in first_page.data["results"]]
+    response = client.get(first_page.data["next"], format="json")
+    while True:
+        ids.extend(item["id"] for item in response.data["results"])
+        if not response.data["next"]:
+            break
+        response = client.get(response.data["next"], format="json")
+
+    # nothing is skipped or repeated, new row is on the last page
+    assert len(ids) == len(set(ids))
+    assert ids[-1] == create_response.data["id"]
+    assert len(ids) == Customer.objects.filter(department__organization__tenant=tenant1).count()
+
+
+@pytest.mark.django_db
+def test_organizations_are_paginated_on_request(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    list_response = client.get("/api/organizations/", format="json")
+    assert len(list_response.data) == Organization.objects.filter(tenant=tenant1).count()
+
+    paginated_response = client.get("/api/organizations/", {"page_size": 1}, format="json")
+    assert len(paginated_response.data["results"]) == 1
+    assert paginated_response.data["next"]
+
+
+@pytest.mark.django_db
+def test_users_with_repeated_local_ids_are_paged_by_keyset(client, tenant_setup):
+    """
+    local_ids of users come from separate counters of every scope, pages are split between users with the same local_id
+    """
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    organization1 = tenant_setup["organizations"][tenant1][0]
+
+    for index in range(3):
+        BaseUser.objects.create_user(username=f"paged_tenant_user_{index}", password="password", tenant_scope=tenant1)
+        BaseUser.objects.create_user(
+            username=f"paged_org_user_{index}", password="password", tenant_scope=tenant1, organization_scope=organization1,
+        )
+    assert BaseUser.objects.filter(tenant_scope=tenant1, local_id=2).count() > 1
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    usernames = []
+    response = client.get("/api/users/", {"page_size": 3}, format="json")
+    inserted = False
+    while True:
+        assert response.status_code == HTTP_200_OK
+        usernames.extend(item["username"] for item in response.data["results"])
+        if not inserted:
+            # user inserted between pages has the highest local_id of its counter, it comes on a later page
+            BaseUser.objects.create_user(
+                username="paged_inserted_user", password="password", tenant_scope=tenant1, organization_scope=organization1,
+            )
+            inserted = True
+        if not response.data["next"]:
+            break
+        response = client.get(response.data["next"], format="json")
+
+    expected = tenant_user.get_limited_queryset(BaseUser).order_by("local_id", "username")
+    assert usernames == list(expected.values_list("username", flat=True))
+    assert "paged_inserted_user" in usernames
+
+    # previous links walk back over the same rows
+    previous_usernames = [item["username"] for item in response.data["results"]]
+    while response.data["previous"]:
+        response = client.get(response.data["previous"], format="json")
+        previous_usernames = [item["username"] for item in response.data["results"]] + previous_usernames
+    assert previous_usernames == usernames
+
+
+@pytest.mark.django_db
+def test_users_without_local_id_are_paged_last(client, tenant_setup):
+    """
+    Tenant admins scoped to a tenant get no local_id, they come after all other users and cursors keep their NULL
+    """
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    for index in range(4):
+        BaseUser.objects.create_user(username=f"paged_admin_{index}", password="password", is_admin=True, tenant_scope=tenant1)
+    assert BaseUser.objects.filter(tenant_scope=tenant1, local_id__isnull=True).count() == 4
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    usernames = []
+    response = client.get("/api/users/", {"page_size": 2}, format="json")
+    while True:
+        assert response.status_code == HTTP_200_OK
+        usernames.extend(item["username"] for item in response.data["results"])
+        if not response.data["next"]:
+            break
+        response = client.get(response.data["next"], format="json")
+
+    limited = tenant_user.get_limited_queryset(BaseUser)
+    expected = list(limited.filter(local_id__isnull=False).order_by("local_id", "username").values_list("username", flat=True))
+    expected += list(limited.filter(local_id__isnull=True).order_by("username").values_list("username", flat=True))
+    assert usernames == expected
+    assert usernames[-4:] == [f"paged_admin_{index}" for index in range(4)]
+
+    previous_usernames = [item["username"] for item in response.data["results"]]
+    while response.data["previous"]:
+        response = client.get(response.data["previous"], format="json")
+        assert response.status_code == HTTP_200_OK
+        previous_usernames = [item["username"] for item in response.data["results"]] + previous_usernames
+    assert previous_usernames == usernames
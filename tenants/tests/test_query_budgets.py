@@ -0,0 +1,214 @@
+"""
+SQL query budgets of every viewset action for every user role, checked against query_budgets.json.
+Every action is measured twice, the second time after the dataset (and subtree of the destroyed object) grew,
+counts have to be equal (no N+1) and match the budget. Failures show a diff of the queries that were added.
+
+Budgets are recorded with default settings (one database, "rows" ROLE_PERMISSIONS_MODE), after an intended change
+rewrite them with:
+
+    QUERY_BUDGETS_UPDATE=1 pytest tenants/tests/test_query_budgets.py
+"""
+import difflib
+import json
+import os
+import re
+from itertools import count
+from pathlib import Path
+
+import pytest
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from tenants.models import Tenant, Organization, Department, Customer
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+BUDGETS_PATH = Path(__file__).with_name("query_budgets.json")
+UPDATE_BUDGETS = os.environ.get("QUERY_BUDGETS_UPDATE") == "1"
+
+ENDPOINTS = ("tenants", "organizations", "departments", "customers", "users")
+ACTIONS = ("list", "retrieve", "create", "update", "destroy")
+USER_TYPES = ("admins", "tenants", "organizations", "departments", "customers")
+SMALL, LARGE = 1, 5
+names = count()
+
+
+@pytest.fixture(scope="module")
+def budgets():
+    budgets = json.loads(BUDGETS_PATH.read_text()) if BUDGETS_PATH.exists() else {}
+    yield budgets
+    if UPDATE_BUDGETS:
+        BUDGETS_PATH.write_text(json.dumps(dict(sorted(budgets.items())), indent=2) + "\n")
+
+
+def fingerprint(sql):
+    """
+    Readable shape of a query: selected columns and literal values are left out
+    """
+    sql = re.sub(r"^SELECT .*? FROM ", "SELECT ... FROM ", sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    sql = re.sub(r"\((?:\?, )+\?\)", "(...)", sql)
+    sql = re.sub(r"\s+", " ", sql).replace('"', "")
+    return sql if len(sql) <= 200 else sql[:197] + "..."
+
+
+def queries_diff(expected, actual, expected_label="budget", actual_label="measured"):
+    return "\n".join(difflib.unified_diff(expected, actual, expected_label, actual_label, lineterm="", n=1))
+
+
+class Requests:
+    """
+    Request of an action for the user, objects the request needs (destroyed objects and their subtrees) are created
+    before queries are captured
+    """
+
+    def __init__(self, user, tenant):
+        self.user = user
+        self.tenant = tenant
+        self.organization = tenant.organizations.order_by("local_id").first()
+        self.department = self.organization.departments.order_by("local_id").first()
+        self.customer = self.department.customers.order_by("local_id").first()
+        # visible to every role, updates rename it
+        self.scoped_user = BaseUser.objects.get(username="customer_user_1")
+
+    def ref(self, instance):
+        # admins address tenant data by global ids, scoped users by local_ids of their tenant
+        return instance.id if self.user.is_admin() or self.user.is_superuser else instance.local_id
+
+    def target(self, endpoint):
+        return {
+            "tenants": self.tenant, "organizations": self.organization, "departments": self.department,
+            "customers": self.customer, "users": self.scoped_user,
+        }[endpoint]
+
+    def detail_path(self, endpoint, instance):
+        # tenants and users are looked up by primary key for every role
+        key = instance.pk if endpoint in ("tenants", "users") else self.ref(instance)
+        return f"/api/{endpoint}/{key}/"
+
+    def build(self, endpoint, action, size):
+        name = f"budget {next(names)}"
+        if action == "list":
+            return "get", f"/api/{endpoint}/", None
+        if action == "retrieve":
+            return "get", self.detail_path(endpoint, self.target(endpoint)), None
+        if action == "update":
+            field = "username" if endpoint == "users" else "name"
+            return "patch", self.detail_path(endpoint, self.target(endpoint)), {field: name.replace(" ", "_")}
+        if action == "create":
+            return "post", f"/api/{endpoint}/", self.payload(endpoint, name)
+        return "delete", self.detail_path(endpoint, self.new_subtree(endpoint, name, size)), None
+
+    def payload(self, endpoint, name):
+        if endpoint == "tenants":
+            return {"name": name, "domain_url": f"{name.replace(' ', '-')}.localhost"}
+        if endpoint == "users":
+            return {"username": name.replace(" ", "_"), "tenant_scope": self.tenant.pk}
+        payload = {"name": name}
+        if endpoint == "departments":
+            payload["organization"] = self.ref(self.organization)
+        elif endpoint == "customers":
+            payload["department"] = self.ref(self.department)
+        return payload
+
+    def new_subtree(self, endpoint, name, size):
+        """
+        Object to destroy with size children on every level below it and size users scoped to it
+        """
+        if endpoint == "tenants":
+            return Tenant.objects.create(name=name)
+        if endpoint == "users":
+            return add_users(self.tenant, name, 1, customer_scope=self.customer)[0]
+
+        if endpoint == "organizations":
+            root = Organization.objects.create(name=name, tenant=self.tenant)
+            departments = add_children(Department, "organization", [root], size, name)
+        elif endpoint == "departments":
+            root = Department.objects.create(name=name, organization=self.organization)
+            departments = [root]
+        else:
+            root = Customer.objects.create(name=name, department=self.department)
+            departments = []
+        add_children(Customer, "department", departments, size, name)
+        add_users(self.tenant, f"{name} user", size, **{f"{type(root).__name__.lower()}_scope": root})
+        return root
+
+
+def add_children(model, parent_field, parents, size, prefix):
+    instances = [model(name=f"{prefix} {model.__name__} {parent.pk} {index}", **{parent_field: parent}) for parent in parents for index in range(size)]
+    for instance in instances:
+        instance.save()
+    return instances
+
+
+def add_users(tenant, prefix, size, **scopes):
+    if "customer_scope" in scopes:
+        scopes.setdefault("department_scope", scopes["customer_scope"].department)
+    if "department_scope" in scopes:
+        scopes.setdefault("organization_scope", scopes["department_scope"].organization)
+    return [
+        BaseUser.objects.create_user(username=f"{prefix} {index}".replace(" ", "_"), password=None, tenant_scope=tenant, **scopes)
+        for index in range(size)
+    ]
+
+
+def grow_dataset(requests):
+    """
+    More rows on every level visible to every role: organizations of the tenant, departments of the organization,
+    customers of the department and users scoped to the customer
+    """
+    prefix = f"growth {next(names)}"
+    Organization.bulk_create_for_tenant(
+        [Organization(name=f"{prefix} org {index}", tenant=requests.tenant) for index in range(10)], requests.tenant,
+    )
+    Department.bulk_create_for_tenant(
+        [Department(name=f"{prefix} dept {index}", organization=requests.organization) for index in range(10)], requests.tenant,
+    )
+    Customer.bulk_create_for_tenant(
+        [Customer(name=f"{prefix} customer {index}", department=requests.department) for index in range(10)], requests.tenant,
+    )
+    add_users(requests.tenant, prefix, 10, customer_scope=requests.customer)
+
+
+def measure(client, request):
+    method, path, data = request
+    with CaptureQueriesContext(connections["default"]) as queries:
+        response = getattr(client, method)(path, data, format="json")
+    return response.status_code, [fingerprint(query["sql"]) for query in queries.captured_queries]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("user_type", USER_TYPES)
+@pytest.mark.parametrize("action", ACTIONS)
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_query_budget(client, tenant_setup, budgets, endpoint, action, user_type):
+    tenant1 = tenant_setup["tenants"][0]
+    user = tenant_setup["users"][user_type][0]
+    access_token = get_access_token(client, tenant_setup["domains"][tenant1].domain_url, user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    requests = Requests(user, tenant1)
+
+    # first request warms up caches (tenant resolution, token version, permissions)
+    measure(client, requests.build(endpoint, action, SMALL))
+    small_status, small = measure(client, requests.build(endpoint, action, SMALL))
+    grow_dataset(requests)
+    status, queries = measure(client, requests.build(endpoint, action, LARGE))
+
+    assert status == small_status
+    assert len(queries) == len(small), (
+        f"{endpoint} {action} as {user_type}: {len(small)} queries grew to {len(queries)} with more rows\n{queries_diff(small, queries, 'smaller dataset', 'larger dataset')}"
+    )
+
+    key = f"{endpoint}.{action}.{user_type}"
+    if UPDATE_BUDGETS:
+        budgets[key] = {"status": status, "queries": len(queries), "sql": queries}
+        return
+
+    assert key in budgets, f"No budget for {key}, record it with QUERY_BUDGETS_UPDATE=1"
+    budget = budgets[key]
+    assert status == budget["status"], f"{key}: status {status}, budget was recorded with {budget['status']}"
+    assert len(queries) == budget["queries"], (
+        f"{key}: {len(queries)} queries, budget is {budget['queries']} (update query_budgets.json when intended)\n"
+        f"{queries_diff(budget['sql'], queries)}"
+    )
@@ -0,0 +1,131 @@
+import pytest
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED
+
+from tenants import replicas
+from tenants.models import Organization, Customer
+from tenants.replicas import register_replica, unregister_replica, read_from_replica
+from tenants.tests.conftest import get_access_token
+
+
+REPLICA = "replica_test"
+
+
+@pytest.fixture(scope="module")
+def replica_database(django_db_setup, django_db_blocker):
+    """
+    Second alias pointing at the test database, it sees only committed rows, so tests using it are transactional
+    """
+    default_settings = connections[DEFAULT_DB_ALIAS].settings_dict
+    register_replica(
+        REPLICA,
+        {key: default_settings[key] for key in ("ENGINE", "NAME", "USER", "PASSWORD", "HOST", "PORT")},
+        replica_of=DEFAULT_DB_ALIAS,
+    )
+    yield REPLICA
+
+    with django_db_blocker.unblock():
+        unregister_replica(REPLICA)
+
+
+replicated_db = pytest.mark.django_db(transaction=True, databases=[DEFAULT_DB_ALIAS, REPLICA])
+
+
+def table_queries(queries, table):
+    return [query["sql"] for query in queries if f'"{table}"' in query["sql"]]
+
+
+def get_customers(client):
+    with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary_queries, \
+            CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+        response = client.get("/api/customers/", format="json")
+    assert response.status_code == HTTP_200_OK
+    return table_queries(primary_queries, "tenants_customer"), table_queries(replica_queries, "tenants_customer")
+
+
+@replicated_db
+def test_list_and_retrieve_read_from_replica(client, replica_database, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    primary_queries, replica_queries = get_customers(client)
+    assert replica_queries and not primary_queries
+
+    with CaptureQueriesContext(connections[REPLICA]) as retrieve_queries:
+        assert client.get("/api/departments/1/", format="json").status_code == HTTP_200_OK
+    assert table_queries(retrieve_queries, "tenants_department")
+
+
+@replicated_db
+def test_reads_after_write_stay_on_primary(client, replica_database, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    other_user = tenant_setup["users"]["organizations"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    create_response = client.post("/api/customers/", {"name": "Fresh Customer", "department": 1}, format="json")
+    assert create_response.status_code == HTTP_201_CREATED
+
+    # writer reads own writes from the primary within READ_YOUR_WRITES_WINDOW
+    primary_queries, replica_queries = get_customers(client)
+    assert primary_queries and not replica_queries
+
+    # other users are not pinned
+    other_token = get_access_token(client, domain_url1, other_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {other_token}")
+    primary_queries, replica_queries = get_customers(client)
+    assert replica_queries and not primary_queries
+
+
+@replicated_db
+def test_lagging_replica_is_skipped(client, replica_database, tenant_setup, monkeypatch):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    monkeypatch.setattr(replicas, "measure_replica_lag", lambda alias: 60.0)
+    replicas._measured_lags.clear()
+    try:
+        primary_queries, replica_queries = get_customers(client)
+    finally:
+        replicas._measured_lags.clear()
+    assert primary_queries and not replica_queries
+
+
+@replicated_db
+def test_token_refresh_reads_user_from_replica(client, replica_database, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    token_response = client.post("/api/token/", {"username": tenant_user.username, "password": "password"}, HTTP_HOST=domain_url1, format="json")
+    with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+        refresh_response = client.post("/api/token/refresh/", {"refresh": token_response.data["refresh"]}, HTTP_HOST=domain_url1, format="json")
+    assert refresh_response.status_code == HTTP_200_OK
+    assert table_queries(replica_queries, "user_management_baseuser")
+
+
+@replicated_db
+def test_writes_inside_replica_reads_go_to_primary(replica_database, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+
+    with read_from_replica():
+        organization = Organization.objects.filter(tenant=tenant1).first()
+        assert organization._state.db == REPLICA
+
+        organization.name = "Renamed Organization"
+        organization.save()
+        assert organization._state.db == DEFAULT_DB_ALIAS
+
+        # once something was written, reads stay on the primary
+        assert Customer.objects.filter(department__organization=organization).first()._state.db == DEFAULT_DB_ALIAS
@@ -0,0 +1,92 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tenants.sharding import get_shard_aliases
+from user_management.models import BaseUser
+from user_management.provisioning import provision_users
+from user_management.utils import Role, ROLE_PERMISSIONS_MANAGER
+
+
+@pytest.fixture
+def virtual_mode(settings):
+    settings.ROLE_PERMISSIONS_MODE = "virtual"
+
+
+def permission_rows(alias="default"):
+    return BaseUser.user_permissions.through.objects.using(alias)
+
+
+def create_user(username, tenant, **scopes):
+    return BaseUser.objects.create_user(username=username, password="password", tenant_scope=tenant, **scopes)
+
+
+@pytest.mark.django_db
+def test_virtual_mode_writes_no_permission_rows(virtual_mode, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+
+    with CaptureQueriesContext(connection) as queries:
+        user = create_user("virtual_user", tenant1)
+
+    assert not any("auth_permission" in query["sql"] for query in queries.captured_queries)
+    assert not permission_rows().filter(baseuser=user).exists()
+    assert user.has_perm("tenants.view_organization")
+    assert user.get_all_permissions() == ROLE_PERMISSIONS_MANAGER.get_role_permissions(Role.ROLE_TENANT_USER)
+
+
+@pytest.mark.django_db
+def test_rows_mode_matches_virtual_permissions(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    organization = tenant_setup["organizations"][tenant1][0]
+
+    user = create_user("rows_user", tenant1, organization_scope=organization)
+
+    assert permission_rows().filter(baseuser=user).count() == len(ROLE_PERMISSIONS_MANAGER.get_role_permissions(Role.ROLE_ORG_USER))
+    assert BaseUser.objects.get(pk=user.pk).get_all_permissions() == ROLE_PERMISSIONS_MANAGER.get_role_permissions(Role.ROLE_ORG_USER)
+
+
+@pytest.mark.django_db
+def test_virtual_mode_role_change_writes_no_rows(virtual_mode, tenant_setup):
+    admin = tenant_setup["users"]["admins"][0]
+
+    admin.role = Role.ROLE_TENANT_USER
+    admin.save()
+
+    assert not permission_rows().filter(baseuser=admin).exists()
+    assert admin.has_perm("tenants.view_organization") and not admin.has_perm("tenants.add_tenant")
+
+
+@pytest.mark.django_db
+def test_virtual_mode_provisioning_writes_no_rows(virtual_mode, tenant_setup, settings):
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+    tenant1 = tenant_setup["tenants"][0]
+
+    users = provision_users([{"username": f"virtual_{index}", "password": "password", "tenant_scope": tenant1} for index in range(3)])
+
+    assert not permission_rows().filter(baseuser__in=users).exists()
+
+
+@pytest.mark.django_db
+def test_purge_deletes_role_rows_only(tenant_setup, settings):
+    tenant1 = tenant_setup["tenants"][0]
+    user = tenant_setup["users"]["tenants"][0]
+    # permission granted outside of the role
+    user.user_permissions.add(BaseUser.user_permissions.field.related_model.objects.get(codename="add_tenant"))
+    role_rows = sum(permission_rows(alias).count() for alias in get_shard_aliases()) - 1
+
+    with pytest.raises(CommandError):
+        call_command("purge_role_permissions", stdout=StringIO())
+
+    settings.ROLE_PERMISSIONS_MODE = "virtual"
+    out = StringIO()
+    call_command("purge_role_permissions", "--dry-run", stdout=out)
+    assert f"Would delete {role_rows} role permission rows" in out.getvalue()
+
+    call_command("purge_role_permissions", "--batch-size", "5", stdout=StringIO())
+
+    assert list(permission_rows().values_list("baseuser_id", "permission__codename")) == [(user.pk, "add_tenant")]
+    assert BaseUser.objects.get(pk=user.pk).has_perm("tenants.view_organization")
@@ -0,0 +1,68 @@
+import pytest
+
+from user_management.models import BaseUser
+from user_management.utils import (Role, RolePermissionsManager, ROLE_PERMISSIONS_MANAGER, ROLE_HIERARCHY,
+                                   TENANT_DEPENDANT_ROLES, ORGANIZATION_DEPENDANT_ROLES, DEPARTMENT_DEPENDANT_ROLES,
+                                   CUSTOMER_DEPENDANT_ROLES)
+
+
+ROLES = [*Role, None]
+
+
+def legacy_role_permissions():
+    """
+    Reference implementation (permissions accumulated in sets on every construction of RolePermissionsManager),
+    compiled bitmasks must stay equivalent to it
+    """
+    role_permissions = {}
+    accumulated_permissions = set()
+    for role in RolePermissionsManager.BASE_ROLE_HIERARCHY:
+        accumulated_permissions |= RolePermissionsManager.BASE_ROLE_PERMISSIONS.get(role, set())
+        role_permissions[role] = frozenset(accumulated_permissions)
+    return role_permissions
+
+
+def legacy_has_perm(user, perm):
+    if perm not in legacy_role_permissions().get(user.role, set()):
+        return False
+    return user.role != Role.ROLE_UNNASIGNED
+
+
+ALL_PERMISSIONS = sorted(set().union(*RolePermissionsManager.BASE_ROLE_PERMISSIONS.values())) + ["tenants.view_unknown"]
+
+
+@pytest.mark.parametrize("role", ROLES)
+def test_compiled_permissions_match_legacy(role):
+    legacy = legacy_role_permissions().get(role, set())
+
+    assert ROLE_PERMISSIONS_MANAGER.get_role_permissions(role) == legacy
+    for permission in ALL_PERMISSIONS:
+        assert ROLE_PERMISSIONS_MANAGER.has_role_permission(role, permission) == (permission in legacy)
+        assert BaseUser(role=role).has_perm(permission) == legacy_has_perm(BaseUser(role=role), permission)
+
+
+@pytest.mark.parametrize("role", ROLES)
+def test_role_predicates(role):
+    manager = ROLE_PERMISSIONS_MANAGER
+
+    assert manager.is_role_tenant_dependant(role) == (role in TENANT_DEPENDANT_ROLES)
+    assert manager.is_role_organization_dependant(role) == (role in ORGANIZATION_DEPENDANT_ROLES)
+    assert manager.is_role_department_dependant(role) == (role in DEPARTMENT_DEPENDANT_ROLES)
+    assert manager.is_role_customer_dependant(role) == (role in CUSTOMER_DEPENDANT_ROLES)
+
+
+@pytest.mark.parametrize("role", ROLES)
+def test_role_hierarchy_holds_roles_below(role):
+    below = ROLE_HIERARCHY.get(role, set())
+
+    assert ROLE_PERMISSIONS_MANAGER.get_role_hierarchy(role) == below
+    for assigned_role in ROLES:
+        assert ROLE_PERMISSIONS_MANAGER.can_role_assign(role, assigned_role) == (assigned_role in below)
+
+
+def test_tables_are_compiled_once_and_read_only():
+    manager = RolePermissionsManager()
+
+    assert manager.ROLE_PERMISSION_MASKS is ROLE_PERMISSIONS_MANAGER.ROLE_PERMISSION_MASKS
+    with pytest.raises(TypeError):
+        manager.ROLE_PERMISSIONS[Role.ROLE_CUSTOMER_USER] = frozenset()
@@ -0,0 +1,66 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tenants.local_ids import get_local_id_allocator
+from tenants.models import Tenant, SpareSchema
+from tenants.schema_pool import get_pool_size, refill_schema_pool, tenant_schema_name
+
+
+def schema_exists(schema_name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s)", [schema_name])
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def test_tenant_claims_spare_schema_without_ddl():
+    refill_schema_pool("default", 3)
+    spare_uuids = set(SpareSchema.objects.values_list("uuid", flat=True))
+
+    with CaptureQueriesContext(connection) as queries:
+        tenant = Tenant.objects.create(name="Pooled tenant")
+
+    assert tenant.uuid in spare_uuids
+    assert not any("CREATE" in query["sql"] for query in queries.captured_queries)
+    assert get_pool_size("default") == 2
+    # counters were created together with the spare schema
+    assert get_local_id_allocator().allocate(tenant.get_schema_name(), "organization_model", 2, "default") == [1, 2]
+
+
+@pytest.mark.django_db
+def test_empty_pool_falls_back_to_creating_schema():
+    tenant = Tenant.objects.create(name="Unpooled tenant")
+
+    assert schema_exists(tenant.get_schema_name())
+    assert get_local_id_allocator().allocate(tenant.get_schema_name(), "customer_model", 1, "default") == [1]
+
+
+@pytest.mark.django_db
+def test_refill_sizes_the_pool(settings):
+    assert refill_schema_pool("default", 3) == (3, 0)
+    assert refill_schema_pool("default", 3) == (0, 0)
+
+    newest = SpareSchema.objects.order_by("-pk").first()
+    assert refill_schema_pool("default", 1) == (0, 2)
+    assert not schema_exists(tenant_schema_name(newest.uuid))
+
+    # spare schemas of another allocator can't be claimed, they are replaced
+    settings.LOCAL_IDS = {**settings.LOCAL_IDS, "ALLOCATOR": "counter"}
+    old_spare = SpareSchema.objects.get()
+    assert refill_schema_pool("default", 1) == (1, 1)
+    assert not schema_exists(tenant_schema_name(old_spare.uuid))
+    assert SpareSchema.objects.get().allocator == "counter"
+
+
+@pytest.mark.django_db
+def test_command_refills_every_shard():
+    out = StringIO()
+
+    call_command("refill_schema_pool", "--size", "2", stdout=out)
+
+    assert "default: 2 spare schemas (created 2, dropped 0)" in out.getvalue()
+    assert get_pool_size("default") == 2
@@ -0,0 +1,162 @@
+import pytest
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tenants.models import Customer
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser, ScopedTokenUser
+from user_management.token_versions import get_token_version
+from user_management.utils import Role
+
+
+def _user_queries(queries):
+    return [query for query in queries if 'FROM "user_management_baseuser"' in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_access_token_contains_scope_claims(client, tenant_setup):
+    customer_user = tenant_setup["users"]["customers"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    token = AccessToken(get_access_token(client, domain_url1, customer_user.username))
+
+    assert token["role"] == Role.ROLE_CUSTOMER_USER
+    assert token["tenant_scope_id"] == customer_user.tenant_scope_id
+    assert token["organization_scope_id"] == customer_user.organization_scope_id
+    assert token["department_scope_id"] == customer_user.department_scope_id
+    assert token["customer_scope_id"] == customer_user.customer_scope_id
+    assert token["is_deleted"] is False
+    assert token["token_version"] == customer_user.token_version
+
+
+@pytest.mark.django_db
+def test_requests_are_authorized_from_claims(client, tenant_setup):
+    """
+    Once token version is cached, requests don't query users table at all
+    """
+    org_user = tenant_setup["users"]["organizations"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    access_token = get_access_token(client, domain_url1, org_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    assert client.get("/api/customers/", format="json").status_code == HTTP_200_OK
+
+    with CaptureQueriesContext(connection) as queries:
+        list_response = client.get("/api/customers/", format="json")
+
+    assert list_response.status_code == HTTP_200_OK
+    assert len(list_response.data["results"]) == Customer.objects.filter(department__organization=org_user.organization_scope).count()
+    assert _user_queries(queries) == []
+
+
+@pytest.mark.django_db
+def test_claims_user_answers_scope_questions(tenant_setup):
+    """
+    ScopedTokenUser gives the same answers as BaseUser it was issued for, without loading it
+    """
+    from user_management.custom_token_logic import TenantAwareTokenObtainPairSerializer
+
+    dept_user = tenant_setup["users"]["departments"][0]
+    admin_user = tenant_setup["users"]["admins"][0]
+
+    for user in [dept_user, admin_user]:
+        token_user = ScopedTokenUser(TenantAwareTokenObtainPairSerializer.get_token(user).access_token)
+
+        with CaptureQueriesContext(connection) as queries:
+            assert token_user.is_admin() == user.is_admin()
+            assert token_user.has_perm("tenants.view_customer") == user.has_perm("tenants.view_customer")
+            assert token_user.has_perm("tenants.add_tenant") == user.has_perm("tenants.add_tenant")
+            token_queryset = token_user.get_limited_queryset(Customer)
+        assert len(queries) == 0
+
+        assert set(token_queryset.values_list("id", flat=True)) == set(
+            user.get_limited_queryset(Customer).values_list("id", flat=True)
+        )
+
+
+@pytest.mark.django_db
+def test_soft_deleted_user_token_is_rejected(client, tenant_setup, django_capture_on_commit_callbacks):
+    """
+    Soft deletion bumps token version, so tokens issued earlier stop working immediately
+    """
+    dept_user = tenant_setup["users"]["departments"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    access_token = get_access_token(client, domain_url1, dept_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    assert client.get("/api/customers/", format="json").status_code == HTTP_200_OK
+
+    with django_capture_on_commit_callbacks(execute=True):
+        BaseUser.objects.get(id=dept_user.id).soft_delete()
+
+    assert client.get("/api/customers/", format="json").status_code == HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_role_change_rejects_old_tokens(client, tenant_setup, django_capture_on_commit_callbacks):
+    """
+    Changing admin flag bumps token version, both old access and refresh tokens are rejected
+    """
+    admin_user = tenant_setup["users"]["admins"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    client.defaults['HTTP_HOST'] = domain_url1
+    token_response = client.post("/api/token/", {"username": admin_user.username, "password": "password"}, format="json")
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token_response.json()['access']}")
+    assert client.get("/api/tenants/", format="json").status_code == HTTP_200_OK
+
+    user = BaseUser.objects.get(id=admin_user.id)
+    user.is_superuser = False
+    with django_capture_on_commit_callbacks(execute=True):
+        user.save()
+
+    assert client.get("/api/tenants/", format="json").status_code == HTTP_401_UNAUTHORIZED
+
+    client.credentials()
+    refresh_response = client.post("/api/token/refresh/", {"refresh": token_response.json()["refresh"]}, format="json")
+    assert refresh_response.status_code == HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_rolled_back_bump_keeps_tokens_valid(client, tenant_setup):
+    """
+    Token version is cached only after the transaction that bumped it commits
+    """
+    dept_user = tenant_setup["users"]["departments"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    access_token = get_access_token(client, domain_url1, dept_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            BaseUser.objects.get(id=dept_user.id).soft_delete()
+            raise RuntimeError
+
+    assert get_token_version(dept_user.id) == dept_user.token_version
+    assert client.get("/api/customers/", format="json").status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_claims_tenant_checked_against_domain(client, tenant_setup):
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    tenant2 = tenant_setup["tenants"][1]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    domain_url2 = tenant_setup["domains"][tenant2].domain_url
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    client.defaults['HTTP_HOST'] = domain_url2
+    list_response = client.get("/api/organizations/", format="json")
+
+    assert list_response.status_code == HTTP_403_FORBIDDEN
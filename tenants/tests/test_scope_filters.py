@@ -0,0 +1,161 @@
+import pytest
+
+from tenants.models import Tenant, Organization, Department, Customer
+from user_management.models import BaseUser
+from user_management.utils import Role
+
+
+SCOPED_MODELS = [Tenant, Organization, Department, Customer, BaseUser]
+
+
+def legacy_get_limited_queryset(user, model):
+    """
+    Reference implementation (filters built on every call), compiled scope filters must stay equivalent to it
+    """
+    model_name = model._meta.model_name
+
+    if user.is_admin() or user.is_superuser:
+        return model.objects.all()
+
+    model_role_filters = {
+        "tenant": {
+            Role.ROLE_TENANT_USER: {"id": user.tenant_scope_id, "is_deleted": False},
+        },
+        "organization": {
+            Role.ROLE_TENANT_USER: {"tenant": user.tenant_scope_id, "is_deleted": False},
+            Role.ROLE_ORG_USER: {"id": user.organization_scope_id, "tenant": user.tenant_scope_id, "is_deleted": False},
+        },
+        "department": {
+            Role.ROLE_TENANT_USER: {"organization__tenant": user.tenant_scope_id, "is_deleted": False},
+            Role.ROLE_ORG_USER: {
+                "organization": user.organization_scope_id,
+                "organization__tenant": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+            Role.ROLE_DEPT_USER: {
+                "id": user.department_scope_id,
+                "organization": user.organization_scope_id,
+                "organization__tenant": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+        },
+        "customer": {
+            Role.ROLE_TENANT_USER: {"department__organization__tenant": user.tenant_scope_id, "is_deleted": False},
+            Role.ROLE_ORG_USER: {
+                "department__organization": user.organization_scope_id,
+                "department__organization__tenant": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+            Role.ROLE_DEPT_USER: {
+                "department": user.department_scope_id,
+                "department__organization": user.organization_scope_id,
+                "department__organization__tenant": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+            Role.ROLE_CUSTOMER_USER: {
+                "id": user.customer_scope_id,
+                "department": user.department_scope_id,
+                "department__organization": user.organization_scope_id,
+                "department__organization__tenant": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+        },
+        "baseuser": {
+            Role.ROLE_TENANT_USER: {"tenant_scope": user.tenant_scope_id, "is_deleted": False},
+            Role.ROLE_ORG_USER: {
+                "organization_scope": user.organization_scope_id,
+                "tenant_scope": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+            Role.ROLE_DEPT_USER: {
+                "department_scope": user.department_scope_id,
+                "organization_scope": user.organization_scope_id,
+                "tenant_scope": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+            Role.ROLE_CUSTOMER_USER: {
+                "customer_scope": user.customer_scope_id,
+                "department_scope": user.department_scope_id,
+                "organization_scope": user.organization_scope_id,
+                "tenant_scope": user.tenant_scope_id,
+                "is_deleted": False,
+            },
+        },
+    }
+
+    filters = model_role_filters.get(model_name, {}).get(user.role, {})
+    if not filters or (user.role == Role.ROLE_CUSTOMER_USER and not user.customer_scope_id):
+        return model.objects.none()
+
+    queryset = model.objects.filter(**filters)
+    for field in ["tenant", "organization", "department", "customer"]:
+        if hasattr(model, field):
+            queryset = queryset.select_related(field)
+    return queryset
+
+
+def all_users(tenant_setup):
+    users = [user for users in tenant_setup["users"].values() for user in users]
+    tenant1 = tenant_setup["tenants"][0]
+    # unassigned user, and customer user whose customer was removed from scope
+    users.append(BaseUser.objects.create_user(username="unassigned_user", password="password"))
+    orphan = BaseUser.objects.create_user(username="orphan_customer_user", password="password", tenant_scope=tenant1)
+    BaseUser.objects.filter(pk=orphan.pk).update(role=Role.ROLE_CUSTOMER_USER)
+    users.append(BaseUser.objects.get(pk=orphan.pk))
+    return [BaseUser.objects.get(pk=user.pk) for user in users]
+
+
+def assert_equivalent(queryset, reference):
+    # compiled filters of departments and customers use denormalized ancestry columns, so only rows are compared
+    assert queryset.query.is_empty() == reference.query.is_empty()
+    assert list(queryset.order_by("pk").values_list("pk", flat=True)) == list(reference.order_by("pk").values_list("pk", flat=True))
+
+
+@pytest.mark.django_db
+def test_compiled_filters_match_legacy_filters(tenant_setup):
+    for user in all_users(tenant_setup):
+        for model in SCOPED_MODELS:
+            assert_equivalent(user.get_limited_queryset(model), legacy_get_limited_queryset(user, model))
+
+
+@pytest.mark.django_db
+def test_compiled_filters_match_legacy_filters_for_soft_deleted_rows(tenant_setup):
+    for customers in tenant_setup["customers"].values():
+        customers[0].soft_delete()
+    for departments in tenant_setup["departments"].values():
+        departments[1].soft_delete()
+
+    for user in all_users(tenant_setup):
+        for model in SCOPED_MODELS:
+            assert_equivalent(user.get_limited_queryset(model), legacy_get_limited_queryset(user, model))
+
+
+@pytest.mark.django_db
+def test_token_users_get_same_filters(tenant_setup):
+    from user_management.models import ScopedTokenUser, get_token_claims
+
+    for user in all_users(tenant_setup):
+        token_user = ScopedTokenUser({"user_id": user.pk, **get_token_claims(user)})
+        for model in SCOPED_MODELS:
+            assert_equivalent(token_user.get_limited_queryset(model), user.get_limited_queryset(model))
+
+
+@pytest.mark.django_db
+def test_building_queryset_does_not_fetch_scopes(tenant_setup, django_assert_num_queries):
+    users = all_users(tenant_setup)
+
+    with django_assert_num_queries(0):
+        for user in users:
+            for model in SCOPED_MODELS:
+                user.get_limited_queryset(model)
+
+
+@pytest.mark.django_db
+def test_customer_and_department_filters_do_not_join(tenant_setup):
+    for user in all_users(tenant_setup):
+        for model in [Department, Customer]:
+            queryset = user.get_limited_queryset(model)
+            if queryset.query.is_empty():
+                continue
+            # joins would come from the filters
+            assert "JOIN" not in str(queryset.values("pk").query)
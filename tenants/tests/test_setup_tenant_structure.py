@@ -0,0 +1,110 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from tenants.management.commands.setup_tenant_structure import distribute
+from tenants.models import Tenant, Domain, Organization, Department, Customer
+from tenants.tenant_cache import get_tenant_for_domain
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+
+def setup_structure(*args):
+    out = StringIO()
+    call_command("setup_tenant_structure", "--processes", "1", *args, stdout=out)
+    return out.getvalue()
+
+
+def test_uniform_distribution_splits_evenly():
+    assert distribute(8, 4) == [2, 2, 2, 2]
+    assert distribute(10, 4) == [3, 3, 2, 2]
+    assert distribute(2, 4) == [1, 1, 1, 1]
+
+
+@pytest.mark.parametrize("total, parents", [(1000, 10), (100000, 100), (50, 40)])
+def test_zipf_distribution_has_long_tail(total, parents):
+    counts = distribute(total, parents, "zipf", 1.2)
+
+    assert len(counts) == parents
+    assert sum(counts) == total
+    assert min(counts) >= 1
+    assert counts == sorted(counts, reverse=True)
+    assert counts[0] > counts[-1]
+
+
+@pytest.mark.django_db
+def test_default_structure_matches_example():
+    output = setup_structure()
+
+    assert "Tenant structure setup complete" in output
+    assert set(Tenant.objects.values_list("name", flat=True)) == {"localhost", "Tenant1", "Tenant2"}
+    assert set(Domain.objects.values_list("domain_url", flat=True)) == {"localhost", "tenant1.localhost", "tenant2.localhost"}
+    assert Organization.objects.count() == 4
+    assert Department.objects.count() == 8
+    assert Customer.objects.count() == 16
+    assert Customer.objects.filter(name="Customer2_Dept1_Org1_Tenant1").exists()
+
+    tenant1 = Tenant.objects.get(name="Tenant1")
+    assert sorted(Customer.objects.filter(tenant=tenant1).values_list("local_id", flat=True)) == list(range(1, 9))
+    customer = Customer.objects.get(name="Customer1_Dept1_Org1_Tenant1")
+    assert (customer.organization.name, customer.tenant_id) == ("Org1_Tenant1", tenant1.id)
+
+    usernames = set(BaseUser.objects.values_list("username", flat=True))
+    assert usernames == {"admin_user_1"} | {
+        f"{prefix}_user_{number}" for prefix in ("tenant", "org", "dept", "customer") for number in (1, 2)
+    }
+    customer_user = BaseUser.objects.get(username="customer_user_1")
+    assert customer_user.customer_scope_id == customer.id
+    assert customer_user.department_scope_id == customer.department_id
+    assert customer_user.has_perm("tenants.view_customer")
+
+
+@pytest.mark.django_db
+def test_generated_domains_replace_cached_misses():
+    # tenants are inserted with bulk_create (see provision_tenants), domains requested earlier are cached as unknown
+    assert get_tenant_for_domain("tenant1.localhost") is None
+
+    setup_structure()
+
+    assert get_tenant_for_domain("tenant1.localhost") == Tenant.objects.get(name="Tenant1")
+
+
+@pytest.mark.django_db
+def test_generated_users_can_authenticate(client):
+    setup_structure()
+
+    assert get_access_token(client, "tenant1.localhost", "customer_user_1")
+    assert get_access_token(client, "tenant2.localhost", "org_user_2")
+
+
+@pytest.mark.django_db
+def test_skewed_structure_is_inserted_in_batches():
+    output = setup_structure(
+        "--tenants", "4", "--organizations", "3", "--departments", "2", "--customers", "5", "--users", "6",
+        "--distribution", "zipf", "--batch-size", "7",
+    )
+
+    organizations = [Organization.objects.filter(tenant__name=f"Tenant{i}").count() for i in range(1, 5)]
+    assert sum(organizations) == 12
+    assert organizations == sorted(organizations, reverse=True) and organizations[0] > organizations[-1]
+    assert f"customers: {Customer.objects.count()}" in output
+
+    for tenant in Tenant.objects.exclude(name="localhost"):
+        local_ids = list(Customer.objects.filter(tenant=tenant).order_by("local_id").values_list("local_id", flat=True))
+        assert local_ids == list(range(1, len(local_ids) + 1))
+
+    generated = BaseUser.objects.filter(username__startswith="user")
+    assert generated.count() == 24
+    assert generated.filter(customer_scope__isnull=False).exists()
+    assert all(user.tenant_scope_id for user in generated)
+
+
+@pytest.mark.django_db
+def test_existing_tenants_are_not_extended(tenant_setup):
+    before = Organization.objects.count()
+
+    output = setup_structure("--tenants", "5")
+
+    assert "Tenants already exist" in output
+    assert Organization.objects.count() == before
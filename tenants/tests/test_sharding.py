@@ -0,0 +1,150 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connections, DEFAULT_DB_ALIAS
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_503_SERVICE_UNAVAILABLE
+
+from tenants.management.commands.move_tenant_shard import Command as MoveTenantShardCommand
+from tenants.models import Tenant, Domain, Organization, Department, Customer
+from tenants.sharding import register_shard, unregister_shard, SHARD_ID_RANGE
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+
+
+SHARD = "shard_test"
+
+
+@pytest.fixture(scope="module")
+def shard_database(django_db_setup, django_db_blocker):
+    """
+    Second database registered as a shard at runtime, created (and migrated) the same way as the test database
+    """
+    default_settings = connections[DEFAULT_DB_ALIAS].settings_dict
+    shard_settings = {
+        key: default_settings[key] for key in ("ENGINE", "USER", "PASSWORD", "HOST", "PORT")
+    }
+    shard_settings["NAME"] = f"{default_settings['NAME']}_{SHARD}"
+
+    with django_db_blocker.unblock():
+        register_shard(SHARD, shard_settings, index=1)
+        old_name = connections[SHARD].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    yield SHARD
+
+    with django_db_blocker.unblock():
+        connections[SHARD].creation.destroy_test_db(old_name, verbosity=0)
+        unregister_shard(SHARD)
+
+
+sharded_db = pytest.mark.django_db(databases=[DEFAULT_DB_ALIAS, SHARD])
+
+
+def create_sharded_tenant(name, domain_url):
+    tenant = Tenant.objects.create(name=name, db_alias=SHARD)
+    Domain.objects.create(tenant=tenant, domain_url=domain_url)
+    organization = Organization.objects.create(name=f"Org_{name}", tenant=tenant)
+    department = Department.objects.create(name=f"Dept_{name}", organization=organization)
+    customer = Customer.objects.create(name=f"Customer_{name}", department=department)
+    user = BaseUser.objects.create_user(
+        username=f"org_user_{name}", password="password", tenant_scope=tenant, organization_scope=organization,
+    )
+    return tenant, organization, department, customer, user
+
+
+@sharded_db
+def test_tenant_data_is_stored_on_its_shard(shard_database, tenant_setup):
+    tenant, organization, department, customer, user = create_sharded_tenant("sharded", "sharded.localhost")
+
+    # tenant row is mirrored, tenant data exists only on the shard
+    assert Tenant.objects.using(SHARD).filter(pk=tenant.pk).exists()
+    for obj in [organization, department, customer, user]:
+        assert obj._state.db == SHARD
+        assert type(obj).objects.using(SHARD).filter(pk=obj.pk).exists()
+        assert not type(obj).objects.using(DEFAULT_DB_ALIAS).filter(pk=obj.pk).exists()
+        # ids are allocated from the id range of the shard
+        assert obj.pk > SHARD_ID_RANGE
+
+    # local ids come from sequences on the shard
+    assert organization.local_id == 1
+    assert customer.department.organization == organization
+
+
+@sharded_db
+def test_requests_are_routed_to_shard_of_domain(client, shard_database, tenant_setup):
+    tenant, organization, department, customer, user = create_sharded_tenant("sharded", "sharded.localhost")
+
+    access_token = get_access_token(client, "sharded.localhost", user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    list_response = client.get("/api/customers/", format="json")
+    assert list_response.status_code == HTTP_200_OK
+    assert [item["id"] for item in list_response.data["results"]] == [customer.local_id]
+
+    create_response = client.post("/api/departments/", {"name": "Sharded Dept 2", "organization": organization.local_id}, format="json")
+    assert create_response.status_code == HTTP_201_CREATED
+    assert Department.objects.using(SHARD).filter(name="Sharded Dept 2").exists()
+
+    # admins live in default database and can still sign in on domains of other shards
+    admin_user = tenant_setup["users"]["admins"][0]
+    admin_token = get_access_token(client, "sharded.localhost", admin_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {admin_token}")
+    admin_response = client.get("/api/organizations/", format="json")
+    assert admin_response.status_code == HTTP_200_OK
+    assert [item["id"] for item in admin_response.data] == [organization.id]
+
+
+@sharded_db
+def test_move_tenant_between_shards(client, shard_database, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    org_user = tenant_setup["users"]["organizations"][0]
+
+    access_token = get_access_token(client, domain_url1, org_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    customers_before = client.get("/api/customers/", format="json").data
+    organization_ids = set(Organization.objects.filter(tenant=tenant1).values_list("id", flat=True))
+    user_ids = set(BaseUser.objects.filter(tenant_scope=tenant1).values_list("id", flat=True))
+
+    call_command("move_tenant_shard", tenant1.pk, SHARD, "--cache-wait", "0", stdout=StringIO())
+
+    tenant1.refresh_from_db()
+    assert tenant1.db_alias == SHARD
+    assert not tenant1.is_migrating
+    assert set(Organization.objects.using(SHARD).filter(tenant=tenant1).values_list("id", flat=True)) == organization_ids
+    assert set(BaseUser.objects.using(SHARD).filter(tenant_scope=tenant1).values_list("id", flat=True)) == user_ids
+    assert not Organization.objects.using(DEFAULT_DB_ALIAS).filter(tenant=tenant1).exists()
+    assert not BaseUser.objects.using(DEFAULT_DB_ALIAS).filter(tenant_scope=tenant1).exists()
+
+    # tokens issued before the move keep working, responses are served from the new shard
+    assert client.get("/api/customers/", format="json").data == customers_before
+
+    # local_id sequences continue where they stopped
+    organization = Organization.objects.using(SHARD).get(pk=org_user.organization_scope_id)
+    create_response = client.post("/api/departments/", {"name": "Moved Dept", "organization": organization.local_id}, format="json")
+    assert create_response.status_code == HTTP_201_CREATED
+    assert create_response.data["id"] == Department.objects.using(SHARD).filter(organization__tenant=tenant1).count()
+
+
+@sharded_db
+def test_writes_are_rejected_while_tenant_is_migrating(client, tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    tenant_user = tenant_setup["users"]["tenants"][0]
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    tenant1.is_migrating = True
+    tenant1.save(update_fields=["is_migrating"])
+
+    assert client.get("/api/organizations/", format="json").status_code == HTTP_200_OK
+    create_response = client.post("/api/organizations/", {"name": "New Organization"}, format="json")
+    assert create_response.status_code == HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_move_waits_for_in_process_shared_cache(settings):
+    settings.TENANT_CACHE = {"SHARED_URL": None, "SHARED_TIMEOUT": 300, "LOCAL_TIMEOUT": 30}
+    assert MoveTenantShardCommand.get_default_cache_wait() == 300
+
+    settings.TENANT_CACHE = {"SHARED_URL": "redis://redis:6379/0", "SHARED_TIMEOUT": 300, "LOCAL_TIMEOUT": 30}
+    assert MoveTenantShardCommand.get_default_cache_wait() == 30
@@ -0,0 +1,151 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.status import HTTP_200_OK, HTTP_403_FORBIDDEN
+
+from tenants.models import Tenant, Domain
+from tenants.tenant_cache import get_tenant_cache, get_tenant_for_domain
+from tenants.tests.conftest import get_access_token
+
+
+@pytest.mark.django_db
+def test_domain_resolution_is_cached(tenant_setup):
+    """
+    Only the first resolution of a domain hits the database, next ones are served from the local tier
+    """
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    with CaptureQueriesContext(connection) as first_lookup:
+        tenant = get_tenant_for_domain(domain_url1)
+    assert tenant == tenant1
+    assert tenant.get_schema_name() == tenant1.get_schema_name()
+    assert len(first_lookup) == 1
+
+    with CaptureQueriesContext(connection) as second_lookup:
+        assert get_tenant_for_domain(domain_url1) == tenant1
+    assert len(second_lookup) == 0
+
+    stats = get_tenant_cache().stats()
+    assert stats["misses"] == 1
+    assert stats["local_hits"] == 1
+
+
+@pytest.mark.django_db
+def test_shared_tier_is_used_after_local_tier_expires(tenant_setup):
+    """
+    Other processes (simulated by dropping local tier) are served by the shared tier
+    """
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    get_tenant_for_domain(domain_url1)
+    get_tenant_cache().clear_local()
+
+    with CaptureQueriesContext(connection) as lookup:
+        assert get_tenant_for_domain(domain_url1) == tenant1
+    assert len(lookup) == 0
+    assert get_tenant_cache().stats()["shared_hits"] == 1
+
+
+@pytest.mark.django_db
+def test_unknown_domain_is_cached_until_domain_is_created(tenant_setup):
+    """
+    Unknown hosts are cached as well, creating a domain for them invalidates that entry
+    """
+    tenant1 = tenant_setup["tenants"][0]
+
+    assert get_tenant_for_domain("new_tenant.example.com") is None
+    assert get_tenant_for_domain("new_tenant.example.com") is None
+    assert get_tenant_cache().stats()["misses"] == 1
+
+    tenant = Tenant.objects.create(name="New Tenant")
+    Domain.objects.create(tenant=tenant, domain_url="new_tenant.example.com")
+
+    assert get_tenant_for_domain("new_tenant.example.com") == tenant
+    assert get_tenant_for_domain(tenant_setup["domains"][tenant1].domain_url) == tenant1
+
+
+@pytest.mark.django_db
+def test_domain_url_change_invalidates_cache(client, tenant_setup):
+    """
+    Changing domain_url through TenantSerializer.update invalidates both old and new url
+    """
+    admin_user = tenant_setup["users"]["admins"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    tenant2 = tenant_setup["tenants"][1]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    domain_url2 = tenant_setup["domains"][tenant2].domain_url
+
+    assert get_tenant_for_domain(domain_url2) == tenant2
+    assert get_tenant_for_domain("new_tenant.example.com") is None
+
+    access_token = get_access_token(client, domain_url1, admin_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    data = {"name": "Tenant - UPDATED", "domain_url": "new_tenant.example.com"}
+    update_response = client.put(f"/api/tenants/{tenant2.id}/", data=data, format="json")
+    assert update_response.status_code == HTTP_200_OK
+
+    assert get_tenant_for_domain(domain_url2) is None
+    assert get_tenant_for_domain("new_tenant.example.com") == tenant2
+
+    client.defaults['HTTP_HOST'] = domain_url2
+    list_response = client.get("/api/customers/", format="json")
+    assert list_response.status_code == HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_domain_deletion_invalidates_cache(tenant_setup):
+    tenant1 = tenant_setup["tenants"][0]
+    domain1 = tenant_setup["domains"][tenant1]
+
+    assert get_tenant_for_domain(domain1.domain_url) == tenant1
+
+    Domain.objects.get(id=domain1.id).delete()
+
+    assert get_tenant_for_domain(domain1.domain_url) is None
+
+
+@pytest.mark.django_db
+def test_requests_resolve_tenant_from_cache(client, tenant_setup):
+    """
+    Once a domain is resolved, following requests on it don't query tenant again
+    """
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    for _ in range(3):
+        list_response = client.get("/api/customers/", format="json")
+        assert list_response.status_code == HTTP_200_OK
+
+    stats = get_tenant_cache().stats()
+    assert stats["misses"] == 1
+    assert stats["local_hits"] >= 3
+
+
+@pytest.mark.django_db
+def test_cache_stats_endpoint(client, tenant_setup):
+    """
+    Only admins can read cache counters
+    """
+    admin_user = tenant_setup["users"]["admins"][0]
+    tenant_user = tenant_setup["users"]["tenants"][0]
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+
+    access_token = get_access_token(client, domain_url1, tenant_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    assert client.get("/api/tenant-cache/stats/", format="json").status_code == HTTP_403_FORBIDDEN
+
+    access_token = get_access_token(client, domain_url1, admin_user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    stats_response = client.get("/api/tenant-cache/stats/", format="json")
+
+    assert stats_response.status_code == HTTP_200_OK
+    assert stats_response.data["misses"] >= 1
+    assert "hit_ratio" in stats_response.data
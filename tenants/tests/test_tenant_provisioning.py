@@ -0,0 +1,122 @@
+import json
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+
+from tenants.local_ids import get_local_id_allocator
+from tenants.models import Tenant, Domain, SpareSchema
+from tenants.schema_pool import get_pool_size, refill_schema_pool
+from tenants.tenant_cache import get_tenant_for_domain
+
+
+def schema_exists(schema_name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s)", [schema_name])
+        return cursor.fetchone()[0]
+
+
+def write_manifest(tmp_path, count, prefix="Provisioned", suffix="csv"):
+    rows = [{"name": f"{prefix}{index}", "domain_url": f"{prefix.lower()}{index}.localhost"} for index in range(count)]
+    manifest = tmp_path / f"tenants.{suffix}"
+    if suffix == "json":
+        manifest.write_text(json.dumps(rows))
+    else:
+        manifest.write_text("name,domain_url\n" + "".join(f"{row['name']},{row['domain_url']}\n" for row in rows))
+    return manifest
+
+
+def provision(manifest, *args):
+    out = StringIO()
+    call_command("provision_tenants", str(manifest), "--processes", "1", *args, stdout=out)
+    return out.getvalue()
+
+
+@pytest.mark.django_db
+def test_tenants_are_provisioned_from_manifest(tmp_path):
+    output = provision(write_manifest(tmp_path, 5), "--chunk-size", "2", "--batch-size", "2")
+
+    assert "Provisioned 5 tenants" in output
+    for phase in ("validate", "schemas", "rows"):
+        assert f"  {phase}: " in output
+
+    tenants = Tenant.objects.filter(name__startswith="Provisioned")
+    assert tenants.count() == 5
+    for tenant in tenants:
+        assert Domain.objects.get(tenant=tenant).domain_url == f"{tenant.name.lower()}.localhost"
+        assert schema_exists(tenant.get_schema_name())
+        assert get_local_id_allocator().allocate(tenant.get_schema_name(), "organization_model", 1, "default") == [1]
+
+
+@pytest.mark.django_db
+def test_spare_schemas_are_claimed_first(tmp_path):
+    refill_schema_pool("default", 2)
+    spare_uuids = set(SpareSchema.objects.values_list("uuid", flat=True))
+
+    output = provision(write_manifest(tmp_path, 3, suffix="json"))
+
+    assert "2 schemas claimed from the pool" in output
+    assert get_pool_size("default") == 0
+    assert spare_uuids < set(Tenant.objects.filter(name__startswith="Provisioned").values_list("uuid", flat=True))
+
+
+@pytest.mark.django_db
+def test_provisioned_domains_replace_cached_misses(tmp_path):
+    # requested before it existed, unknown domains are cached too
+    assert get_tenant_for_domain("provisioned0.localhost") is None
+
+    provision(write_manifest(tmp_path, 2))
+
+    assert get_tenant_for_domain("provisioned0.localhost") == Tenant.objects.get(name="Provisioned0")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("existing", [
+    lambda: Tenant.objects.create(name="Provisioned1"),
+    lambda: Domain.objects.create(tenant=Tenant.objects.create(name="Other"), domain_url="provisioned2.localhost"),
+])
+def test_existing_tenants_are_rejected(tmp_path, existing):
+    existing()
+
+    with pytest.raises(CommandError, match="already exist"):
+        provision(write_manifest(tmp_path, 3))
+
+    assert not Tenant.objects.filter(name="Provisioned0").exists()
+
+
+@pytest.mark.django_db
+def test_duplicates_in_manifest_are_rejected(tmp_path):
+    manifest = tmp_path / "tenants.csv"
+    manifest.write_text("name,domain_url\nSame,one.localhost\nSame,two.localhost\n")
+
+    with pytest.raises(CommandError, match="Duplicated name"):
+        provision(manifest)
+
+
+@pytest.mark.django_db
+def test_schemas_of_failed_insert_return_to_pool(tmp_path):
+    with mock.patch.object(Domain.objects, "bulk_create", side_effect=RuntimeError("insert failed")):
+        with pytest.raises(RuntimeError):
+            provision(write_manifest(tmp_path, 3))
+
+    assert not Tenant.objects.filter(name__startswith="Provisioned").exists()
+    assert get_pool_size("default") == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_schemas_are_created_by_process_pool(tmp_path):
+    out = StringIO()
+    call_command("provision_tenants", str(write_manifest(tmp_path, 6)), "--processes", "2", "--chunk-size", "2", stdout=out)
+
+    schema_names = [tenant.get_schema_name() for tenant in Tenant.objects.filter(name__startswith="Provisioned")]
+    try:
+        assert len(schema_names) == 6
+        assert all(schema_exists(schema_name) for schema_name in schema_names)
+    finally:
+        # DDL of a transactional test isn't rolled back
+        with connection.cursor() as cursor:
+            for schema_name in schema_names:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
@@ -0,0 +1,93 @@
+from unittest import mock
+
+import pytest
+from django.db import connection
+
+from tenants import tenant_schema
+from tenants.tenant_schema import set_tenant_schema, reset_tenant_schema, get_search_path
+from tenants.tests.conftest import get_access_token
+
+
+def current_search_path():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_setting('search_path')")
+        return cursor.fetchone()[0]
+
+
+@pytest.fixture
+def applied_schemas():
+    schemas = []
+    original_apply = tenant_schema.apply_search_path
+
+    def record(connection, schema_name):
+        schemas.append(schema_name)
+        return original_apply(connection, schema_name)
+
+    with mock.patch("tenants.tenant_schema.apply_search_path", side_effect=record):
+        yield schemas
+    reset_tenant_schema()
+
+
+@pytest.mark.django_db
+def test_search_path_follows_tenant_schema(tenant_setup, applied_schemas):
+    tenant1 = tenant_setup["tenants"][0]
+    tenant2 = tenant_setup["tenants"][1]
+
+    set_tenant_schema(tenant1.get_schema_name())
+    assert current_search_path() == get_search_path(tenant1.get_schema_name())
+
+    set_tenant_schema(tenant2.get_schema_name())
+    assert current_search_path() == get_search_path(tenant2.get_schema_name())
+
+    reset_tenant_schema()
+    assert current_search_path() == tenant_schema.DEFAULT_SEARCH_PATH
+
+
+@pytest.mark.django_db
+def test_repeated_tenant_skips_set(tenant_setup, applied_schemas):
+    """
+    search_path is applied once per connection and tenant, not before every query
+    """
+    tenant1 = tenant_setup["tenants"][0]
+
+    set_tenant_schema(tenant1.get_schema_name())
+    for _ in range(3):
+        current_search_path()
+    set_tenant_schema(tenant1.get_schema_name())
+    current_search_path()
+
+    assert applied_schemas == [tenant1.get_schema_name()]
+
+
+@pytest.mark.django_db
+def test_search_path_set_in_transaction_is_not_reused(tenant_setup, applied_schemas):
+    """
+    Value set inside of a transaction can be rolled back, next request applies it again
+    """
+    tenant1 = tenant_setup["tenants"][0]
+
+    set_tenant_schema(tenant1.get_schema_name())
+    current_search_path()
+    assert connection.tenant_search_path_in_atomic
+
+    reset_tenant_schema()
+    assert connection.tenant_search_path is None
+
+
+@pytest.mark.django_db
+def test_each_request_uses_schema_of_its_tenant(client, tenant_setup, applied_schemas):
+    tenant_users = tenant_setup["users"]["tenants"]
+    tenants = tenant_setup["tenants"][:2]
+
+    for tenant, tenant_user in zip(tenants, tenant_users):
+        domain_url = tenant_setup["domains"][tenant].domain_url
+        access_token = get_access_token(client, domain_url, tenant_user.username)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+        applied_schemas.clear()
+        assert client.get("/api/customers/", format="json").status_code == 200
+        assert applied_schemas[-1:] == [tenant.get_schema_name()]
+        assert set(applied_schemas) <= {tenant.get_schema_name(), None}
+
+    # tenant context doesn't outlive the request
+    assert tenant_schema.get_tenant_schema() is None
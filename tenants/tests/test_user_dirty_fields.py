@@ -0,0 +1,91 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from user_management.models import BaseUser
+from user_management.utils import Role
+
+
+def save_queries(user, **kwargs):
+    with CaptureQueriesContext(connection) as queries:
+        user.save(**kwargs)
+    return [query["sql"] for query in queries.captured_queries]
+
+
+def selects_of_users(queries):
+    return [sql for sql in queries if sql.startswith("SELECT") and "user_management_baseuser" in sql]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("user_type", ["admins", "tenants"])
+def test_saves_of_loaded_users_are_not_preceded_by_fetch(tenant_setup, user_type):
+    user = BaseUser.objects.get(pk=tenant_setup["users"][user_type][0].pk)
+
+    user.last_login = timezone.now()
+    assert not selects_of_users(save_queries(user, update_fields=["last_login"]))
+
+    user.first_name = "Changed"
+    assert not selects_of_users(save_queries(user))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("field, value", [
+    ("tenant_scope_id", lambda setup: setup["tenants"][1].pk),
+    ("organization_scope_id", lambda setup: None),
+    ("role", lambda setup: Role.ROLE_TENANT_USER),
+])
+def test_scope_and_role_stay_immutable(tenant_setup, field, value):
+    user = BaseUser.objects.get(pk=tenant_setup["users"]["organizations"][0].pk)
+    setattr(user, field, value(tenant_setup))
+
+    with CaptureQueriesContext(connection) as queries, pytest.raises(ValidationError):
+        user.save()
+
+    assert not queries.captured_queries
+
+
+@pytest.mark.django_db
+def test_claim_changes_bump_token_version_once(tenant_setup):
+    user = BaseUser.objects.get(pk=tenant_setup["users"]["tenants"][0].pk)
+    version = user.token_version
+
+    user.username = "renamed_user"
+    user.save()
+    user.first_name = "Changed"
+    user.save()
+
+    assert BaseUser.objects.get(pk=user.pk).token_version == version + 1
+
+
+@pytest.mark.django_db
+def test_update_fields_limit_the_check(tenant_setup):
+    user = BaseUser.objects.get(pk=tenant_setup["users"]["tenants"][0].pk)
+    version = user.token_version
+
+    # changed claim isn't saved, token stays valid
+    user.username = "not_saved"
+    user.save(update_fields=["first_name"])
+    assert BaseUser.objects.get(pk=user.pk).token_version == version
+
+    user.save(update_fields=["username"])
+    stored = BaseUser.objects.get(pk=user.pk)
+    assert (stored.username, stored.token_version) == ("not_saved", version + 1)
+
+
+@pytest.mark.django_db
+def test_users_without_snapshot_are_compared_with_stored_row(tenant_setup):
+    stored = tenant_setup["users"]["departments"][0]
+    deferred = BaseUser.objects.only("id", "username", "tenant_scope").get(pk=stored.pk)
+
+    # deferred is_active has no stored value in the snapshot
+    deferred.is_active = False
+    deferred.save()
+    assert BaseUser.objects.get(pk=stored.pk).token_version == stored.token_version + 1
+
+    detached = BaseUser.objects.get(pk=stored.pk)
+    del detached._loaded_values
+    detached.department_scope = None
+    with pytest.raises(ValidationError):
+        detached.save()
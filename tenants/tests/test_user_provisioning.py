@@ -0,0 +1,154 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.hashers import check_password
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from tenants.tests.conftest import get_access_token
+from user_management.models import BaseUser
+from user_management.provisioning import hash_passwords
+from user_management.utils import Role
+
+
+@pytest.fixture(autouse=True)
+def fast_hasher(settings):
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+def authenticate(client, tenant_setup, user_type):
+    tenant1 = tenant_setup["tenants"][0]
+    domain_url1 = tenant_setup["domains"][tenant1].domain_url
+    user = tenant_setup["users"][user_type][0]
+
+    client.defaults['HTTP_HOST'] = domain_url1
+    access_token = get_access_token(client, domain_url1, user.username)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    return tenant1
+
+
+def scoped_items(tenant_setup, tenant, prefix, count):
+    organization = tenant_setup["organizations"][tenant][0]
+    department = tenant_setup["departments"][organization][0]
+    customer = tenant_setup["customers"][department][0]
+    scopes = [
+        {"tenant_scope": tenant.id},
+        {"organization_scope": organization.id},
+        {"tenant_scope": tenant.id, "department_scope": department.id},
+        {"customer_scope": customer.id},
+    ]
+    return [
+        {"username": f"{prefix}_{index}", "password": f"password {index}", **scopes[index % len(scopes)]}
+        for index in range(count)
+    ]
+
+
+def permission_names(user):
+    return set(user.user_permissions.values_list("content_type__app_label", "codename"))
+
+
+@pytest.mark.django_db
+def test_admin_provisions_users_of_every_scope(client, tenant_setup):
+    tenant1 = authenticate(client, tenant_setup, "admins")
+    existing_local_ids = {
+        role: set(BaseUser.objects.filter(tenant_scope=tenant1, role=role).values_list("local_id", flat=True)) for role in Role
+    }
+
+    response = client.post("/api/users/bulk/", scoped_items(tenant_setup, tenant1, "provisioned", 12), format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.data) == 12
+
+    created = BaseUser.objects.filter(username__startswith="provisioned_")
+    assert {user.role for user in created} == {Role.ROLE_TENANT_USER, Role.ROLE_ORG_USER, Role.ROLE_DEPT_USER, Role.ROLE_CUSTOMER_USER}
+    for user in created:
+        assert user.tenant_scope_id == tenant1.id
+        assert user.local_id not in existing_local_ids[user.role]
+        if user.customer_scope_id:
+            assert user.department_scope_id == user.customer_scope.department_id
+            assert user.organization_scope_id == user.customer_scope.organization_id
+        assert check_password(f"password {user.username.split('_')[1]}", user.password)
+
+    for user_type in ("tenants", "organizations", "departments", "customers"):
+        reference = tenant_setup["users"][user_type][0]
+        provisioned = created.filter(role=reference.role).first()
+        assert permission_names(provisioned) == permission_names(reference)
+
+    # provisioned users sign in like the others
+    client.credentials()
+    token_response = client.post("/api/token/", {"username": "provisioned_1", "password": "password 1"}, format="json")
+    assert token_response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_provisioning_queries_do_not_depend_on_users(client, tenant_setup):
+    tenant1 = authenticate(client, tenant_setup, "admins")
+
+    counts = []
+    # first request of the test warms up caches (tenant resolution, token version)
+    for prefix, count in (("warmup", 4), ("small", 4), ("large", 40)):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post("/api/users/bulk/", scoped_items(tenant_setup, tenant1, prefix, count), format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        counts.append(len(queries))
+
+    assert counts[1] == counts[2]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("change, message", [
+    (lambda items: items[1].update(username=items[0]["username"]), "duplicated"),
+    (lambda items: items[0].update(username="tenant_user_2"), "already exist"),
+    (lambda items: items[0].update(username="admin_user_1"), "already exist"),
+    (lambda items: items[3].update(department_scope=items[2]["department_scope"] + 1), "doesn't belong"),
+])
+def test_invalid_list_creates_nothing(client, tenant_setup, change, message):
+    tenant1 = authenticate(client, tenant_setup, "admins")
+    items = scoped_items(tenant_setup, tenant1, "invalid", 4)
+    change(items)
+
+    response = client.post("/api/users/bulk/", items, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert message in str(response.data)
+    assert not BaseUser.objects.filter(username__startswith="invalid_").exists()
+
+
+@pytest.mark.django_db
+def test_non_admin_cannot_provision_users(client, tenant_setup):
+    tenant1 = authenticate(client, tenant_setup, "tenants")
+
+    response = client.post("/api/users/bulk/", scoped_items(tenant_setup, tenant1, "denied", 2), format="json")
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert not BaseUser.objects.filter(username__startswith="denied_").exists()
+
+
+def test_passwords_are_hashed_by_process_pool(settings):
+    settings.USER_PROVISIONING = {"POOL_MIN_SIZE": 1}
+    passwords = [f"password {index}" for index in range(6)]
+
+    hashes = hash_passwords(passwords, processes=2)
+
+    assert all(check_password(password, hashed) for password, hashed in zip(passwords, hashes))
+
+
+@pytest.mark.django_db
+def test_command_provisions_users_from_csv(tenant_setup, tmp_path):
+    tenant1 = tenant_setup["tenants"][0]
+    organization = tenant_setup["organizations"][tenant1][0]
+    manifest = tmp_path / "users.csv"
+    manifest.write_text(
+        "username,password,tenant_scope,organization_scope,department_scope,customer_scope\n"
+        f"csv_tenant,secret,{tenant1.id},,,\n"
+        f"csv_org,secret,,{organization.id},,\n"
+    )
+    out = StringIO()
+
+    call_command("provision_users", str(manifest), "--processes", "1", stdout=out)
+
+    assert "Provisioned 2 users" in out.getvalue()
+    assert BaseUser.objects.get(username="csv_org").role == Role.ROLE_ORG_USER
+    assert BaseUser.objects.get(username="csv_tenant").local_id is not None
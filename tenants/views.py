@@ -1,20 +1,24 @@
 import logging
 
-from django.contrib.auth import get_user_model
 from rest_framework import status
-from rest_framework.permissions import DjangoModelPermissions
+from rest_framework.mixins import RetrieveModelMixin
+from rest_framework.permissions import DjangoModelPermissions, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError, PermissionDenied
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from .custom_viewsets import TenantScopedModelViewSet
-from .serializers import TenantSerializer, OrganizationSerializer, DepartmentSerializer, CustomerSerializer
+from user_management.models import ScopedUserMixin
+from .custom_viewsets import AsyncReadMixin, BackgroundJobMixin, BulkCreateMixin, StreamingExportMixin, TenantScopedModelViewSet
+from .serializers import JobSerializer, TenantSerializer, OrganizationSerializer, DepartmentSerializer, CustomerSerializer
 from .decorators import tenant_scope_required
-from .models import Organization, Department, Customer, Tenant
+from .pagination import ScopedCursorPagination, OptionalScopedCursorPagination
+from .jobs import enqueue_job
+from .models import Organization, Department, Customer, Tenant, Job
+from .tenant_cache import get_cache_stats
 
 
-class TenantViewSet(ModelViewSet):
+class TenantViewSet(BackgroundJobMixin, ModelViewSet):
     queryset = Tenant.objects.all()
     serializer_class = TenantSerializer
     permission_classes = [DjangoModelPermissions]
@@ -22,7 +26,7 @@ class TenantViewSet(ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
-        if not user.is_authenticated or not isinstance(user, get_user_model()):
+        if not user.is_authenticated or not isinstance(user, ScopedUserMixin):
             return super().get_queryset().none()
 
         model = self.queryset.model
@@ -32,25 +36,58 @@ class TenantViewSet(ModelViewSet):
         user = request.user
         if not (user.is_admin() or user.is_superuser):
             return Response({"error": "Permission denied."}, status=403)
+
+        if self.wants_background_job(request):
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            return self.job_accepted(enqueue_job("create_tenant", dict(serializer.validated_data), user=user))
         return super().create(request, *args, **kwargs)
 
 
+class JobViewSet(RetrieveModelMixin, GenericViewSet):
+    """
+    Progress of background jobs, users see jobs they started, admins all of them
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_admin() or user.is_superuser:
+            return super().get_queryset()
+        return super().get_queryset().filter(created_by_id=user.pk)
+
+
+class TenantCacheStatsView(APIView):
+    """
+    Hit/miss counters of domain -> tenant resolution cache (for the process that handled the request)
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_cache_stats())
+
+
 @tenant_scope_required
-class OrganizationViewSet(TenantScopedModelViewSet):
+class OrganizationViewSet(AsyncReadMixin, BulkCreateMixin, TenantScopedModelViewSet):
     queryset = Organization.objects.all()
     serializer_class = OrganizationSerializer
     permission_classes = [DjangoModelPermissions]
+    pagination_class = OptionalScopedCursorPagination
 
 
 @tenant_scope_required
-class DepartmentViewSet(TenantScopedModelViewSet):
+class DepartmentViewSet(AsyncReadMixin, BulkCreateMixin, StreamingExportMixin, TenantScopedModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [DjangoModelPermissions]
+    pagination_class = OptionalScopedCursorPagination
 
 
 @tenant_scope_required
-class CustomerViewSet(TenantScopedModelViewSet):
+class CustomerViewSet(AsyncReadMixin, BulkCreateMixin, StreamingExportMixin, TenantScopedModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [DjangoModelPermissions]
+    pagination_class = ScopedCursorPagination
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class UserManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_management'
+
+    def ready(self):
+        from .models import BaseUser
+        from .token_versions import invalidate_deleted_user
+
+        post_delete.connect(invalidate_deleted_user, sender=BaseUser)
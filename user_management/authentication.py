@@ -0,0 +1,51 @@
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from tenants.sharding import get_user_db_alias
+from user_management.token_versions import get_token_version
+
+
+_NOT_AUTHENTICATED = object()
+
+
+class RequestScopedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps its result on the django request.
+    TenantMiddleware authenticates the token first and DRF reuses that result,
+    so each request pays for a single token decode and a single user fetch.
+    """
+
+    def authenticate(self, request):
+        # DRF passes its own Request, middleware passes django HttpRequest
+        django_request = getattr(request, "_request", request)
+
+        result = getattr(django_request, "_jwt_authentication", _NOT_AUTHENTICATED)
+        if result is _NOT_AUTHENTICATED:
+            try:
+                result = super().authenticate(request)
+            except AuthenticationFailed as e:
+                result = e
+            django_request._jwt_authentication = result
+
+        if isinstance(result, AuthenticationFailed):
+            raise result
+        return result
+
+    def get_user(self, validated_token):
+        """
+        Tokens carrying scope claims are turned into ScopedTokenUser without a database query,
+        only their token_version is compared with the (cached) current version of the user.
+        Tokens issued before scope claims existed still load BaseUser.
+        """
+        if "token_version" not in validated_token:
+            return super().get_user(validated_token)
+
+        user = api_settings.TOKEN_USER_CLASS(validated_token)
+
+        if user.is_deleted:
+            raise AuthenticationFailed("Authentication is unavailable. User was soft deleted.", code="user_deleted")
+        if get_token_version(user.id, using=get_user_db_alias(user.tenant_scope_id)) != user.token_version:
+            raise AuthenticationFailed("Token is outdated, scope of the user has changed.", code="token_outdated")
+
+        return user
@@ -0,0 +1,19 @@
+from django.contrib.auth.backends import ModelBackend
+
+from user_management.models import writes_role_permission_rows
+from user_management.utils import ROLE_PERMISSIONS_MANAGER
+
+
+class RolePermissionBackend(ModelBackend):
+    """
+    ModelBackend whose user permissions are the permissions of the user's role in "virtual" ROLE_PERMISSIONS_MODE,
+    user_permissions rows are neither read nor written (BaseUser.save skips them). In "rows" mode it reads the rows as ModelBackend does.
+    Group permissions and authentication are left to ModelBackend
+    """
+
+    def get_user_permissions(self, user_obj, obj=None):
+        if writes_role_permission_rows():
+            return super().get_user_permissions(user_obj, obj)
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return set(ROLE_PERMISSIONS_MANAGER.get_role_permissions(user_obj.role))
@@ -1,22 +1,35 @@
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.exceptions import PermissionDenied, NotFound, AuthenticationFailed
-from user_management.models import BaseUser
-from tenants.models import Domain
+from user_management.models import BaseUser, get_token_claims
+from user_management.token_versions import get_token_version
+from tenants.replicas import get_read_alias, read_from_replica
+from tenants.sharding import get_user_db_alias, use_shard
+from tenants.tenant_cache import get_tenant_for_domain
 
 
+class TenantAwareTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # claims are copied from refresh token into every access token created from it
+        token = super().get_token(user)
+        for claim, value in get_token_claims(user).items():
+            token[claim] = value
+        return token
+
 
 class TenantAwareTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
         response = super().post(request, *args, **kwargs)
         if response.status_code == 200:
-            user = BaseUser.objects.get(username=request.data.get("username"))
-            domain = Domain.objects.filter(domain_url=request.get_host()).first()
+            user = BaseUser.objects.get_by_natural_key(request.data.get("username"))
+            domain_tenant = get_tenant_for_domain(request.get_host())
 
             if not user.is_admin():
-                if not domain:
+                if not domain_tenant:
                     raise NotFound("Domain not found.")
-                if user.tenant_scope != domain.tenant:
+                if user.tenant_scope_id != domain_tenant.id:
                     raise PermissionDenied("Invalid domain for the user.")
                 if user.is_deleted:
                     raise AuthenticationFailed("Authentication is unavailable. User was soft deleted.")
@@ -35,21 +48,29 @@ class TenantAwareTokenRefreshView(TokenRefreshView):
         except Exception:
             raise AuthenticationFailed({"error": "Invalid or expired refresh token."})
 
+        user_db_alias = get_user_db_alias(decoded_token.get("tenant_scope_id"))
         try:
-            user = BaseUser.objects.get(id=user_id)
+            user = BaseUser.objects.using(get_read_alias(user_db_alias)).get(id=user_id)
         except BaseUser.DoesNotExist:
             raise NotFound({"user_not_found": "User not found."})
 
-        domain = Domain.objects.filter(domain_url=request.get_host()).first()
+        domain_tenant = get_tenant_for_domain(request.get_host())
 
         if not user.is_admin():
-            if not domain:
+            if not domain_tenant:
                 raise NotFound({"domain_not_found": "Domain not found."})
 
-            if user.tenant_scope != domain.tenant:
+            if user.tenant_scope_id != domain_tenant.id:
                 raise PermissionDenied({"tenant_mismatch": "Invalid domain for the user."})
 
             if user.is_deleted:
                 raise AuthenticationFailed({"user_deleted": "Authentication is unavailable. User was soft deleted."})
 
-        return super().post(request, *args, **kwargs)
+        # replica can lag behind, version bumps are visible in shared cache right after they are saved
+        token_version = decoded_token.get("token_version")
+        if token_version is not None and token_version != get_token_version(user.pk, using=user_db_alias):
+            raise AuthenticationFailed({"token_version": "Refresh token is outdated, scope of the user has changed."})
+
+        # serializer fetches the user again, from the shard it was found on
+        with use_shard(user_db_alias), read_from_replica():
+            return super().post(request, *args, **kwargs)
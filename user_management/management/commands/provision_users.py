@@ -0,0 +1,64 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from tenants.sharding import use_shard
+from user_management.provisioning import get_provisioning_setting
+from user_management.serializers import ProvisionUserSerializer, SCOPE_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates scoped users listed in a CSV or JSON manifest at once (same validation as POST /api/users/bulk/). "
+        "Rows: username, password and ids of tenant_scope, organization_scope, department_scope, customer_scope (lowest one is enough)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="path of a .csv (with header row) or .json (list of objects) file")
+        parser.add_argument("--shard", default=DEFAULT_DB_ALIAS, help="database alias of the shard the scopes live on")
+        parser.add_argument("--batch-size", type=int, default=None, help="rows per INSERT (defaults to USER_PROVISIONING BATCH_SIZE)")
+        parser.add_argument("--processes", type=int, default=None, help="password hashing processes (defaults to USER_PROVISIONING HASH_PROCESSES)")
+
+    def handle(self, *args, **options):
+        items = self.read_manifest(Path(options["manifest"]))
+        context = {
+            "bulk_create_batch_size": options["batch_size"] or get_provisioning_setting("BATCH_SIZE"),
+            "hash_processes": options["processes"],
+        }
+
+        start = time.perf_counter()
+        with use_shard(options["shard"]):
+            serializer = ProvisionUserSerializer(data=items, many=True, allow_empty=False, context=context)
+            if not serializer.is_valid():
+                raise CommandError(f"Invalid manifest: {json.dumps(serializer.errors)}")
+            users = serializer.save()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Provisioned {len(users)} users in {elapsed:.2f} s ({len(users) / elapsed:.0f} users/s)"
+        ))
+
+    def read_manifest(self, path):
+        if not path.exists():
+            raise CommandError(f"Manifest {path} does not exist")
+
+        if path.suffix == ".json":
+            items = json.loads(path.read_text())
+            if not isinstance(items, list):
+                raise CommandError("JSON manifest has to be a list of users")
+            return items
+
+        if path.suffix == ".csv":
+            with path.open(newline="") as manifest:
+                rows = list(csv.DictReader(manifest))
+            # empty cells are scopes the user doesn't have
+            return [
+                {field: int(value) if field in SCOPE_FIELDS and value.isdigit() else value for field, value in row.items() if value not in ("", None)}
+                for row in rows
+            ]
+
+        raise CommandError("Manifest has to be a .csv or .json file")
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tenants.sharding import get_shard_aliases
+from user_management.models import BaseUser, get_permission_ids
+from user_management.utils import Role, ROLE_PERMISSIONS_MANAGER
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes user_permissions rows written for roles of users (ROLE_PERMISSIONS_MODE \"rows\") from every shard. "
+        "Only allowed in \"virtual\" mode, where permissions are computed from roles. Permissions granted outside of roles are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000, help="rows per DELETE")
+        parser.add_argument("--dry-run", action="store_true", help="only count rows that would be deleted")
+
+    def handle(self, *args, **options):
+        if getattr(settings, "ROLE_PERMISSIONS_MODE", "rows") != "virtual":
+            raise CommandError("Set ROLE_PERMISSIONS_MODE=virtual first, in \"rows\" mode role permissions are read from these rows")
+
+        through = BaseUser.user_permissions.through
+        total = 0
+        for alias in get_shard_aliases():
+            deleted = 0
+            for role in Role:
+                permission_ids = get_permission_ids(ROLE_PERMISSIONS_MANAGER.get_role_permissions(role), alias).values()
+                if not permission_ids:
+                    continue
+
+                rows = through.objects.using(alias).filter(baseuser__role=role, permission_id__in=permission_ids)
+                if options["dry_run"]:
+                    deleted += rows.count()
+                    continue
+                # batches keep locks and transactions of a large table short
+                while True:
+                    batch = list(rows.order_by("pk").values_list("pk", flat=True)[:options["batch_size"]])
+                    if not batch:
+                        break
+                    deleted += through.objects.using(alias).filter(pk__in=batch).delete()[0]
+
+            total += deleted
+            self.stdout.write(f"{alias}: {deleted} rows")
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} role permission rows"))
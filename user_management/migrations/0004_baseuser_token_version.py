@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_management', '0003_alter_baseuser_managers_baseuser_local_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseuser',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tenants', '0010_local_id_pagination_indexes'),
+        ('user_management', '0004_baseuser_token_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baseuser',
+            index=models.Index(fields=['tenant_scope', 'local_id', 'id'], name='baseuser_tenant_local_idx'),
+        ),
+    ]
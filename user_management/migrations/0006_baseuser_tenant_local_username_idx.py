@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tenants', '0014_spare_schema'),
+        ('user_management', '0005_local_id_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='baseuser',
+            name='baseuser_tenant_local_idx',
+        ),
+        migrations.AddIndex(
+            model_name='baseuser',
+            index=models.Index(fields=['tenant_scope', 'local_id', 'username'], name='baseuser_tenant_local_idx'),
+        ),
+    ]
@@ -1,31 +1,74 @@
 from django.apps import apps
+from django.conf import settings
+from django.utils.functional import cached_property
 from django.db.models import Window, F
 from django.db.models.functions import RowNumber
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, Permission, BaseUserManager
-from django.db import models, connection
+from django.db import models, router, transaction, DEFAULT_DB_ALIAS
 from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework_simplejwt.models import TokenUser
 
 from user_management.utils import (Role, TENANT_DEPENDANT_ROLES, ORGANIZATION_DEPENDANT_ROLES,
                                    DEPARTMENT_DEPENDANT_ROLES, CUSTOMER_DEPENDANT_ROLES, ROLE_HIERARCHY,
-                                   RolePermissionsManager)
+                                   ROLE_PERMISSIONS_MANAGER, get_scope_role)
+from tenants.local_ids import get_local_id_allocator
+from tenants.sharding import get_user_db_alias
+from user_management.scope_filters import get_scope_filter_plan
+from user_management.token_versions import set_token_version
+
+
+# BaseUser fields copied into access token claims (alongside token_version)
+# every change of these fields bumps token_version, which invalidates previously issued tokens
+TOKEN_CLAIM_FIELDS = (
+    "username",
+    "local_id",
+    "role",
+    "tenant_scope_id",
+    "organization_scope_id",
+    "department_scope_id",
+    "customer_scope_id",
+    "is_deleted",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+def writes_role_permission_rows():
+    """
+    True when permissions of roles are stored in user_permissions (ROLE_PERMISSIONS_MODE "rows"),
+    in "virtual" mode they are computed from the role (see backends.RolePermissionBackend)
+    """
+    return getattr(settings, "ROLE_PERMISSIONS_MODE", "rows") == "rows"
+
+
+def get_permission_ids(permissions, using):
+    """
+    {"app_label.codename": id} of permissions in the database (every shard has its own permission rows), fetched with one query
+    """
+    if not permissions:
+        return {}
+    rows = Permission.objects.using(using).filter(codename__in={permission.split(".")[1] for permission in permissions})
+    permission_ids = {
+        f"{app_label}.{codename}": pk
+        for pk, app_label, codename in rows.values_list("pk", "content_type__app_label", "codename")
+    }
+    return {permission: permission_ids[permission] for permission in permissions if permission in permission_ids}
+
 
 class TenantBaseUserManager(BaseUserManager):
+    def get_by_natural_key(self, username):
+        try:
+            return super().get_by_natural_key(username)
+        except self.model.DoesNotExist:
+            # users without tenant (admins) live in default database, they can sign in on domain of any shard
+            if self.db == DEFAULT_DB_ALIAS:
+                raise
+            return self.db_manager(DEFAULT_DB_ALIAS).get_by_natural_key(username)
+
     def create_user(self, username, password, is_admin=False, tenant_scope=None, organization_scope=None, department_scope=None, customer_scope=None,  **extra_fields):
 
-        if is_admin:
-            role = Role.ROLE_TENANT_ADMIN
-        else:
-            if customer_scope is not None:
-                role = Role.ROLE_CUSTOMER_USER
-            elif department_scope is not None:
-                role = Role.ROLE_DEPT_USER
-            elif organization_scope is not None:
-                role = Role.ROLE_ORG_USER
-            elif tenant_scope is not None:
-                role = Role.ROLE_TENANT_USER
-            else:
-                role = Role.ROLE_UNNASIGNED
+        role = get_scope_role(is_admin, tenant_scope, organization_scope, department_scope, customer_scope)
 
         user = self.model(
             username=username,
@@ -50,175 +93,70 @@ class TenantBaseUserManager(BaseUserManager):
 
         return self.create_user(username, password, True, **extra_fields)
 
-class BaseUser(AbstractUser):
-    local_id = models.PositiveIntegerField(null=True, blank=True)
-    role = models.PositiveSmallIntegerField(choices=Role.choices, default=Role.ROLE_UNNASIGNED)
-    tenant_scope = models.ForeignKey("tenants.Tenant", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
-    organization_scope = models.ForeignKey("tenants.Organization", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
-    department_scope = models.ForeignKey("tenants.Department", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
-    customer_scope = models.ForeignKey("tenants.Customer", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
-    is_deleted = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    deleted_at = models.DateTimeField(null=True, blank=True)
-
-    objects = TenantBaseUserManager()
-
-    def __str__(self):
-        return self.username
+class ScopedUserMixin:
+    """
+    Role and scope logic shared by BaseUser and ScopedTokenUser.
+    Scopes are read through their raw *_id attributes, so none of these methods fetch related objects
+    """
 
     def is_admin(self):
         return self.role == Role.ROLE_TENANT_ADMIN or self.is_superuser or self.is_staff
 
-    def can_assign_role(self, target_user, role):
-        role_manager = RolePermissionsManager()
-        if role not in role_manager.get_role_hierarchy(self.role):
-            return False
-
-        if role_manager.is_role_tenant_dependant(self.role) and target_user.tenant_scope != self.tenant_scope:
-            return False
-        if role_manager.is_role_organization_dependant(self.role) and target_user.organization_scope != self.organization_scope:
-            return False
-        if role_manager.is_role_department_dependant(self.role) and target_user.department_scope != self.department_scope:
-            return False
-        if self.role is Role.ROLE_CUSTOMER_USER and target_user.customer_scope != self.customer_scope:
-            return False
-
-        return True
-
-    def get_limited_object(self, model, obj_id):
+    def get_limited_object(self, model, obj_id, queryset=None):
+        """
+        Object by id (admins) or local_id, looked up in queryset (a get_limited_queryset() of the model, possibly annotated)
+        """
         if self.is_admin():
-            return self.get_limited_object_by_id(model, obj_id)
-        return self.get_limited_object_by_local_id(model, obj_id)
+            return self.get_limited_object_by_id(model, obj_id, queryset)
+        return self.get_limited_object_by_local_id(model, obj_id, queryset)
 
-    def get_limited_object_by_id(self, model, obj_id):
+    def get_limited_object_by_id(self, model, obj_id, queryset=None):
+        if queryset is None:
+            queryset = self.get_limited_queryset(model)
         try:
-            return self.get_limited_queryset(model).get(id=obj_id)
+            return queryset.get(id=obj_id)
         except model.DoesNotExist:
             raise NotFound(f"{model._meta.model_name} instance with id == '{obj_id}' not found in the scope of this user")
 
-    def get_limited_object_by_local_id(self, model, obj_id):
+    def get_limited_object_by_local_id(self, model, obj_id, queryset=None):
+        if queryset is None:
+            queryset = self.get_limited_queryset(model)
         try:
-            return self.get_limited_queryset(model).get(local_id=obj_id)
+            return queryset.get(local_id=obj_id)
         except model.DoesNotExist:
             raise NotFound(f"{model._meta.model_name} instance with local_id == '{obj_id}' not found in the scope of this user")
 
+    async def aget_limited_object(self, model, obj_id, queryset=None):
+        """
+        Async counterpart of get_limited_object (used by async read views under ASGI)
+        """
+        if queryset is None:
+            queryset = self.get_limited_queryset(model)
+        lookup_field = "id" if self.is_admin() else "local_id"
+        try:
+            return await queryset.aget(**{lookup_field: obj_id})
+        except model.DoesNotExist:
+            raise NotFound(f"{model._meta.model_name} instance with {lookup_field} == '{obj_id}' not found in the scope of this user")
+
     def get_limited_queryset(self, model):
         """
         Returns a queryset of objects limited to a specific model.
-        Using model_role_filters, we get filters that specific role would use to get queryset
+        Filters of each (model, role) pair are compiled once (see scope_filters.SCOPE_FILTER_RULES)
         By default Role.ROLE_TENANT_ADMIN, superusers and staff are not limited in this way
         """
-        model_name = model._meta.model_name
-
         if self.is_admin() or self.is_superuser:
             return model.objects.all()
 
-        # Depending on model, we change filters that each user role will use to get the queryset
-        model_role_filters = {
-            "tenant": {
-                Role.ROLE_TENANT_USER: {
-                    "id": self.tenant_scope.id if self.tenant_scope else None,
-                    "is_deleted": False
-                },
-            },
-            "organization": {
-                Role.ROLE_TENANT_USER: {
-                    "tenant": self.tenant_scope.id if self.tenant_scope else None,
-                    "is_deleted": False
-                },
-                Role.ROLE_ORG_USER: {
-                    "id": self.organization_scope.id if self.organization_scope else None,
-                    "tenant": self.tenant_scope,
-                    "is_deleted": False
-                },
-            },
-            "department": {
-                Role.ROLE_TENANT_USER: {
-                    "organization__tenant": self.tenant_scope.id if self.tenant_scope else None,
-                    "is_deleted": False
-                },
-                Role.ROLE_ORG_USER: {
-                    "organization": self.organization_scope.id if self.organization_scope else None,
-                    "organization__tenant": self.tenant_scope,
-                    "is_deleted": False
-                },
-                Role.ROLE_DEPT_USER: {
-                    "id": self.department_scope.id if self.department_scope else None,
-                    "organization": self.organization_scope,
-                    "organization__tenant": self.tenant_scope,
-                    "is_deleted": False
-                },
-            },
-            "customer": {
-                Role.ROLE_TENANT_USER: {
-                    "department__organization__tenant": self.tenant_scope.id if self.tenant_scope else None,
-                    "is_deleted": False
-                },
-                Role.ROLE_ORG_USER: {
-                    "department__organization": self.organization_scope.id if self.organization_scope else None,
-                    "department__organization__tenant": self.tenant_scope,
-                    "is_deleted": False
-                },
-                Role.ROLE_DEPT_USER: {
-                    "department": self.department_scope.id if self.department_scope else None,
-                    "department__organization": self.organization_scope,
-                    "department__organization__tenant": self.tenant_scope,
-                    "is_deleted": False
-                },
-                Role.ROLE_CUSTOMER_USER: {
-                    "id": self.customer_scope.id if self.customer_scope else None,
-                    "department": self.department_scope,
-                    "department__organization": self.organization_scope,
-                    "department__organization__tenant": self.tenant_scope,
-                    "is_deleted": False
-                },
-            },
-            "baseuser": {
-                Role.ROLE_TENANT_USER: {
-                    "tenant_scope": self.tenant_scope,
-                    "is_deleted": False
-                },
-                Role.ROLE_ORG_USER: {
-                    "organization_scope": self.organization_scope,
-                    "tenant_scope": self.tenant_scope,
-                    "is_deleted": False
-                },
-                Role.ROLE_DEPT_USER: {
-                    "department_scope": self.department_scope,
-                    "organization_scope": self.organization_scope,
-                    "tenant_scope": self.tenant_scope,
-                    "is_deleted": False
-                },
-                Role.ROLE_CUSTOMER_USER: {
-                    "customer_scope": self.customer_scope,
-                    "department_scope": self.department_scope,
-                    "organization_scope": self.organization_scope,
-                    "tenant_scope": self.tenant_scope,
-                    "is_deleted": False
-                },
-            },
+        plan = get_scope_filter_plan(model, self.role)
 
-        }
-
-        filters = model_role_filters.get(model_name, {}).get(self.role, {})
-
-        # if filters are empty - then it means that Role does not allow to access any instances of that model
-        if not filters or (self.role == Role.ROLE_CUSTOMER_USER and not self.customer_scope):
+        # if there is no plan - then it means that Role does not allow to access any instances of that model
+        if plan is None:
             return model.objects.none()
 
-        queryset = model.objects.filter(**filters)
-        related_fields = ["tenant", "organization", "department", "customer"]
-        for field in related_fields:
-            if hasattr(model, field):
-                queryset = queryset.select_related(field)
-
-        return queryset
+        return plan.apply(self)
 
     def has_perm(self, perm, obj=None):
-        role_manager = RolePermissionsManager()
-
-        if perm not in role_manager.get_role_permissions(self.role):
+        if not ROLE_PERMISSIONS_MANAGER.has_role_permission(self.role, perm):
             return False
 
         if self.role == Role.ROLE_UNNASIGNED:
@@ -257,6 +195,65 @@ class BaseUser(AbstractUser):
 
         return False
 
+    def get_lowest_scope(self):
+        if self.customer_scope_id:
+            return "customer"
+        if self.department_scope_id:
+            return "department"
+        if self.organization_scope_id:
+            return "organization"
+        if self.tenant_scope_id:
+            return "tenant"
+        return None
+
+
+class BaseUser(ScopedUserMixin, AbstractUser):
+    local_id = models.PositiveIntegerField(null=True, blank=True)
+    role = models.PositiveSmallIntegerField(choices=Role.choices, default=Role.ROLE_UNNASIGNED)
+    tenant_scope = models.ForeignKey("tenants.Tenant", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
+    organization_scope = models.ForeignKey("tenants.Organization", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
+    department_scope = models.ForeignKey("tenants.Department", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
+    customer_scope = models.ForeignKey("tenants.Customer", on_delete=models.CASCADE, null=True, blank=True, db_index=True)
+    is_deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # part of every access token, bumped whenever any of TOKEN_CLAIM_FIELDS changes, so older tokens are rejected
+    token_version = models.PositiveIntegerField(default=0)
+
+    objects = TenantBaseUserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # keyset pagination of scoped user lists (ScopedCursorPagination orders by local_id, username,
+            # see local_id_tie_breaker of BaseUserViewSet)
+            models.Index(fields=["tenant_scope", "local_id", "username"], name="baseuser_tenant_local_idx"),
+        ]
+
+    def __str__(self):
+        return self.username
+
+    def get_shard_alias(self):
+        # users are stored on the shard of their tenant, users without tenant (admins) in default database
+        return self.tenant_scope.db_alias if self.tenant_scope_id else DEFAULT_DB_ALIAS
+
+    def can_assign_role(self, target_user, role):
+        role_manager = ROLE_PERMISSIONS_MANAGER
+        if not role_manager.can_role_assign(self.role, role):
+            return False
+
+        # scope ids are compared, related objects aren't fetched
+        if role_manager.is_role_tenant_dependant(self.role) and target_user.tenant_scope_id != self.tenant_scope_id:
+            return False
+        if role_manager.is_role_organization_dependant(self.role) and target_user.organization_scope_id != self.organization_scope_id:
+            return False
+        if role_manager.is_role_department_dependant(self.role) and target_user.department_scope_id != self.department_scope_id:
+            return False
+        if role_manager.is_role_customer_dependant(self.role) and target_user.customer_scope_id != self.customer_scope_id:
+            return False
+
+        return True
+
     def clean(self):
         self._validate_tenant_scope()
         self._validate_organization_scope()
@@ -290,86 +287,196 @@ class BaseUser(AbstractUser):
         if self.role in CUSTOMER_DEPENDANT_ROLES and not self.customer_scope:
             raise ValidationError({"customer_scope": "This role requires customer."})
 
-    def _assign_permission(self, permission):
-        app_label, perm_codename = permission.split(".")
-        permission = Permission.objects.filter(codename=perm_codename, content_type__app_label=app_label).first()
-        if permission and permission not in self.user_permissions.all():
-            self.user_permissions.add(permission)
+    def _assign_role_permissions(self):
+        if self.role is not None and writes_role_permission_rows():
+            self.user_permissions.add(*get_permission_ids(ROLE_PERMISSIONS_MANAGER.get_role_permissions(self.role), self._state.db).values())
 
-    def _assign_role_permissions(self, role_manager):
-        if self.role is not None:
-            for permission in role_manager.get_role_permissions(self.role):
-                self._assign_permission(permission)
-
-    def _reset_role_permissions(self, role_manager):
+    def _reset_role_permissions(self):
+        if not writes_role_permission_rows():
+            return
         self.user_permissions.clear()
-        self._assign_role_permissions(role_manager)
+        self._assign_role_permissions()
 
     def soft_delete(self):
         if self.is_deleted:
             return
         self.is_deleted = True
         self.deleted_at = timezone.now()
-        self.save(skip_scope_validation=True, update_fields=["is_deleted", "deleted_at"])
+        self._bump_token_version()
+        self.save(skip_scope_validation=True, update_fields=["is_deleted", "deleted_at", "token_version"])
 
     def restore(self):
         if self.is_deleted:
             return
         self.is_deleted = False
         self.deleted_at = None
-        self.save(skip_scope_validation=True, update_fields=["is_deleted", "deleted_at"])
+        self._bump_token_version()
+        self.save(skip_scope_validation=True, update_fields=["is_deleted", "deleted_at", "token_version"])
 
-    def get_lowest_scope(self):
-        if self.customer_scope:
-            return "customer"
-        if self.department_scope:
-            return "department"
-        if self.organization_scope:
-            return "organization"
-        if self.tenant_scope:
-            return "tenant"
-        return None
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # stored values of token claims, save() compares them instead of fetching the row again
+        instance._loaded_values = {field: instance.__dict__[field] for field in TOKEN_CLAIM_FIELDS if field in instance.__dict__}
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self._take_snapshot(fields)
+
+    def _take_snapshot(self, fields=None):
+        """
+        Stores current values of token claims (all of them or those among fields) as their database values
+        """
+        names = None if fields is None else {self._meta.get_field(field).attname for field in fields}
+        loaded = getattr(self, "_loaded_values", {})
+        for field in TOKEN_CLAIM_FIELDS:
+            if field in self.__dict__ and (names is None or field in names):
+                loaded[field] = self.__dict__[field]
+        self._loaded_values = loaded
+
+    def _check_changed_fields(self, save_kwargs):
+        """
+        Compares token claims that are going to be saved with their stored values (snapshot of from_db, a query only for
+        fields missing in it): scopes and role can't be changed (except by superuser admins), changes of claims bump token_version.
+        Saves of other fields only (last_login, password...) skip the check
+        """
+        update_fields = save_kwargs.get("update_fields")
+        fields = [field for field in TOKEN_CLAIM_FIELDS if field in self.__dict__]
+        if update_fields is not None:
+            names = {self._meta.get_field(field).attname for field in update_fields}
+            fields = [field for field in fields if field in names]
+        if not fields:
+            return
+
+        loaded = getattr(self, "_loaded_values", {})
+        missing = [field for field in fields if field not in loaded]
+        if missing:
+            # instance that wasn't loaded from the database (or whose fields were deferred)
+            loaded = {**loaded, **BaseUser.objects.db_manager(self._state.db).filter(pk=self.pk).values(*missing).get()}
+        changed = {field for field in fields if loaded[field] != self.__dict__[field]}
+        if not changed:
+            return
+
+        if not self.is_admin() or not self.is_superuser:
+            for field in ("tenant_scope", "organization_scope", "department_scope", "customer_scope", "role"):
+                if self._meta.get_field(field).attname in changed:
+                    raise ValidationError(
+                        {
+                            field: f"You cannot change your {field.replace('_', ' ')}.",
+                         }
+                    )
+        if "role" in changed:
+            self._reset_role_permissions()
+
+        self._bump_token_version()
+        if update_fields is not None:
+            save_kwargs["update_fields"] = {*update_fields, "token_version"}
+
+    def _bump_token_version(self):
+        self.token_version += 1
+        self._token_version_changed = True
 
     def save(self, *args, skip_scope_validation=False, **kwargs):
         initial_setup = self.pk is None
-        role_manager = RolePermissionsManager()
+
+        if self._state.adding and self.get_shard_alias():
+            # managers pass their own database, new users always go to the shard of their tenant (its primary)
+            kwargs["using"] = router.db_for_write(BaseUser, instance=self)
 
         if self.local_id is None and not self.is_admin():
             tenant = self.tenant_scope
             if tenant:
-                schema_name = tenant.get_schema_name()
-                model_name = self.get_lowest_scope()
+                counter = f"{self.get_lowest_scope()}_user"
 
-                sequence_name = f"{schema_name}.{model_name}_user_local_id"
+                using = kwargs.get("using") or router.db_for_write(BaseUser, instance=self)
+                self.local_id = get_local_id_allocator().allocate(tenant.get_schema_name(), counter, 1, using)[0]
 
-                with connection.cursor() as cursor:
-                    cursor.execute(f"SELECT nextval('{sequence_name}')")
-                    self.local_id = cursor.fetchone()[0]
+        if self.pk and not self._state.adding and not skip_scope_validation:
+            self._check_changed_fields(kwargs)
 
-        if self.pk and not skip_scope_validation:
+        super().save(*args, **kwargs)
 
-            if not self.is_admin() or not self.is_superuser:
-                scope_fields = ["tenant_scope", "organization_scope", "department_scope", "customer_scope", "role"]
+        if getattr(self, "_token_version_changed", False):
+            # cache must not hold a version that a rolled back transaction never stored
+            transaction.on_commit(
+                lambda pk=self.pk, version=self.token_version: set_token_version(pk, version), using=self._state.db,
+            )
+            self._token_version_changed = False
+        self._take_snapshot(kwargs.get("update_fields"))
 
-                old_instance = BaseUser.objects.get(pk=self.pk)
+        if initial_setup:
+            # assigning roles, happens after creating id (necessary for many to many fields)
+            self._assign_role_permissions()
 
-                for field in scope_fields:
-                    if getattr(old_instance, field) != getattr(self, field):
-                        raise ValidationError(
-                            {
-                                field: f"You cannot change your {field.replace('_', ' ')}.",
-                             }
-                        )
 
-                if old_instance.role != self.role:
-                    self._reset_role_permissions(role_manager)
+class ScopedTokenUser(ScopedUserMixin, TokenUser):
+    """
+    Stateless user backed by scope claims of an access token (see TOKEN_CLAIM_FIELDS).
+    Role and scope checks are answered from claims, BaseUser row is fetched only when a view
+    accesses `user` or one of the scope relations.
+    """
 
-        super().save(*args, **kwargs)
+    def __str__(self):
+        return self.username
 
-        if initial_setup:
-            # assigning roles, happens after creating id (necessary for many to many fields)
-            self._assign_role_permissions(role_manager)
+    @cached_property
+    def role(self):
+        return self.token["role"]
+
+    @cached_property
+    def local_id(self):
+        return self.token.get("local_id")
+
+    @cached_property
+    def tenant_scope_id(self):
+        return self.token.get("tenant_scope_id")
+
+    @cached_property
+    def organization_scope_id(self):
+        return self.token.get("organization_scope_id")
+
+    @cached_property
+    def department_scope_id(self):
+        return self.token.get("department_scope_id")
+
+    @cached_property
+    def customer_scope_id(self):
+        return self.token.get("customer_scope_id")
+
+    @cached_property
+    def is_deleted(self):
+        return self.token.get("is_deleted", False)
+
+    @cached_property
+    def token_version(self):
+        return self.token.get("token_version")
+
+    @cached_property
+    def user(self):
+        return BaseUser.objects.using(get_user_db_alias(self.tenant_scope_id)).get(pk=self.id)
+
+    @property
+    def tenant_scope(self):
+        return self.user.tenant_scope if self.tenant_scope_id else None
+
+    @property
+    def organization_scope(self):
+        return self.user.organization_scope if self.organization_scope_id else None
+
+    @property
+    def department_scope(self):
+        return self.user.department_scope if self.department_scope_id else None
 
+    @property
+    def customer_scope(self):
+        return self.user.customer_scope if self.customer_scope_id else None
 
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
 
 
+def get_token_claims(user):
+    claims = {field: getattr(user, field) for field in TOKEN_CLAIM_FIELDS}
+    claims["token_version"] = user.token_version
+    return claims
@@ -0,0 +1,99 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import router, transaction
+
+from tenants.local_ids import get_local_id_allocator
+from user_management.models import BaseUser, get_permission_ids, writes_role_permission_rows
+from user_management.utils import ROLE_PERMISSIONS_MANAGER, get_scope_role
+
+
+def get_provisioning_setting(name):
+    defaults = {"HASH_PROCESSES": None, "POOL_MIN_SIZE": 32, "BATCH_SIZE": 1000}
+    return getattr(settings, "USER_PROVISIONING", {}).get(name, defaults[name])
+
+
+def _setup_hasher_process():
+    # spawned processes (non fork start methods) don't inherit configured django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+    django.setup()
+
+
+def hash_passwords(passwords, processes=None):
+    """
+    Hashes of the passwords (in the same order), computed by a pool of processes, hashing is CPU bound and holds the GIL.
+    Lists shorter than POOL_MIN_SIZE are hashed in this process, starting the pool would take longer
+    """
+    passwords = list(passwords)
+    if processes is None:
+        processes = get_provisioning_setting("HASH_PROCESSES") or os.cpu_count() or 1
+    if processes < 2 or len(passwords) < get_provisioning_setting("POOL_MIN_SIZE"):
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_setup_hasher_process) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def provision_users(items, batch_size=None, processes=None, hashed=False):
+    """
+    Creates scoped users at once: passwords are hashed in a process pool (see hash_passwords), local_ids are allocated
+    with one query per tenant and counter, users are inserted with bulk_create and their role permissions
+    with one bulk_create of user_permissions rows (none in "virtual" ROLE_PERMISSIONS_MODE).
+    items: [{"username", "password", "tenant_scope", "organization_scope", "department_scope", "customer_scope", ...}],
+    scopes as objects or <scope>_id values, tenant_scope has to be an object (it selects the shard).
+    With hashed=True passwords of the items are already hashed (generated data sharing one hash).
+    bulk_create doesn't call BaseUser.save(), scopes are expected to be validated (see BulkProvisionListSerializer)
+    """
+    batch_size = batch_size or get_provisioning_setting("BATCH_SIZE")
+    items = [dict(item) for item in items]
+    passwords = [item.pop("password") for item in items]
+    if not hashed:
+        passwords = hash_passwords(passwords, processes)
+
+    users_by_alias = defaultdict(list)
+    for item, password in zip(items, passwords):
+        scopes = {field: item.get(field, item.get(f"{field}_id")) for field in ("tenant_scope", "organization_scope", "department_scope", "customer_scope")}
+        user = BaseUser(role=get_scope_role(**scopes), password=password, **item)
+        users_by_alias[router.db_for_write(BaseUser, instance=user)].append(user)
+
+    created = []
+    for using, users in users_by_alias.items():
+        _allocate_user_local_ids(users, using)
+        with transaction.atomic(using=using):
+            created.extend(BaseUser.objects.using(using).bulk_create(users, batch_size=batch_size))
+            if writes_role_permission_rows():
+                _bulk_assign_role_permissions(users, using, batch_size)
+    return created
+
+
+def _allocate_user_local_ids(users, using):
+    # users of every scope level have their own counter (see BaseUser.save)
+    pending = defaultdict(list)
+    for user in users:
+        if user.local_id is None and user.tenant_scope_id:
+            pending[(user.tenant_scope, f"{user.get_lowest_scope()}_user")].append(user)
+
+    for (tenant, counter), group in pending.items():
+        local_ids = get_local_id_allocator().allocate(tenant.get_schema_name(), counter, len(group), using)
+        for user, local_id in zip(group, local_ids):
+            user.local_id = local_id
+
+
+def _bulk_assign_role_permissions(users, using, batch_size):
+    roles = {user.role for user in users}
+    permissions = set().union(*(ROLE_PERMISSIONS_MANAGER.get_role_permissions(role) for role in roles))
+    permission_ids = get_permission_ids(permissions, using)
+
+    through = BaseUser.user_permissions.through
+    rows = [
+        through(baseuser_id=user.pk, permission_id=permission_ids[permission])
+        for user in users
+        for permission in ROLE_PERMISSIONS_MANAGER.get_role_permissions(user.role)
+        if permission in permission_ids
+    ]
+    through.objects.using(using).bulk_create(rows, batch_size=batch_size)
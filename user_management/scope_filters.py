@@ -0,0 +1,117 @@
+from functools import lru_cache
+
+from user_management.utils import Role
+
+
+# Scope filters of each model and role: lookup -> attribute of the user holding the value (raw *_id attributes,
+# so applying a filter never fetches related objects). Roles missing here can't access any instance of the model.
+SCOPE_FILTER_RULES = {
+    "tenant": {
+        Role.ROLE_TENANT_USER: {
+            "id": "tenant_scope_id",
+        },
+    },
+    "organization": {
+        Role.ROLE_TENANT_USER: {
+            "tenant": "tenant_scope_id",
+        },
+        Role.ROLE_ORG_USER: {
+            "id": "organization_scope_id",
+            "tenant": "tenant_scope_id",
+        },
+    },
+    # departments and customers keep tenant_id (and organization_id) of their ancestry, so filters use their own columns
+    "department": {
+        Role.ROLE_TENANT_USER: {
+            "tenant": "tenant_scope_id",
+        },
+        Role.ROLE_ORG_USER: {
+            "organization": "organization_scope_id",
+            "tenant": "tenant_scope_id",
+        },
+        Role.ROLE_DEPT_USER: {
+            "id": "department_scope_id",
+            "organization": "organization_scope_id",
+            "tenant": "tenant_scope_id",
+        },
+    },
+    "customer": {
+        Role.ROLE_TENANT_USER: {
+            "tenant": "tenant_scope_id",
+        },
+        Role.ROLE_ORG_USER: {
+            "organization": "organization_scope_id",
+            "tenant": "tenant_scope_id",
+        },
+        Role.ROLE_DEPT_USER: {
+            "department": "department_scope_id",
+            "organization": "organization_scope_id",
+            "tenant": "tenant_scope_id",
+        },
+        Role.ROLE_CUSTOMER_USER: {
+            "id": "customer_scope_id",
+            "department": "department_scope_id",
+            "organization": "organization_scope_id",
+            "tenant": "tenant_scope_id",
+        },
+    },
+    "baseuser": {
+        Role.ROLE_TENANT_USER: {
+            "tenant_scope": "tenant_scope_id",
+        },
+        Role.ROLE_ORG_USER: {
+            "organization_scope": "organization_scope_id",
+            "tenant_scope": "tenant_scope_id",
+        },
+        Role.ROLE_DEPT_USER: {
+            "department_scope": "department_scope_id",
+            "organization_scope": "organization_scope_id",
+            "tenant_scope": "tenant_scope_id",
+        },
+        Role.ROLE_CUSTOMER_USER: {
+            "customer_scope": "customer_scope_id",
+            "department_scope": "department_scope_id",
+            "organization_scope": "organization_scope_id",
+            "tenant_scope": "tenant_scope_id",
+        },
+    },
+}
+
+# Parents read by serializers aren't loaded here, views annotate their local_ids (BaseScopedSerializer.annotate_queryset)
+
+
+class ScopeFilterPlan:
+    """
+    Filter of one (model, role) pair, compiled once and applied to any user of that role
+    """
+    __slots__ = ("model", "lookups", "required_attributes", "base_queryset")
+
+    def __init__(self, model, lookups, required_attributes):
+        self.model = model
+        # ((lookup, user attribute), ...)
+        self.lookups = lookups
+        # user without these scopes can't access anything
+        self.required_attributes = required_attributes
+        # never evaluated, every apply() clones it once
+        self.base_queryset = model.objects.all()
+
+    def apply(self, user):
+        for attribute in self.required_attributes:
+            if not getattr(user, attribute):
+                return self.model.objects.none()
+
+        filters = {lookup: getattr(user, attribute) for lookup, attribute in self.lookups}
+        return self.base_queryset.filter(**filters, is_deleted=False)
+
+
+@lru_cache(maxsize=None)
+def get_scope_filter_plan(model, role):
+    """
+    Returns ScopeFilterPlan of the model and role, None when the role can't access the model
+    """
+    role_filters = SCOPE_FILTER_RULES.get(model._meta.model_name, {}).get(role)
+    if not role_filters:
+        return None
+
+    required_attributes = ("customer_scope_id",) if role == Role.ROLE_CUSTOMER_USER else ()
+    return ScopeFilterPlan(model, tuple(role_filters.items()), required_attributes)
@@ -1,9 +1,20 @@
+from collections import Counter
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
 from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueValidator
+
+from tenants.models import Tenant
+from tenants.serializers import ScopedParentField
+from .provisioning import provision_users
 from .utils import Role, TENANT_DEPENDANT_ROLES
 
 
+SCOPE_FIELDS = ("tenant_scope", "organization_scope", "department_scope", "customer_scope")
+
+
 class BaseUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
@@ -60,3 +71,98 @@ class BaseUserSerializer(serializers.ModelSerializer):
         return data
 
 
+
+
+class BulkProvisionListSerializer(serializers.ListSerializer):
+    """
+    Creates the whole list with provision_users().
+    Scopes of all items are fetched with one query per scope type and usernames are checked with one query per database,
+    instead of the queries per item done by related and unique validators of the child serializer
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if "data" in kwargs:
+            for field in self.child.fields.values():
+                field.validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.context["bulk_parents"] = self.child.resolve_bulk_scopes(data)
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        usernames = Counter(item["username"] for item in attrs)
+        duplicates = sorted(username for username, count in usernames.items() if count > 1)
+        if duplicates:
+            raise ValidationError(f"Usernames must be unique, duplicated: {', '.join(duplicates)}.")
+
+        # users live on shards of their tenants, admins in default database (they sign in on every domain)
+        aliases = {DEFAULT_DB_ALIAS} | {item["tenant_scope"].db_alias for item in attrs}
+        existing = sorted(
+            username
+            for alias in aliases
+            for username in get_user_model().objects.using(alias).filter(username__in=usernames).values_list("username", flat=True)
+        )
+        if existing:
+            raise ValidationError(f"Usernames already exist: {', '.join(existing)}.")
+        return attrs
+
+    def create(self, validated_data):
+        return provision_users(
+            validated_data, batch_size=self.context.get("bulk_create_batch_size"), processes=self.context.get("hash_processes"),
+        )
+
+
+class ProvisionUserSerializer(serializers.ModelSerializer):
+    """
+    Scoped user created by bulk provisioning, role is given by the lowest scope and scopes above it are copied from its ancestry
+    """
+    serializer_related_field = ScopedParentField
+    password = serializers.CharField(write_only=True, trim_whitespace=False)
+
+    class Meta:
+        model = get_user_model()
+        fields = ['id', 'local_id', 'username', 'password', 'role', *SCOPE_FIELDS]
+        read_only_fields = ['id', 'local_id', 'role']
+        list_serializer_class = BulkProvisionListSerializer
+
+    def resolve_bulk_scopes(self, items):
+        """
+        Fetches scopes of all items with one query per scope type, returns {field name: {id: scope}}.
+        Tenants of lower scopes are fetched as well, they select the shard of the user
+        """
+        scopes = {}
+        for field in SCOPE_FIELDS:
+            ids = {
+                item.get(field) for item in items
+                if isinstance(item, dict) and isinstance(item.get(field), int) and not isinstance(item.get(field), bool)
+            }
+            if ids:
+                scopes[field] = self.fields[field].get_queryset().in_bulk(ids)
+
+        tenant_ids = {scope.tenant_id for field in SCOPE_FIELDS[1:] for scope in scopes.get(field, {}).values()}
+        tenant_ids -= set(scopes.get("tenant_scope", {}))
+        if tenant_ids:
+            scopes.setdefault("tenant_scope", {}).update(Tenant.objects.in_bulk(tenant_ids))
+        return scopes
+
+    def validate(self, attrs):
+        lowest = next((attrs[field] for field in reversed(SCOPE_FIELDS) if attrs.get(field) is not None), None)
+        if lowest is None:
+            raise ValidationError({"tenant_scope": "Provisioned users require a scope."})
+
+        for field in SCOPE_FIELDS:
+            parent_model = self.Meta.model._meta.get_field(field).related_model
+            if isinstance(lowest, parent_model):
+                break
+            scope_id = getattr(lowest, f"{parent_model._meta.model_name}_id")
+            if attrs.get(field) is not None and attrs[field].pk != scope_id:
+                raise ValidationError({field: f"{lowest._meta.verbose_name.capitalize()} doesn't belong to this {parent_model._meta.verbose_name}."})
+
+            if field == "tenant_scope":
+                tenants = self.context.get("bulk_parents", {}).get("tenant_scope", {})
+                attrs[field] = tenants.get(scope_id) or Tenant.objects.get(pk=scope_id)
+            elif attrs.get(field) is None:
+                attrs.pop(field, None)
+                attrs[f"{field}_id"] = scope_id
+        return attrs
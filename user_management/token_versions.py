@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from tenants.tenant_cache import get_tenant_cache
+
+
+# Without redis, shared tier lives in each process, so bumps made by other processes are picked up after this timeout
+TOKEN_VERSION_TIMEOUT = 60
+
+# Stored for users that no longer exist, no token can match it
+DELETED_USER_VERSION = -1
+
+
+def _key(user_id):
+    return f"user_management:token_version:{user_id}"
+
+
+def _backend():
+    return get_tenant_cache().shared_backend
+
+
+def get_token_version(user_id, using=None):
+    cached_version = _backend().get(_key(user_id))
+    if cached_version is not None:
+        return int(cached_version)
+
+    version = (
+        get_user_model().objects.using(using).filter(pk=user_id).values_list("token_version", flat=True).first()
+    )
+    if version is None:
+        version = DELETED_USER_VERSION
+    set_token_version(user_id, version)
+    return version
+
+
+def set_token_version(user_id, version):
+    _backend().set(_key(user_id), str(version), TOKEN_VERSION_TIMEOUT)
+
+
+def forget_token_versions(user_ids):
+    _backend().delete_many([_key(user_id) for user_id in user_ids])
+
+
+def invalidate_deleted_user(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda pk=instance.pk: set_token_version(pk, DELETED_USER_VERSION), using=using)
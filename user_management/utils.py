@@ -1,3 +1,6 @@
+from functools import cache
+from types import MappingProxyType
+
 from django.db import models
 
 
@@ -11,6 +14,11 @@ class Role(models.IntegerChoices):
 
 
 class RolePermissionsManager:
+    """
+    Permissions of every role (its own and those of roles below it) and roles it can assign,
+    compiled once at import into immutable tables of integer bitmasks: every check is a dict lookup and a bit test.
+    Use the shared ROLE_PERMISSIONS_MANAGER, new instances reuse the same compiled tables
+    """
     BASE_ROLE_HIERARCHY = [
         Role.ROLE_CUSTOMER_USER,
         Role.ROLE_DEPT_USER,
@@ -27,51 +35,92 @@ class RolePermissionsManager:
         Role.ROLE_TENANT_ADMIN: {"tenants.add_tenant", "tenants.change_tenant", "tenants.delete_tenant"},
     }
 
-    def __init__(self):
-        self.ROLE_PERMISSIONS = {}
-        self.ROLE_HIERARCHY = {}
-
-        accumulated_permissions = set()
-        accumulated_roles = set()
-        for role in self.BASE_ROLE_HIERARCHY:
-            accumulated_permissions |= self.BASE_ROLE_PERMISSIONS.get(role, set())
-            self.ROLE_PERMISSIONS[role] = frozenset(accumulated_permissions)
+    # roles bound to a scope, role -> bit (1 << role) set in these masks
+    TENANT_DEPENDANT_MASK = (
+        1 << Role.ROLE_CUSTOMER_USER | 1 << Role.ROLE_DEPT_USER | 1 << Role.ROLE_ORG_USER | 1 << Role.ROLE_TENANT_USER
+    )
+    ORGANIZATION_DEPENDANT_MASK = 1 << Role.ROLE_CUSTOMER_USER | 1 << Role.ROLE_DEPT_USER | 1 << Role.ROLE_ORG_USER
+    DEPARTMENT_DEPENDANT_MASK = 1 << Role.ROLE_CUSTOMER_USER | 1 << Role.ROLE_DEPT_USER
+    CUSTOMER_DEPENDANT_MASK = 1 << Role.ROLE_CUSTOMER_USER
 
-            self.ROLE_HIERARCHY[role] = accumulated_roles
-            accumulated_roles.add(role)
+    def __init__(self):
+        (
+            self.PERMISSION_BITS, self.ROLE_PERMISSION_MASKS, self.ROLE_PERMISSIONS, self.ROLE_HIERARCHY_MASKS, self.ROLE_HIERARCHY,
+        ) = self._compile()
+
+    @classmethod
+    @cache
+    def _compile(cls):
+        """
+        (permission -> bit, role -> mask of its permissions, role -> frozenset of its permissions,
+        role -> mask of roles below it, role -> frozenset of roles below it), all read only
+        """
+        all_permissions = sorted(set().union(*cls.BASE_ROLE_PERMISSIONS.values()))
+        permission_bits = {permission: 1 << index for index, permission in enumerate(all_permissions)}
+
+        permission_masks, permissions, hierarchy_masks, hierarchy = {}, {}, {}, {}
+        accumulated_mask = 0
+        roles_below = []
+        for role in cls.BASE_ROLE_HIERARCHY:
+            for permission in cls.BASE_ROLE_PERMISSIONS.get(role, ()):
+                accumulated_mask |= permission_bits[permission]
+            permission_masks[role] = accumulated_mask
+            permissions[role] = frozenset(permission for permission, bit in permission_bits.items() if accumulated_mask & bit)
+
+            hierarchy[role] = frozenset(roles_below)
+            hierarchy_masks[role] = sum(1 << lower_role for lower_role in roles_below)
+            roles_below.append(role)
+
+        return tuple(MappingProxyType(table) for table in (permission_bits, permission_masks, permissions, hierarchy_masks, hierarchy))
+
+    def has_role_permission(self, role, permission):
+        return bool(self.ROLE_PERMISSION_MASKS.get(role, 0) & self.PERMISSION_BITS.get(permission, 0))
 
     def get_role_permissions(self, role):
-        return self.ROLE_PERMISSIONS.get(role, set())
+        return self.ROLE_PERMISSIONS.get(role, frozenset())
 
     def get_role_hierarchy(self, role):
-        return self.ROLE_HIERARCHY.get(role, set())
+        return self.ROLE_HIERARCHY.get(role, frozenset())
+
+    def can_role_assign(self, role, assigned_role):
+        return _has_role_bit(self.ROLE_HIERARCHY_MASKS.get(role, 0), assigned_role)
 
     def is_role_tenant_dependant(self, role):
-        return role in {
-            Role.ROLE_CUSTOMER_USER,
-            Role.ROLE_DEPT_USER,
-            Role.ROLE_ORG_USER,
-            Role.ROLE_TENANT_USER,
-        }
+        return _has_role_bit(self.TENANT_DEPENDANT_MASK, role)
 
     def is_role_organization_dependant(self, role):
-        return role in {
-            Role.ROLE_CUSTOMER_USER,
-            Role.ROLE_DEPT_USER,
-            Role.ROLE_ORG_USER,
-        }
+        return _has_role_bit(self.ORGANIZATION_DEPENDANT_MASK, role)
 
     def is_role_department_dependant(self, role):
-        return role in {
-            Role.ROLE_CUSTOMER_USER,
-            Role.ROLE_DEPT_USER,
-        }
+        return _has_role_bit(self.DEPARTMENT_DEPENDANT_MASK, role)
 
     def is_role_customer_dependant(self, role):
-        return role in {
-            Role.ROLE_CUSTOMER_USER,
-        }
+        return _has_role_bit(self.CUSTOMER_DEPENDANT_MASK, role)
+
+
+def get_scope_role(is_admin=False, tenant_scope=None, organization_scope=None, department_scope=None, customer_scope=None):
+    """
+    Role of a new user, given by the lowest of its scopes (objects or ids)
+    """
+    if is_admin:
+        return Role.ROLE_TENANT_ADMIN
+    if customer_scope is not None:
+        return Role.ROLE_CUSTOMER_USER
+    if department_scope is not None:
+        return Role.ROLE_DEPT_USER
+    if organization_scope is not None:
+        return Role.ROLE_ORG_USER
+    if tenant_scope is not None:
+        return Role.ROLE_TENANT_USER
+    return Role.ROLE_UNNASIGNED
+
+
+def _has_role_bit(mask, role):
+    # users without role (None) have no bit in any mask
+    return role is not None and bool(mask >> role & 1)
+
 
+ROLE_PERMISSIONS_MANAGER = RolePermissionsManager()
 
 
 ROLE_HIERARCHY = {
@@ -1,11 +1,14 @@
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .serializers import BaseUserSerializer
+from tenants.custom_viewsets import StreamingExportMixin
+from tenants.pagination import ScopedCursorPagination
+from .serializers import BaseUserSerializer, ProvisionUserSerializer
 from user_management.utils import Role
 
 class ProtectedApiView(APIView):
@@ -14,13 +17,19 @@ class ProtectedApiView(APIView):
     def get(self, request):
         return Response({"message": "This is a protected view!"})
 
-class BaseUserViewSet(viewsets.ModelViewSet):
+class BaseUserViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = BaseUserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ScopedCursorPagination
+    # local_ids of users of different scopes repeat
+    local_id_tie_breaker = ("username",)
+    export_select_related = ("organization_scope", "department_scope", "customer_scope")
+    bulk_create_max_size = 10000
+    bulk_create_batch_size = 1000
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'destroy']:
+        if self.action in ['create', 'update', 'destroy', 'bulk_create']:
             self.permission_classes = [permissions.IsAdminUser]
         return super().get_permissions()
 
@@ -30,7 +39,8 @@ class BaseUserViewSet(viewsets.ModelViewSet):
         if user.is_admin():
             return get_user_model().objects.all()
         else:
-            return user.get_limited_queryset(get_user_model())
+            # BaseUserSerializer shows local_ids of scopes to scoped users, loaded with the users instead of per row
+            return user.get_limited_queryset(get_user_model()).select_related("organization_scope", "department_scope", "customer_scope")
 
     def create(self, request, *args, **kwargs):
         if request.user.role not in [Role.ROLE_TENANT_ADMIN]:
@@ -38,6 +48,22 @@ class BaseUserViewSet(viewsets.ModelViewSet):
 
         return super().create(request, *args, **kwargs)
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        POST /api/users/bulk/ provisions a list of scoped users at once (see provisioning.provision_users)
+        """
+        if request.user.role not in [Role.ROLE_TENANT_ADMIN]:
+            raise PermissionDenied("You don't have permission to create users.")
+
+        context = {**self.get_serializer_context(), "bulk_create_batch_size": self.bulk_create_batch_size}
+        serializer = ProvisionUserSerializer(
+            data=request.data, many=True, allow_empty=False, max_length=self.bulk_create_max_size, context=context,
+        )
+        serializer.is_valid(raise_exception=True)
+        users = serializer.save()
+        return Response(self.get_serializer(users, many=True).data, status=status.HTTP_201_CREATED)
+
     def perform_update(self, serializer):
         user = serializer.instance
         if user.is_superuser: